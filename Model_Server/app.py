@@ -1,197 +1,627 @@
-from fastapi import FastAPI, File, UploadFile
-from typing import List
+from fastapi import FastAPI, File, Form, HTTPException, UploadFile, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from typing import List, Optional
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import base64
+import copy
+import json
+import logging
 import os
+import uuid
+import cv2
+import threading
+import time
 import uvicorn
 import numpy as np
-import cv2
-import io
-from PIL import Image
-from ultralytics import YOLO
 
 
-from solid_line_detection import detect_solid_line_violation, _pending_violations as _pending_solid_violations
-from bus_lane_detection import detect_bus_line_violation, _pending_violations as _pending_bus_violations
-from red_light_detection import detect_red_light_violation, _pending_violations as _pending_red_violations, approaching_vehicles
+from rule_engine import run_rules, RULES
+from tracking import create_tracker, track_vehicles
+from model_pool import ModelPool
+from inference_processes import ProcessModelPool, INFERENCE_PROCESSES
+from inference_backend import load_yolo
+from batching import MicroBatcher
+from decoding import decode_frames, ArrayFrame, FullResolutionFrames, JPEG_DECODE_REDUCTION, DETECTION_MAX_SIDE, fit_max_side
+from detection_store import BatchDetectionsBuilder
+from sessions import SessionStore, DEFAULT_SESSION_ID
+from streaming import RollingFrameWindow, STREAM_WINDOW_FRAMES
+from video_ingest import spool_upload_to_disk, VideoFrameSampler, VIDEO_FRAME_STRIDE, VIDEO_BATCH_FRAMES
+from utils import simplify_polygon
+from result_cache import LRUCache, frame_digest, batch_keys, RESULT_CACHE_BATCHES, RESULT_CACHE_FRAMES
+from metrics import REGISTRY, Gauge, STAGE_SECONDS, REQUEST_SECONDS, CONTENT_TYPE
+from logging_config import configure_logging, get_logger, log_context, current_log_context
+from recording import BatchRecorder, RECORD_DIR
 
 app = FastAPI()
-
-# Our YOLO-Segmentation model.
-# Two separate instances sharing the same weights: one exclusively for .predict() (all classes
-# + masks), one exclusively for .track() (vehicles with stable IDs). Ultralytics binds state
-# (predictor, tracker, class filter, result tensors) to a single predictor object, so mixing
-# predict+track on one instance corrupts detections. Two instances = full isolation.
-model = YOLO('traffic_model.pt')          # .predict() only — all classes, masks intact
-tracker_model = YOLO('traffic_model.pt')  # .track() only — vehicles with stable IDs
-lpr_model = YOLO('lpr_model.pt')          # Initialize YOLO model for license plate recognition
+# PV_LOG_LEVEL / PV_LOG_FORMAT, see logging_config.py. Per-vehicle rule output is DEBUG only.
+configure_logging()
+logger = get_logger("app")
 
 #------CONFIGURATION-------
-POLYGON_CLASS_NAMES = {"solid_line", "bus line", "stop_line"}
+# Single-pass mode: one predict() forward pass feeds both the all-class detections and a
+# standalone ByteTrack instance updated with the vehicle boxes only. Set PV_SINGLE_PASS=0
+# to fall back to the legacy two-instance predict() + track() path.
+SINGLE_PASS_INFERENCE = os.getenv("PV_SINGLE_PASS", "1") != "0"
+
+# Inference and rule evaluation run on a dedicated thread pool so the event loop stays free
+# for health pings and other phones' uploads. Each worker checks out its own model bundle.
+# With PV_INFERENCE_PROCESSES > 0 the bundles live in worker processes (see inference_processes.py)
+# and these threads only decode, track and run the rules; by default there is one per process.
+INFERENCE_WORKERS = int(os.getenv("PV_INFERENCE_WORKERS", str(max(1, INFERENCE_PROCESSES))))
+# How many admitted requests may wait for a free worker. Anything beyond is rejected at once.
+INFERENCE_QUEUE_SIZE = int(os.getenv("PV_INFERENCE_QUEUE_SIZE", "4"))
+# A waiting request that gets no worker within this many seconds receives a "busy" response.
+QUEUE_TIMEOUT_SECONDS = float(os.getenv("PV_QUEUE_TIMEOUT_SECONDS", "2.0"))
+# Merge predict() calls of concurrent requests into larger batches (see batching.py).
+# Only pays off with more than one inference worker.
+MICRO_BATCHING = os.getenv("PV_MICRO_BATCHING", "0") == "1"
+
+# Our YOLO-Segmentation model (+ LPR model), one bundle per inference worker.
+# Ultralytics binds state (predictor, tracker, class filter, result tensors) to a single
+# predictor object, so mixing predict+track on one instance corrupts detections. In single-pass
+# mode the tracker never touches the predictor, so one instance is enough. In legacy mode a
+# second instance sharing the same weights is used exclusively for .track().
+# Only the line classes are turned from masks into polygons; every other class is used as a box.
+POLYGON_CLASS_NAMES = {"solid_line", "bus line", "stop_line", "dashed_line"}
+if INFERENCE_PROCESSES > 0:
+    model_pool = ProcessModelPool(INFERENCE_PROCESSES, POLYGON_CLASS_NAMES)
+else:
+    model_pool = ModelPool(INFERENCE_WORKERS)
+class_names = model_pool.bundles[0].model.names
+tracker_model = None if SINGLE_PASS_INFERENCE else load_yolo('traffic_model.pt', task="segment")  # legacy .track() only
+micro_batcher = MicroBatcher(model_pool) if MICRO_BATCHING else None
+# PV_RECORD_DIR: save every batch's detections + violations for offline replay (see recording.py).
+recorder = BatchRecorder(RECORD_DIR) if RECORD_DIR else None
+
+# One session per phone: each owns its detector state and, in single-pass mode, its own
+# ByteTrack instance fed from predict() output. The legacy track() path keeps a single
+# tracker bound to tracker_model, so its track IDs are shared by every session.
+sessions = SessionStore(tracker_factory=create_tracker if SINGLE_PASS_INFERENCE else None)
+
+inference_executor = ThreadPoolExecutor(max_workers=INFERENCE_WORKERS, thread_name_prefix="inference")
+_worker_slots = asyncio.Semaphore(INFERENCE_WORKERS)
+_admitted_requests = 0  # running + waiting; only touched from the event loop
+_waiting_requests = 0   # admitted and waiting for a worker; only touched from the event loop
+# Retried uploads (see result_cache.py): responses per batch idempotency key, and predict()
+# results per frame content hash. _inflight_batches holds the keys being processed right now.
+batch_results = LRUCache(RESULT_CACHE_BATCHES)
+frame_results = LRUCache(RESULT_CACHE_FRAMES)
+_inflight_batches = {}  # batch keys -> asyncio.Event set when it's done; only touched from the event loop
+# Tracking and rule evaluation are serialized per session (see Session.lock). The legacy
+# tracker_model is shared by all sessions, so its track() calls need a lock of their own.
+_legacy_track_lock = threading.Lock()
+
+# Cap on the points kept per line polygon before it reaches the rules (0 = keep every contour point).
+POLYGON_MAX_POINTS = int(os.getenv("PV_POLYGON_MAX_POINTS", "0"))
 BOX_CLASS_NAMES = {"car", "bus", "truck", "traffic_light_red", "traffic_light_green", "taxi_hat", "license_plate"}
 # Only these classes go through the tracker (stable IDs for de-duplicating violations & flagging taxis).
 # Everything else runs through plain predict() so the tracker doesn't drop low-confidence small objects
 # (e.g. license plates) on the first frame of each batch.
 VEHICLE_CLASS_NAMES = {"car", "bus", "truck"}
-vehicle_class_ids = [cid for cid, cname in model.names.items() if cname in VEHICLE_CLASS_NAMES]
+vehicle_class_ids = [cid for cid, cname in class_names.items() if cname in VEHICLE_CLASS_NAMES]
+polygon_class_ids = [cid for cid, cname in class_names.items() if cname in POLYGON_CLASS_NAMES]
+# vehicles are left out here: they come from the tracker, with stable IDs
+box_class_ids = [cid for cid, cname in class_names.items() if cname in BOX_CLASS_NAMES - VEHICLE_CLASS_NAMES]
+
+#------------METRICS--------------------
+# Gauges are read from the live state on every scrape of /metrics (see metrics.py).
+def _sum_over_sessions(size_of):
+    return {(rule.name,): sum(size_of(getattr(session, rule.state_attr)) for session in sessions.snapshot()) for rule in RULES}
+
+
+REGISTRY.register(Gauge("patrolvision_queue_depth", "Admitted requests waiting for an inference worker.",
+                        lambda: _waiting_requests))
+REGISTRY.register(Gauge("patrolvision_admitted_requests", "Requests running or waiting for an inference worker.",
+                        lambda: _admitted_requests))
+REGISTRY.register(Gauge("patrolvision_active_sessions", "Live per-device sessions.", lambda: len(sessions)))
+if micro_batcher is not None:
+    REGISTRY.register(Gauge("patrolvision_micro_batch_queue_depth", "predict() calls waiting to be merged into a micro-batch.",
+                            micro_batcher.pending))
+REGISTRY.register(Gauge("patrolvision_red_light_approachers", "Vehicles remembered approaching a red light, across sessions.",
+                        lambda: sum(len(s.red_light.approaching_vehicles) for s in sessions.snapshot())))
+REGISTRY.register(Gauge("patrolvision_dedup_track_entries", "Reported track IDs kept for de-duplication.",
+                        lambda: _sum_over_sessions(lambda state: len(state.reported_violators)), ["rule"]))
+REGISTRY.register(Gauge("patrolvision_dedup_plate_entries", "Reported license plates kept for de-duplication.",
+                        lambda: _sum_over_sessions(lambda state: len(state.reported_plates)), ["rule"]))
 
 #------------WARMUP--------------------
 @app.on_event("startup")
 async def startup_event():
-    print("🚀 WARMING UP MODELS: Sending warmup frames to compile PyTorch graphs...")
+    logger.info("🚀 WARMING UP MODELS: Sending warmup frames to compile PyTorch graphs...")
     try:
 
-        warmup_frame = np.zeros((1080, 1920, 3), dtype=np.uint8)
-
-        model.predict([warmup_frame], conf=0.25, classes=None)
-        tracker_model.track([warmup_frame], persist=True, tracker="bytetrack.yaml", conf=0.25, classes=vehicle_class_ids)
-
-
+        warmup_frame = fit_max_side(np.zeros((1080, 1920, 3), dtype=np.uint8), DETECTION_MAX_SIDE)
         warmup_frame_lpr = np.zeros((224, 640, 3), dtype=np.uint8)
-        lpr_model.predict([warmup_frame_lpr])
 
-        print("✅ WARMUP COMPLETE: Both models are hot and ready for the app!")
+        for bundle in model_pool.bundles:
+            bundle.model.predict([warmup_frame], conf=0.25, classes=None, verbose=False)
+            bundle.lpr_model.predict([warmup_frame_lpr], verbose=False)
+        if not SINGLE_PASS_INFERENCE:
+            tracker_model.track([warmup_frame], persist=True, tracker="bytetrack.yaml", conf=0.25,
+                                classes=vehicle_class_ids, verbose=False)
+
+        logger.info("✅ WARMUP COMPLETE: Both models are hot and ready for the app!")
     except Exception as e:
-        print(f"⚠️ WARMUP FAILED: {e}")
+        logger.warning("⚠️ WARMUP FAILED: %s", e)
 
 
 @app.get("/")
 async def root():
-    print("🟢 Someone pinged the root URL!")
+    logger.debug("🟢 Someone pinged the root URL!")
     return {"status": "PatrolVision API is running successfully!"}
+
+@app.get("/metrics")
+async def metrics():
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+async def _acquire_worker_slot(timeout=None):
+    # Counted as waiting until a worker is free (queue depth on /metrics).
+    global _waiting_requests
+    _waiting_requests += 1
+    try:
+        await asyncio.wait_for(_worker_slots.acquire(), timeout=timeout)
+    finally:
+        _waiting_requests -= 1
+
+
+def _busy_response(reason):
+    logger.warning("🚧 BUSY: %s", reason)
+    return JSONResponse(
+        status_code=503,
+        content={"violation": False, "violations": [], "busy": True, "detail": reason},
+        headers={"Retry-After": "1"},
+    )
+
+
 @app.post("/analyze_batch")
-async def analyze_sequence(files: List[UploadFile] = File(...)):
-    print(f"🔥 CONNECTION RECEIVED! Got batch of {len(files)} frames from phone.")
-    frames = []
-    
-    # read each uploaded file and convert to OpenCV format
-    for file in files:
-        contents = await file.read()
-        img = Image.open(io.BytesIO(contents)).convert("RGB")
-        frame = np.array(img)
-        frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
-        frames.append(frame)
-    print(f"📏 RAW FRAME RECEIVED FROM APP: {frames[0].shape[1]}x{frames[0].shape[0]} pixels")
-
-    # Two inference passes:
-    #   - predict() returns EVERY detection (plates/lines/lights/taxi_hat) — tracker can't silently drop them
-    #   - track() runs ONLY on vehicles with stable IDs for violation de-duplication & taxi memory
-    print("⏳ Running YOLO predict (all classes)...")
-    predict_results = model.predict(frames, conf=0.25)
-    print("⏳ Running YOLO track (vehicles only)...")
-    track_results = tracker_model.track(frames, persist=True, tracker="bytetrack.yaml", conf=0.25, classes=vehicle_class_ids)
-
-    batch_analysis = []
-    image_height = frames[0].shape[0] if frames else 512
-
-    # analyze each frame: merge non-vehicle detections (from predict) with tracked vehicles (from track)
-    for i in range(len(frames)):
-        frame_data = {
-            "frame_index": i,
-            "detections": []
-        }
+async def analyze_sequence(
+    files: List[UploadFile] = File(...),
+    session_id: str = Form(DEFAULT_SESSION_ID),
+    batch_id: Optional[str] = Form(None),
+):
+    # batch_id is the client's idempotency key: a retried batch sends the same one and gets the
+    # first response back. Identical frame bytes in the same session count as a replay too.
+    global _admitted_requests
+    started = time.perf_counter()
+    logger.info("🔥 CONNECTION RECEIVED! Got batch of %d frames from phone.", len(files), extra={"session": session_id, "batch": batch_id})
+
+    # Bounded queue: INFERENCE_WORKERS running + INFERENCE_QUEUE_SIZE waiting, no more.
+    if _admitted_requests >= INFERENCE_WORKERS + INFERENCE_QUEUE_SIZE:
+        return _busy_response("inference queue is full")
+
+    _admitted_requests += 1
+    try:
+        with STAGE_SECONDS.time("upload_read"):
+            uploads = [await file.read() for file in files]
+        digests = [frame_digest(data) for data in uploads]
+        keys = batch_keys(session_id, digests, batch_id)
+        # A retry can arrive while the original is still being processed: wait for it.
+        while (inflight := next((_inflight_batches[key] for key in keys if key in _inflight_batches), None)) is not None:
+            await inflight.wait()
+        cached = next((result for result in map(batch_results.get, keys) if result is not None), None)
+        if cached is not None:
+            logger.info("♻️ Replayed batch: returning the stored result, state untouched.", extra={"session": session_id, "batch": batch_id})
+            return cached
+
+        done = asyncio.Event()
+        for key in keys:
+            _inflight_batches[key] = done
+        try:
+            try:
+                await _acquire_worker_slot(QUEUE_TIMEOUT_SECONDS)
+            except asyncio.TimeoutError:
+                return _busy_response(f"no inference worker free within {QUEUE_TIMEOUT_SECONDS}s")
+            try:
+                loop = asyncio.get_running_loop()
+                response = await loop.run_in_executor(inference_executor, _process_batch, uploads, session_id, digests, batch_id)
+            finally:
+                _worker_slots.release()
+            for key in keys:
+                batch_results.put(key, response)
+            return response
+        finally:
+            for key in keys:
+                _inflight_batches.pop(key)
+            done.set()
+    finally:
+        _admitted_requests -= 1
+        REQUEST_SECONDS.observe(time.perf_counter() - started, "analyze_batch")
+
+
+@app.post("/analyze_video")
+async def analyze_video(
+    file: UploadFile = File(...),
+    session_id: Optional[str] = Form(None),
+    frame_stride: int = Form(VIDEO_FRAME_STRIDE),
+    batch_frames: int = Form(VIDEO_BATCH_FRAMES),
+    include_evidence: bool = Form(True),
+):
+    # Streams newline-delimited JSON events back while the video is being analyzed:
+    #   {"event": "violation", ...violation, "video_frame", "video_time", "evidence_jpeg"}
+    #   {"event": "progress", "frames_analyzed", "video_frame"}   (after every window)
+    #   {"event": "done", "session_id", "frames_analyzed", "violations"}
+    session_id = session_id or f"video-{uuid.uuid4().hex[:12]}"
+    logger.info("🎞️ VIDEO RECEIVED: '%s' (stride %d, window %d)", file.filename, frame_stride, batch_frames, extra={"session": session_id})
+    if _admitted_requests >= INFERENCE_WORKERS + INFERENCE_QUEUE_SIZE:
+        return _busy_response("inference queue is full")
+
+    loop = asyncio.get_running_loop()
+    suffix = os.path.splitext(file.filename or "")[1] or ".mp4"
+    path = await loop.run_in_executor(None, spool_upload_to_disk, file.file, suffix)
+    try:
+        sampler = VideoFrameSampler(path, frame_stride)
+    except ValueError as e:
+        os.remove(path)
+        return JSONResponse(status_code=400, content={"detail": str(e)})
+
+    events = _stream_video_events(sampler, path, session_id, max(1, batch_frames), include_evidence)
+    return StreamingResponse(events, media_type="application/x-ndjson")
+
+
+async def _stream_video_events(sampler, path, session_id, batch_frames, include_evidence):
+    global _admitted_requests
+    _admitted_requests += 1
+    loop = asyncio.get_running_loop()
+    frames_analyzed = 0
+    violation_count = 0
+    job = None  # the executor job being awaited (decode or inference); it outlives a disconnect
+    try:
+        while True:
+            # Decode the next window off the event loop; only one window is in memory at a time.
+            with STAGE_SECONDS.time("decode"):
+                job = loop.run_in_executor(None, sampler.read_batch, batch_frames)
+                batch = await asyncio.shield(job)
+            if not batch:
+                break
+            # A video is one long job: it waits for a worker per window instead of timing out,
+            # and gives the worker back in between so phones' batches can interleave.
+            await _acquire_worker_slot()
+            with REQUEST_SECONDS.time("video_window"):
+                job = _start_on_worker(loop, _analyze_video_window, batch, session_id, sampler.fps, include_evidence)
+                violations = await asyncio.shield(job)
+            frames_analyzed += len(batch)
+            for violation in violations:
+                violation_count += 1
+                yield json.dumps({"event": "violation", **violation}) + "\n"
+            yield json.dumps({"event": "progress", "frames_analyzed": frames_analyzed, "video_frame": batch[-1][0]}) + "\n"
+
+        logger.info("🎞️ VIDEO DONE: %d frames analyzed, %d violation(s)", frames_analyzed, violation_count, extra={"session": session_id})
+        yield json.dumps({
+            "event": "done", "session_id": session_id,
+            "frames_analyzed": frames_analyzed, "violations": violation_count,
+        }) + "\n"
+    finally:
+        def finish(_=None):
+            global _admitted_requests
+            sampler.close()
+            os.remove(path)
+            _admitted_requests -= 1
+
+        if job is not None and not job.done():
+            # The client left mid-window: the sampler and the file stay until that job is done.
+            job.add_done_callback(_log_orphaned_job)
+            job.add_done_callback(finish)
+        else:
+            finish()
+
+
+def _analyze_video_window(batch, session_id, fps, include_evidence):
+    # Runs on an inference worker thread. batch is a list of (video frame number, BGR image).
+    decoded = [ArrayFrame(image, JPEG_DECODE_REDUCTION) for _, image in batch]
+    with sessions.acquire(session_id) as session, \
+            log_context(session=session_id, batch=f"video:{batch[0][0]}-{batch[-1][0]}"):
+        violations = _detect_violations(decoded, session)
+    for violation in violations:
+        # last_violation_frame indexes this window; the phone needs a position in the video.
+        window_idx = violation["last_violation_frame"]
+        frame_no = batch[window_idx][0]
+        violation["video_frame"] = frame_no
+        violation["video_time"] = round(frame_no / fps, 3) if fps else None
+        if include_evidence:
+            ok, jpeg = cv2.imencode(".jpg", decoded[window_idx].full)
+            violation["evidence_jpeg"] = base64.b64encode(jpeg.tobytes()).decode("ascii") if ok else None
+    return violations
+
+
+@app.websocket("/ws/analyze")
+async def analyze_stream(websocket: WebSocket, session_id: str = DEFAULT_SESSION_ID):
+    # Persistent live stream: the phone sends each JPEG frame as a binary message, the server
+    # analyzes rolling windows of the newest frames and pushes JSON messages back:
+    #   {"event": "violations", "window_id", "violations": [...each with "frame_seq"]}
+    #   {"event": "status", "window_id", "frame_seqs", "frames_received", "frames_dropped", "processing_ms"}
+    #   {"event": "error", "window_id", "detail"}   (that window was skipped; the stream goes on)
+    # frame_seq is the 0-based arrival number of a frame on this connection.
+    await websocket.accept()
+    logger.info("📡 STREAM OPENED (window %d)", STREAM_WINDOW_FRAMES, extra={"session": session_id})
+    window = RollingFrameWindow(STREAM_WINDOW_FRAMES)
+    processor = asyncio.create_task(_process_stream(websocket, window, session_id))
+    try:
+        while True:
+            # Stop reading as soon as the processing task is gone: nobody would answer these frames.
+            receive = asyncio.ensure_future(websocket.receive())
+            await asyncio.wait((receive, processor), return_when=asyncio.FIRST_COMPLETED)
+            if not receive.done():
+                receive.cancel()
+                await _close_stream(websocket)
+                break
+            message = receive.result()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("bytes"):
+                window.push(message["bytes"])
+    finally:
+        processor.cancel()
+        try:
+            await processor
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            logger.exception("⚠️ Stream processing failed", extra={"session": session_id})
+        logger.info("📡 STREAM CLOSED: %d frames received, %d dropped", window.received, window.dropped, extra={"session": session_id})
+
+
+async def _process_stream(websocket, window, session_id):
+    loop = asyncio.get_running_loop()
+    window_id = 0
+    while True:
+        frames = await window.take()
+        started = loop.time()
+        try:
+            violations = await _run_stream_window(loop, frames, session_id)
+        except Exception as e:
+            # A bad frame (ValueError) or a failed window: tell the phone, keep the stream going.
+            if not isinstance(e, ValueError):
+                logger.exception("⚠️ Stream window %d failed", window_id, extra={"session": session_id})
+            detail = str(e) if isinstance(e, ValueError) else "analysis of this window failed"
+            if not await _send_event(websocket, {"event": "error", "window_id": window_id, "detail": detail}):
+                return
+            window_id += 1
+            continue
 
+        if violations and not await _send_event(websocket, {"event": "violations", "window_id": window_id, "violations": violations}):
+            return
+        if not await _send_event(websocket, {
+            "event": "status", "window_id": window_id,
+            "frame_seqs": [frames[0][0], frames[-1][0]],
+            "frames_received": window.received, "frames_dropped": window.dropped,
+            "processing_ms": round((loop.time() - started) * 1000, 1),
+        }):
+            return
+        REQUEST_SECONDS.observe(loop.time() - started, "stream_window")
+        window_id += 1
+
+
+async def _run_stream_window(loop, frames, session_id):
+    # Waits for a worker instead of answering "busy": frames that pile up meanwhile are dropped
+    # by the rolling window, which is this endpoint's backpressure. The slot is held until the
+    # worker thread is done, even if the connection closes (and this task is cancelled) first.
+    await _acquire_worker_slot()
+    job = _start_on_worker(loop, _analyze_stream_window, frames, session_id)
+    try:
+        return await asyncio.shield(job)
+    except asyncio.CancelledError:
+        job.add_done_callback(_log_orphaned_job)
+        raise
+
+
+def _start_on_worker(loop, fn, *args):
+    # The caller holds a worker slot; it is given back when the job is done, not when the
+    # awaiting request goes away, so the admission bound counts every running job.
+    job = loop.run_in_executor(inference_executor, fn, *args)
+    job.add_done_callback(lambda _: _worker_slots.release())
+    return job
+
+
+def _log_orphaned_job(job):
+    # Nobody awaits a job whose connection is gone: surface its failure here.
+    if not job.cancelled() and job.exception() is not None:
+        logger.warning("⚠️ Job failed after its connection closed: %r", job.exception())
+
+
+async def _close_stream(websocket):
+    # The processing task ended while the phone is still connected: say so instead of going quiet.
+    try:
+        await websocket.close(code=1011)
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+
+
+async def _send_event(websocket, event):
+    # False once the phone is gone: the processing loop then stops.
+    try:
+        await websocket.send_json(event)
+        return True
+    except (WebSocketDisconnect, RuntimeError):
+        return False
+
+
+def _analyze_stream_window(frames, session_id):
+    # Runs on an inference worker thread. frames is a list of (frame_seq, jpeg bytes).
+    with sessions.acquire(session_id) as session, \
+            log_context(session=session_id, batch=f"stream:{frames[0][0]}-{frames[-1][0]}"):
+        with STAGE_SECONDS.time("decode"):
+            decoded = decode_frames([data for _, data in frames])
+        violations = _detect_violations(decoded, session)
+    for violation in violations:
+        # last_violation_frame indexes this window; the phone knows its frames by frame_seq.
+        violation["frame_seq"] = frames[violation["last_violation_frame"]][0]
+    return violations
+
+
+def _process_batch(uploads, session_id, digests=None, batch_id=None):
+    # Runs on an inference worker thread. Model bundles are only checked out while they're in
+    # use, never while waiting on the micro-batcher (which needs a free bundle to make progress).
+    with sessions.acquire(session_id) as session, \
+            log_context(session=session_id, batch=batch_id or uuid.uuid4().hex[:8]):
+        return _analyze_frames(uploads, session, digests)
+
+
+def _analyze_frames(uploads, session, digests=None):
+    # decode every uploaded file to OpenCV format (in parallel, possibly at reduced size)
+    try:
+        with STAGE_SECONDS.time("decode"):
+            decoded = decode_frames(uploads)
+    except ValueError as e:
+        # A file that isn't an image is the phone's mistake, not ours: 400, and nothing is cached.
+        raise HTTPException(status_code=400, detail=str(e))
+    logger.info("📏 RAW FRAME RECEIVED FROM APP: %dx%d pixels (inference at %dx%d)",
+                decoded[0].full_width, decoded[0].full_height, decoded[0].image.shape[1], decoded[0].image.shape[0])
+    return violations_response(_detect_violations(decoded, session, digests))
+
+
+def _detect_violations(decoded, session, digests=None):
+    # Detection + tracking + rules for one window of decoded frames. Returns the violations list.
+    # digests (content hashes of the uploads) let frames seen before reuse their predict() results.
+    frames = [d.image for d in decoded]
+
+    # predict() returns EVERY detection (plates/lines/lights/taxi_hat) — tracker can't silently drop them.
+    # Vehicles get stable IDs for violation de-duplication & taxi memory, either from the same
+    # predict() output (single-pass) or from a second track() pass (legacy).
+    # Predict runs under the session lock: the frame filter compares against the session's
+    # previous frames, so its batches must come in order.
+    with session.lock:
+        track_results, offsets = [], None
+        if SINGLE_PASS_INFERENCE:
+            # ROI crop + near-duplicate skipping; duplicates reuse the last analyzed frame's
+            # detections, which still go through the tracker below.
+            run_frames, roi = session.frame_filter.select(frames)
+            run_keys = None
+            if digests:
+                run_keys = [(digest, roi, frames[0].shape[:2])
+                            for digest, analyzed in zip(digests, session.frame_filter.run_mask) if analyzed]
+            predict_results, offsets = session.frame_filter.assemble(_predict(run_frames, run_keys), roi)
+        else:
+            predict_results = _predict(frames, [(digest, None, frames[0].shape[:2]) for digest in digests] if digests else None)
+            logger.debug("⏳ Running YOLO track (vehicles only)...", extra={"stage": "track"})
+            with _legacy_track_lock, STAGE_SECONDS.time("track"):
+                track_results = tracker_model.track(frames, persist=True, tracker="bytetrack.yaml", conf=0.25, classes=vehicle_class_ids,
+                                                    verbose=logger.isEnabledFor(logging.DEBUG))
+        detections = _build_detections(decoded, predict_results, track_results, session, offsets)
+        if SINGLE_PASS_INFERENCE:
+            session.frame_filter.observe(detections, roi, frames[0].shape)
+
+        # Detection is done: from here on only frames with a plate candidate need pixels (LPR
+        # crops). Everything else is dropped now instead of living until the response is sent.
+        del frames, predict_results, track_results
+        _release_frames_without_plates(decoded, detections)
+
+        with model_pool.acquire() as bundle:
+            return _run_rules(decoded, detections, bundle.lpr_model, session)
+
+
+def _predict(frames, keys=None):
+    # keys: one frame_results key per frame (None = no caching). Only cache misses reach YOLO.
+    results = [frame_results.get(key) for key in keys] if keys else [None] * len(frames)
+    missing = [i for i, result in enumerate(results) if result is None]
+    if len(missing) < len(frames):
+        logger.info("♻️ Reused cached detections for %d/%d frame(s).", len(frames) - len(missing), len(frames), extra={"stage": "predict"})
+    if not missing:
+        return results
+
+    logger.debug("⏳ Running YOLO predict (all classes) on %d frame(s)...", len(missing), extra={"stage": "predict"})
+    missing_frames = [frames[i] for i in missing]
+    if micro_batcher is not None:
+        with STAGE_SECONDS.time("predict"):
+            predicted = micro_batcher.predict(missing_frames)
+    else:
+        with model_pool.acquire() as bundle, STAGE_SECONDS.time("predict"):
+            # Ultralytics' own per-image lines follow our level: only at DEBUG.
+            predicted = bundle.model.predict(missing_frames, conf=0.25, verbose=logger.isEnabledFor(logging.DEBUG))
+    for i, result in zip(missing, predicted):
+        results[i] = result
+        if keys:
+            # Boxes and masks only: the cache must not pin the frame's pixels.
+            cached = copy.copy(result)
+            cached.orig_img = None
+            frame_results.put(keys[i], cached)
+    return results
+
+
+def _release_frames_without_plates(decoded, detections):
+    plate_frames = set(detections.frame_index[detections.class_rows("license_plate")].tolist())
+    for frame_idx, frame in enumerate(decoded):
+        if frame_idx not in plate_frames:
+            frame.release()
+
+
+def _build_detections(decoded, predict_results, track_results, session, offsets=None):
+    # Merge non-vehicle detections (from predict) with tracked vehicles (from the tracker, or
+    # track() in legacy mode) into one columnar store. Coordinates are shifted out of the ROI
+    # crop (offsets, one (x, y) per frame) and scaled to full-resolution pixels, which the rule
+    # thresholds are tuned for.
+    image_height = decoded[0].full_height if decoded else 512
+    builder = BatchDetectionsBuilder(class_names, len(decoded), image_height)
+    polygon_seconds = track_seconds = 0.0  # per batch, for /metrics
+
+    for i in range(len(decoded)):
+        scale = decoded[i].scale
+        offset_x, offset_y = offsets[i] if offsets else (0, 0)
         pred_result = predict_results[i] if i < len(predict_results) else None
         trk_result = track_results[i] if i < len(track_results) else None
 
         # --- non-vehicles from predict (polygons + boxes, no track_id needed) ---
-        if pred_result is not None and pred_result.masks is not None:
-            masks_xy = pred_result.masks.xy
-            for box, mask_polygon in zip(pred_result.boxes, masks_xy):
-                class_id = int(box.cls[0])
-                class_name = model.names[class_id]
-                if class_name in VEHICLE_CLASS_NAMES:
-                    continue  # vehicles come from track_results below
-                confidence = float(box.conf[0])
-
-                detection_info = {
-                    "class_name": class_name,
-                    "confidence": confidence
-                }
-
-                if class_name in POLYGON_CLASS_NAMES and mask_polygon is not None:
-                    detection_info["type"] = "polygon"
-                    detection_info["coordinates"] = mask_polygon.tolist()
-                elif class_name in BOX_CLASS_NAMES:
-                    detection_info["type"] = "box"
-                    detection_info["coordinates"] = box.xyxy[0].tolist()
-
-                if "type" in detection_info:
-                    frame_data["detections"].append(detection_info)
-
-        # --- vehicles from track (with stable track_id) ---
-        if trk_result is not None and trk_result.boxes is not None:
-            for box in trk_result.boxes:
-                class_id = int(box.cls[0])
-                class_name = model.names[class_id]
-                if class_name not in VEHICLE_CLASS_NAMES:
-                    continue  # safety: classes= filter should already guarantee this
-                confidence = float(box.conf[0])
-
-                detection_info = {
-                    "class_name": class_name,
-                    "confidence": confidence,
-                    "type": "box",
-                    "coordinates": box.xyxy[0].tolist(),
-                }
-                if box.id is not None:
-                    detection_info["track_id"] = int(box.id[0])
-                else:
-                    detection_info["id"] = -1
-
-                frame_data["detections"].append(detection_info)
-
-        batch_analysis.append(frame_data)
-
-    # --- PRE-CHECKS ---
-    has_solid_line = False
-    has_bus_line = False
-    has_stop_line = False   
-    has_red_light = False   
-    
-    for frame_data in batch_analysis:
-        # We only need to find one instance of each relevant class across the batch to trigger the corresponding logic
-        if has_solid_line and has_bus_line and has_stop_line and has_red_light:
-            break
-            
-        for det in frame_data["detections"]:
-            class_name = det["class_name"]
-            if class_name == "solid_line":
-                has_solid_line = True
-            elif class_name == "bus line":
-                has_bus_line = True    
-            elif class_name == "stop_line":         
-                has_stop_line = True
-            elif class_name == "traffic_light_red": 
-                has_red_light = True
-                
+        if pred_result is not None and pred_result.boxes is not None and len(pred_result.boxes):
+            boxes = pred_result.boxes.cpu().numpy()
+            class_ids = boxes.cls.astype(int)
+            is_polygon = np.isin(class_ids, polygon_class_ids) & (pred_result.masks is not None)
+            rows = np.flatnonzero(is_polygon | np.isin(class_ids, box_class_ids))
+            if len(rows):
+                # Contours are extracted only for the line masks, not for every detection.
+                started = time.perf_counter()
+                line_rows = np.flatnonzero(is_polygon)
+                polygons = dict(zip(line_rows, pred_result.masks[line_rows].xy)) if len(line_rows) else {}
+                polygons = [
+                    (simplify_polygon(polygons[j], POLYGON_MAX_POINTS) + (offset_x, offset_y)) * scale if j in polygons else None
+                    for j in rows
+                ]
+                polygon_seconds += time.perf_counter() - started
+                xyxy = (boxes.xyxy[rows] + (offset_x, offset_y, offset_x, offset_y)) * scale
+                builder.add(i, class_ids[rows], boxes.conf[rows], xyxy, polygons=polygons)
+
+        # --- vehicles from the tracker fed with this frame's predict() boxes (single-pass) ---
+        if SINGLE_PASS_INFERENCE and pred_result is not None and pred_result.boxes is not None:
+            started = time.perf_counter()
+            tracks = track_vehicles(session.tracker, pred_result, vehicle_class_ids, (offset_x, offset_y))
+            track_seconds += time.perf_counter() - started
+            builder.add(i, tracks[:, 6], tracks[:, 5], tracks[:, :4] * scale, track_id=tracks[:, 4])
+
+        # --- vehicles from track (with stable track_id, legacy two-pass mode) ---
+        if trk_result is not None and trk_result.boxes is not None and len(trk_result.boxes):
+            boxes = trk_result.boxes.cpu().numpy()
+            keep = np.isin(boxes.cls.astype(int), vehicle_class_ids)  # safety: classes= filter should already guarantee this
+            track_ids = boxes.id if boxes.id is not None else np.full(len(boxes), -1)
+            builder.add(i, boxes.cls[keep], boxes.conf[keep], boxes.xyxy[keep] * scale, track_id=track_ids[keep])
+
+    STAGE_SECONDS.observe(polygon_seconds, "mask_to_polygon")
+    if SINGLE_PASS_INFERENCE:
+        STAGE_SECONDS.observe(track_seconds, "track")
+    return builder.build()
+
+
+def _run_rules(decoded, detections, lpr_model, session):
+    # LPR crops from the full-resolution frames, decoded only when a plate is actually cropped.
+    frames = FullResolutionFrames(decoded)
+
     # --- RUNNING DETECTION LOGICS ---
-    
-    # 1. Solid Line Detection
-    if has_solid_line or _pending_solid_violations:
-        violation_result = detect_solid_line_violation(batch_analysis, frames, lpr_model, image_height)
-        if violation_result.get("violation"):
-            return violation_result
-    else:
-        print("⏩ Pre-check skipped: No solid line in batch.")
+    # Every rule sees every batch; all violations found in it come back together.
+    current_time = time.time()
+    violations = run_rules(detections, frames, lpr_model, session, current_time=current_time)
+    if recorder is not None:
+        recorder.record(session.session_id, current_log_context().get("batch"), detections, decoded, current_time, violations)
+
+    logger.info("✅ Finished processing! Sending %d violation(s) back to phone.", len(violations))
+    return violations
 
-    # 2. Bus Lane Detection
-    if has_bus_line or _pending_bus_violations:
-        violation_result = detect_bus_line_violation(batch_analysis, frames, lpr_model, image_height)
-        if violation_result.get("violation"):
-            return violation_result
-    else:
-        print("⏩ Pre-check skipped: No bus line in batch.")
-
-    # 3. Red Light Detection
-    has_prior_red_approachers = any(v[0] for v in approaching_vehicles.values())
-    if has_red_light or _pending_red_violations or has_prior_red_approachers:
-        violation_result = detect_red_light_violation(batch_analysis, frames, lpr_model, image_height)
-        if violation_result.get("violation"):
-            return violation_result
-    else:
-        print("⏩ Pre-check skipped: No red light in batch.")
 
-    print("✅ Finished processing! Sending response back to phone.")
-    return {"violation": False}
+def violations_response(violations):
+    # "violations" lists every violation of the batch, each with the index of its own evidence
+    # frame (last_violation_frame). The top level keeps the old single-violation shape (the
+    # first violation) so older app versions keep working.
+    if not violations:
+        return {"violation": False, "violations": []}
+    return {**violations[0], "violations": violations}
         
         
 if __name__ == "__main__":
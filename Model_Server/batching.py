@@ -0,0 +1,99 @@
+# --- 📦 CROSS-CLIENT MICRO-BATCHING ---
+# Phones send 4 frames per request, which is a small batch for CPU inference. The batcher
+# collects frames from concurrent /analyze_batch requests for a few milliseconds (or until
+# MICRO_BATCH_MAX_FRAMES is reached), runs one larger predict() call, and hands each request
+# back its own slice of the results. Tracking and rule evaluation stay per request.
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from logging_config import get_logger
+
+# Upper bound on the number of frames merged into one predict() call.
+MICRO_BATCH_MAX_FRAMES = int(os.getenv("PV_MICRO_BATCH_MAX_FRAMES", "16"))
+# How long the first request of a batch waits for others to join it.
+MICRO_BATCH_MAX_WAIT_MS = float(os.getenv("PV_MICRO_BATCH_MAX_WAIT_MS", "5"))
+
+logger = get_logger(__name__)
+
+
+class _PredictRequest:
+    def __init__(self, frames):
+        self.frames = frames
+        self.results = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class MicroBatcher:
+    """Merges predict() calls from concurrent requests into shared batches."""
+
+    def __init__(self, model_pool, max_frames=MICRO_BATCH_MAX_FRAMES,
+                 max_wait_ms=MICRO_BATCH_MAX_WAIT_MS, conf=0.25):
+        self._model_pool = model_pool
+        self._max_frames = max_frames
+        self._max_wait_seconds = max_wait_ms / 1000.0
+        self._conf = conf
+        self._requests = queue.Queue()
+        self._carry_over = None  # request that didn't fit in the previous batch
+        # Merged batches run here, at most one per model bundle at a time.
+        self._dispatch_executor = ThreadPoolExecutor(
+            max_workers=len(model_pool.bundles), thread_name_prefix="micro-batch"
+        )
+        threading.Thread(target=self._collect_forever, name="micro-batch-collector", daemon=True).start()
+
+    def predict(self, frames):
+        """Blocking drop-in for model.predict(frames): returns one Results object per frame."""
+        request = _PredictRequest(frames)
+        self._requests.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.results
+
+    def pending(self):
+        """Number of requests waiting to be merged into a batch."""
+        return self._requests.qsize() + (self._carry_over is not None)
+
+    def _collect_forever(self):
+        while True:
+            batch = [self._carry_over or self._requests.get()]
+            self._carry_over = None
+            frame_count = len(batch[0].frames)
+            deadline = time.monotonic() + self._max_wait_seconds
+
+            while frame_count < self._max_frames:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self._requests.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if frame_count + len(request.frames) > self._max_frames:
+                    self._carry_over = request  # starts the next batch
+                    break
+                batch.append(request)
+                frame_count += len(request.frames)
+
+            self._dispatch_executor.submit(self._run_batch, batch)
+
+    def _run_batch(self, batch):
+        frames = [frame for request in batch for frame in request.frames]
+        try:
+            logger.debug("📦 Micro-batch: %d frames from %d request(s)", len(frames), len(batch), extra={"stage": "predict"})
+            with self._model_pool.acquire() as bundle:
+                results = bundle.model.predict(frames, conf=self._conf, verbose=logger.isEnabledFor(logging.DEBUG))
+            offset = 0
+            for request in batch:
+                request.results = results[offset:offset + len(request.frames)]
+                offset += len(request.frames)
+        except Exception as e:
+            for request in batch:
+                request.error = e
+        finally:
+            for request in batch:
+                request.done.set()
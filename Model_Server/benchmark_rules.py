@@ -0,0 +1,181 @@
+# --- ⏱️ RULE BENCHMARK ---
+# Times the rule layer on synthetic dense-traffic batches, with no models or frames: hundreds of
+# tracked vehicles moving up the road across solid / dashed / bus lines and a stop line under a
+# red light, with taxi hats and plates on some of them. Reports per-rule throughput and latency
+# percentiles, plus the shared context build and the whole run_rules() call.
+#
+#   python benchmark_rules.py --tracks 300 --batches 200
+#   python benchmark_rules.py --fail-above-ms 50     # CI: exit 1 if run_rules p95 is slower
+import argparse
+import time
+
+import numpy as np
+
+from detection_store import BatchDetectionsBuilder
+from recording import BlankFrames
+from rule_engine import BatchContext, RULES, run_rules
+from sessions import Session
+
+CLASS_NAMES = dict(enumerate([
+    "car", "bus", "truck", "solid_line", "bus line", "stop_line", "dashed_line",
+    "license_plate", "taxi_hat", "traffic_light_red", "traffic_light_green",
+]))
+_CLASS_IDS = {name: cid for cid, name in CLASS_NAMES.items()}
+WIDTH, HEIGHT = 1920, 1080
+
+
+def _line_polygon(x_bottom, x_top, y_top=380, y_bottom=HEIGHT, width=14, points=40):
+    # Contour of a lane marking: down one edge and back up the other, like a mask contour.
+    ys = np.linspace(y_top, y_bottom, points // 2)
+    xs = x_top + (x_bottom - x_top) * (ys - y_top) / (y_bottom - y_top)
+    left = np.column_stack([xs - width / 2, ys])
+    right = np.column_stack([xs + width / 2, ys])[::-1]
+    return np.vstack([left, right]).astype(np.float32)
+
+
+def _stop_line_polygon(y=640, thickness=16):
+    xs = np.linspace(200, WIDTH - 200, 20)
+    top = np.column_stack([xs, np.full_like(xs, y - thickness / 2)])
+    bottom = np.column_stack([xs, np.full_like(xs, y + thickness / 2)])[::-1]
+    return np.vstack([top, bottom]).astype(np.float32)
+
+
+LINES = {
+    "solid_line": [_line_polygon(620, 880)],
+    "dashed_line": [_line_polygon(1050, 980), _line_polygon(1450, 1100)],
+    "bus line": [_line_polygon(1700, 1180)],
+    "stop_line": [_stop_line_polygon()],
+}
+
+
+class DenseScene:
+    """Synthetic traffic: vehicles keep their track IDs and move from batch to batch."""
+
+    def __init__(self, tracks, frames_per_batch, seed=0):
+        self.rng = np.random.default_rng(seed)
+        self.frames_per_batch = frames_per_batch
+        self.next_track_id = 1
+        self.vehicles = [self._new_vehicle() for _ in range(tracks)]
+
+    def _new_vehicle(self):
+        rng = self.rng
+        width = rng.uniform(110, 320)
+        vehicle = {
+            "track_id": self.next_track_id,
+            "cls": rng.choice(["car", "car", "car", "truck", "bus"]),
+            "x": rng.uniform(100, WIDTH - 100 - width),
+            "bottom": rng.uniform(500, HEIGHT),
+            "width": width,
+            "height": width * rng.uniform(0.7, 1.0),
+            "dx": rng.normal(0, 6),
+            "dy": -rng.uniform(5, 40),   # moving away from the camera, up the frame
+            "taxi": rng.random() < 0.1,
+            "plate": rng.random() < 0.6,
+        }
+        self.next_track_id += 1
+        return vehicle
+
+    def next_batch(self):
+        builder = BatchDetectionsBuilder(CLASS_NAMES, self.frames_per_batch, HEIGHT)
+        for frame_idx in range(self.frames_per_batch):
+            for name, polygons in LINES.items():
+                for polygon in polygons:
+                    xyxy = [*polygon.min(axis=0), *polygon.max(axis=0)]
+                    builder.add(frame_idx, [_CLASS_IDS[name]], [0.8], [xyxy], polygons=[polygon])
+            builder.add(frame_idx, [_CLASS_IDS["traffic_light_red"]], [0.7], [[940, 60, 965, 120]])
+
+            boxes, classes, track_ids, hats, plates = [], [], [], [], []
+            for vehicle in self.vehicles:
+                x1, y2 = vehicle["x"], vehicle["bottom"]
+                x2, y1 = x1 + vehicle["width"], y2 - vehicle["height"]
+                boxes.append([x1, y1, x2, y2])
+                classes.append(_CLASS_IDS[vehicle["cls"]])
+                track_ids.append(vehicle["track_id"])
+                cx = (x1 + x2) / 2
+                if vehicle["taxi"]:
+                    hats.append([cx - 20, y1 - 15, cx + 20, y1 + 5])
+                if vehicle["plate"]:
+                    plates.append([cx - 45, y2 - 35, cx + 45, y2 - 10])
+            builder.add(frame_idx, classes, np.full(len(boxes), 0.9), boxes, track_id=track_ids)
+            if hats:
+                builder.add(frame_idx, np.full(len(hats), _CLASS_IDS["taxi_hat"]), np.full(len(hats), 0.6), hats)
+            if plates:
+                builder.add(frame_idx, np.full(len(plates), _CLASS_IDS["license_plate"]), np.full(len(plates), 0.6), plates)
+            self._move()
+        return builder.build()
+
+    def _move(self):
+        for k, vehicle in enumerate(self.vehicles):
+            vehicle["x"] += vehicle["dx"]
+            vehicle["bottom"] += vehicle["dy"]
+            vehicle["width"] *= 0.99
+            vehicle["height"] *= 0.99
+            if vehicle["bottom"] < 420 or not 0 < vehicle["x"] < WIDTH - vehicle["width"]:
+                self.vehicles[k] = self._new_vehicle()  # left the view: a new car enters
+
+
+def _no_lpr(candidates_by_track, lpr_model, plate_cache=None):
+    return {track_id: "" for track_id in candidates_by_track}
+
+
+def _percentiles(samples):
+    ms = np.asarray(samples) * 1000
+    return np.percentile(ms, 50), np.percentile(ms, 95), np.percentile(ms, 99)
+
+
+def run_benchmark(tracks, frames_per_batch, batches, seed=0):
+    """{name: list of per-batch seconds} for the context, every rule and the whole run_rules()."""
+    scene = DenseScene(tracks, frames_per_batch, seed)
+    frames = BlankFrames([(HEIGHT, WIDTH)] * frames_per_batch)
+    rule_session, engine_session = Session("bench-rules"), Session("bench-engine")
+    timings = {"context": [], **{rule.name: [] for rule in RULES}, "run_rules": []}
+    current_time = time.time()
+
+    for _ in range(batches):
+        detections = scene.next_batch()
+        current_time += 1.0  # the phone sends about one batch per second
+
+        started = time.perf_counter()
+        context = BatchContext(detections, frames, current_time)
+        timings["context"].append(time.perf_counter() - started)
+        for rule in RULES:
+            state = getattr(rule_session, rule.state_attr)
+            started = time.perf_counter()
+            if rule.applies(context, state):
+                rule.evaluate(context, state)
+            timings[rule.name].append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        run_rules(detections, frames, None, engine_session, current_time=current_time, plate_reader=_no_lpr)
+        timings["run_rules"].append(time.perf_counter() - started)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the rule engine on synthetic dense traffic.")
+    parser.add_argument("--tracks", type=int, default=300, help="vehicles in view at once")
+    parser.add_argument("--frames", type=int, default=4, help="frames per batch (the phone sends 4)")
+    parser.add_argument("--batches", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--fail-above-ms", type=float, help="exit 1 if the run_rules p95 exceeds this")
+    args = parser.parse_args()
+
+    timings = run_benchmark(args.tracks, args.frames, args.batches, args.seed)
+
+    print(f"\n{args.tracks} tracks x {args.frames} frames, {args.batches} batches")
+    print(f"{'stage':<12}{'batches/s':>11}{'vehicles/s':>13}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for name, samples in timings.items():
+        p50, p95, p99 = _percentiles(samples)
+        per_second = len(samples) / sum(samples) if sum(samples) else float("inf")
+        print(f"{name:<12}{per_second:>11.1f}{per_second * args.tracks:>13.0f}{p50:>9.2f}{p95:>9.2f}{p99:>9.2f}")
+
+    if args.fail_above_ms is not None:
+        p95 = _percentiles(timings["run_rules"])[1]
+        if p95 > args.fail_above_ms:
+            print(f"\n❌ run_rules p95 {p95:.2f} ms is above the {args.fail_above_ms:.2f} ms budget")
+            raise SystemExit(1)
+        print(f"\n✅ run_rules p95 {p95:.2f} ms is within the {args.fail_above_ms:.2f} ms budget")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,26 @@
 # --- 🚌 BUS LANE DETECTION LOGIC ---
 import numpy as np
-import time
-from utils import get_unified_line_x, extract_license_plate, get_center_bottom, is_far, prune_old_entries, should_report_violation
+from utils import get_center_bottom, prune_old_entries, Violator
+from logging_config import get_logger
+from state_store import LOCAL_STATE
 CLEANING_TIME_SECONDS = 60
 CLEANING_TIME_SECONDS_TAXI = 600
 CAR_HEIGHT_THRESHOLD = 0.2  # Minimum height in pixels to consider a detection as a car (to filter out small objects and false positives)
-#Memory to avoid reporting the same vehicle multiple times
-reported_violators = {}  # track_id -> timestamp
-reported_plates = {}     # license_plate -> timestamp (second-line dedup if tracker drops a car and re-acquires it with a new ID)
-known_taxis = {}
-# Queue of confirmed violations waiting to be returned (one per call).
-# Plate is already resolved at queue time, so each entry is a ready-to-return result dict.
-_pending_violations = []
+
+logger = get_logger(__name__)
+
+
+class BusLaneState:
+    """Memory of the bus lane logic for one session (one phone)."""
+
+    def __init__(self, store=LOCAL_STATE, namespace="bus_lane"):
+        #Memory to avoid reporting the same vehicle multiple times
+        # Track IDs belong to this process's tracker: track-keyed memory is never shared (see state_store.py).
+        self.reported_violators = LOCAL_STATE.map(f"{namespace}/reported_violators")  # track_id -> timestamp
+        self.reported_plates = store.map(f"{namespace}/reported_plates")              # license_plate -> timestamp (second-line dedup if tracker drops a car and re-acquires it with a new ID)
+        self.known_taxis = LOCAL_STATE.map(f"{namespace}/known_taxis")                # track_id -> timestamp
+
+
 def is_taxi(car_coords, taxi_hats):
     cx1, cy1, cx2, cy2 = car_coords
     car_height = cy2 - cy1
@@ -27,95 +36,75 @@ def is_taxi(car_coords, taxi_hats):
             return True
             
     return False
-def detect_bus_line_violation(batch_analysis, frames, lpr_model, image_height=512):
-    print("\n--- 🚌 DEBUG: STARTING BUS LANE LOGIC ---")
+def bus_lane_applies(context, state):
+    # We only need one bus line anywhere in the batch to run this rule
+    return context.detections.has_class("bus line")
 
-    # ── Return pending violations from previous batches first ─────────────
-    if _pending_violations:
-        pv = _pending_violations.pop(0)
-        print(f"📋 Returning pending bus lane violation for ID {pv['track_id']} (queue size: {len(_pending_violations)})")
-        return pv
 
-    vehicle_history = {} #Id History
-    current_time = time.time()
+def find_bus_lane_violators(context, state):
+    logger.debug("--- 🚌 STARTING BUS LANE LOGIC ---")
+    detections = context.detections
+    current_time = context.current_time
     
     #Clean up old reported violators
-    prune_old_entries(reported_violators, current_time, CLEANING_TIME_SECONDS)
-    prune_old_entries(reported_plates, current_time, CLEANING_TIME_SECONDS)
-    prune_old_entries(known_taxis, current_time, CLEANING_TIME_SECONDS_TAXI)
-   
+    prune_old_entries(state.reported_violators, current_time, CLEANING_TIME_SECONDS)
+    prune_old_entries(state.reported_plates, current_time, CLEANING_TIME_SECONDS)
+    prune_old_entries(state.known_taxis, current_time, CLEANING_TIME_SECONDS_TAXI)
 
-    # catch the history of each tracked vehicle across the frames
-    for frame_data in batch_analysis:
-        frame_idx = frame_data["frame_index"]
-        # collect the polygons of the bus lines and dashed lines detected in this frame
-        bus_lines = [
-            np.array(det["coordinates"]) for det in frame_data["detections"] 
-            if det["class_name"] == "bus line" and det["type"] == "polygon"
-        ]
-        dashed_lines = [
-            np.array(det["coordinates"]) for det in frame_data["detections"]
-            if det["class_name"] == "dashed_line" and det["type"] == "polygon"
-        ]
-        solid_lines = [
-            np.array(det["coordinates"]) for det in frame_data["detections"]
-            if det["class_name"] == "solid_line" and det["type"] == "polygon"
-        ]
-        taxi_hats = [
-            det["coordinates"] for det in frame_data["detections"]
-            if det["class_name"] == "taxi_hat" and det["type"] == "box"
-        ]
-        for det in frame_data["detections"]:
-            if (det["class_name"] == "car" or det["class_name"] == "truck") and det.get("track_id", -1) != -1 and not is_far(det, image_height):
-                track_id = det["track_id"]
-                car_coords = det["coordinates"]
-                has_hat_in_this_frame = is_taxi(car_coords, taxi_hats)
-                
-                if has_hat_in_this_frame:
-                    known_taxis[track_id] = current_time  # Remember this ID as a taxi for future frames
-            
-                if track_id not in vehicle_history:
-                    vehicle_history[track_id] = {"frames": [], "coords": [], "dashed_lines": [], "bus_lines": [], "solid_lines": []}
-                vehicle_history[track_id]["frames"].append(frame_idx)
-                vehicle_history[track_id]["coords"].append(car_coords)
-                vehicle_history[track_id]["dashed_lines"].append(dashed_lines)
-                vehicle_history[track_id]["bus_lines"].append(bus_lines)
-                vehicle_history[track_id]["solid_lines"].append(solid_lines)
-    print(f"🚗 Found {len(vehicle_history)} unique tracked vehicles (with IDs).")
-    confirmed = []
+    # X of the bus line / dashed line (fitted once per frame) at every vehicle's Y
+    # (None = no such line in this frame, NaN = vehicle beyond the farthest detected line)
+    bus_line_xs = context.lane_line_x("bus line")
+    dashed_line_xs = context.lane_line_x("dashed_line")
+    divider_xs = context.divider_xs()
+
+    # catch the history of each tracked car/truck across the frames (buses may use the bus lane)
+    vehicle_history = {} #Id History
+    for track_id, track in context.vehicle_history.items():
+        for frame_idx, car_coords, class_name, position in zip(track["frames"], track["coords"], track["classes"], track["index"]):
+            if class_name == "bus":
+                continue
+            if is_taxi(car_coords, detections.boxes(frame_idx, "taxi_hat")):
+                state.known_taxis[track_id] = current_time  # Remember this ID as a taxi for future frames
+
+            if track_id not in vehicle_history:
+                vehicle_history[track_id] = {"frames": [], "coords": [], "bus_line_x": [], "dashed_line_x": [], "separator_xs": []}
+            vehicle_history[track_id]["frames"].append(frame_idx)
+            vehicle_history[track_id]["coords"].append(car_coords)
+            vehicle_history[track_id]["bus_line_x"].append(bus_line_xs[position])
+            vehicle_history[track_id]["dashed_line_x"].append(dashed_line_xs[position])
+            vehicle_history[track_id]["separator_xs"].append(divider_xs[position])
+    logger.debug("🚗 Found %d tracked cars/trucks for the bus lane check.", len(vehicle_history))
+    violators = []
     # analyze the history of each vehicle to detect violations
     for track_id, history in vehicle_history.items():
-        if track_id in known_taxis:
-            print(f"   🚕 SKIP: Vehicle ID {track_id} identified as a taxi (detected hat).")
-            known_taxis[track_id] = current_time  # Update the timestamp to extend the memory
+        track = {"track": track_id}
+        if track_id in state.known_taxis:
+            logger.debug("🚕 Skipped: identified as a taxi (detected hat).", extra=track)
+            state.known_taxis[track_id] = current_time  # Update the timestamp to extend the memory
             continue
         violation_count = 0
         total_frames_checked = 0
         last_frame_idx = None
-        print(f"\n🔍 Checking Vehicle ID: {track_id} (Appeared in {len(history['frames'])} frames)")
+        logger.debug("🔍 Checking vehicle (appeared in %d frames)", len(history["frames"]), extra=track)
         # Run all over the frames of this vehicle
-        for frame_idx, coords, bus_lines, dashed_lines, solid_lines in zip(history["frames"], history["coords"], history["bus_lines"], history["dashed_lines"], history["solid_lines"]):
+        for frame_idx, coords, bus_line_x, dashed_line_x, separator_xs in zip(history["frames"], history["coords"], history["bus_line_x"], history["dashed_line_x"], history["separator_xs"]):
             total_frames_checked += 1
             # if there are no bus lines in this frame, we can't check for violation, so we skip it
-            if len(bus_lines) == 0:
+            if bus_line_x is None:
                 continue    
 #---------------------------Bus lane Logic:-------------------------------------
             car_bottom_x = get_center_bottom(coords)[0]
-            car_bottom_y = get_center_bottom(coords)[1]
 
-            #we find the x coordinate of the bus lane line at the height of the car
-            bus_line_x = get_unified_line_x(bus_lines, car_bottom_y)
-            if bus_line_x is None:
-                print(f"   ⚠️ Frame {frame_idx}: Car is beyond the farthest detected bus line. Skipping this frame for violation check.")
+            #bus_line_x is the x coordinate of the bus lane line at the height of the car
+            if np.isnan(bus_line_x):
+                logger.debug("⚠️ Frame %d: car is beyond the farthest detected bus line, frame skipped.", frame_idx, extra=track)
                 continue
             
             
             bus_lane_side = "right" # default assumption
             
-            if len(dashed_lines) > 0:
-                #we find the x coordinate of the dashed line at the same height of the bus line
-                dashed_line_x = get_unified_line_x(dashed_lines, car_bottom_y)
-                
+            #dashed_line_x is the x coordinate of the dashed line at the same height of the bus line
+            if dashed_line_x is not None and not np.isnan(dashed_line_x):
                 # determine the side of the bus lane based on the relative position of the bus line and the dashed line
                 if bus_line_x > dashed_line_x:
                     bus_lane_side = "right"
@@ -123,22 +112,14 @@ def detect_bus_line_violation(batch_analysis, frames, lpr_model, image_height=51
                     bus_lane_side = "left"
             
             # Reject cars separated from the bus line by another lane divider — they're in a
-            # different lane, not the bus lane. Check each dashed/solid polygon individually
-            # (unifying them would average lanes together and hide the separation).
-            separator_polygons = list(dashed_lines) + list(solid_lines)
+            # different lane, not the bus lane. Each dashed/solid polygon was checked individually
+            # (NaN = car beyond that divider's far end, which never counts as between).
             low_x = min(car_bottom_x, bus_line_x)
             high_x = max(car_bottom_x, bus_line_x)
-            separator_between = False
-            for sep_poly in separator_polygons:
-                sep_x = get_unified_line_x([sep_poly], car_bottom_y)
-                if sep_x is None:
-                    continue
-                if low_x < sep_x < high_x:
-                    separator_between = True
-                    break
+            separator_between = bool(np.any((separator_xs > low_x) & (separator_xs < high_x)))
 
             if separator_between:
-                print(f"   ↔️ Frame {frame_idx}: A lane divider sits between car and bus line. Not in bus lane.")
+                logger.debug("↔️ Frame %d: a lane divider sits between car and bus line, not in bus lane.", frame_idx, extra=track)
                 continue
 
             # the check if the car is driving in the bus lane
@@ -151,28 +132,13 @@ def detect_bus_line_violation(batch_analysis, frames, lpr_model, image_height=51
                 
         # determine based on the number of frames with violation if this vehicle is violating the bus lane rule
         if total_frames_checked > 0 and violation_count >= (total_frames_checked / 2.0):
-
-            plate_text = extract_license_plate(history, batch_analysis, frames, lpr_model)
-            if not should_report_violation(track_id, plate_text, current_time, reported_violators, reported_plates):
-                continue
-            print(f"   🏆 >>> BUS LANE VIOLATION CONFIRMED FOR ID {track_id} (plate={plate_text or 'N/A'}) <<<")
-
-            confirmed.append({
+            violators.append(Violator(track_id, {
                 "violation": True,
                 "type": "Public Lane Violation",
                 "track_id": track_id,
-                "vehicle_coords": history["coords"][-1],
-                "license_plate": plate_text,
+                "vehicle_coords": [float(c) for c in history["coords"][-1]],
+                "license_plate": None,  # filled in by the rule engine after the batched LPR
                 "last_violation_frame": last_frame_idx
-            })
-
-    if not confirmed:
-        print("✅ No valid bus lane violations found in this batch.")
-        return {"violation": False}
+            }))
 
-    # Return the first violation now; queue the rest for subsequent calls
-    first = confirmed[0]
-    for extra in confirmed[1:]:
-        _pending_violations.append(extra)
-        print(f"📋 Queued bus lane violation for ID {extra['track_id']} (pending: {len(_pending_violations)})")
-    return first
\ No newline at end of file
+    return violators
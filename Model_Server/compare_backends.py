@@ -0,0 +1,133 @@
+# --- 📊 BACKEND COMPARISON ---
+# Runs the traffic and LPR models on every exported backend / precision over the same inputs,
+# and reports latency plus agreement with the PyTorch FP32 reference (detection F1: same class,
+# IoU >= 0.5). Use real phone frames and plate crops; random frames only measure latency.
+#
+#   python compare_backends.py --images samples/frames --plates samples/plates
+import argparse
+import glob
+import importlib.util
+import os
+import time
+
+import cv2
+import numpy as np
+
+from logging_config import configure_logging
+from inference_backend import BACKENDS, PRECISIONS, exported_model_path, load_yolo, _RUNTIME_PACKAGES
+from export_models import TRAFFIC_WEIGHTS, LPR_WEIGHTS
+from utils import letterbox_plate, LPR_INPUT_HEIGHT, LPR_INPUT_WIDTH
+
+IOU_THRESHOLD = 0.5
+
+
+def load_images(folder, limit, fallback_shape):
+    if folder:
+        paths = sorted(glob.glob(os.path.join(folder, "*.jp*g")) + glob.glob(os.path.join(folder, "*.png")))[:limit]
+        images = [cv2.imread(path) for path in paths]
+        if images:
+            return images, True
+        print(f"⚠️ No images found in {folder}, using random frames")
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, 255, fallback_shape, dtype=np.uint8) for _ in range(limit)], False
+
+
+def _iou_matrix(a, b):
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+def matched_count(reference, candidate):
+    """Greedy one-to-one matches between two (classes, boxes) detections of one image."""
+    ref_cls, ref_boxes = reference
+    cand_cls, cand_boxes = candidate
+    matches = 0
+    for cls_id in np.intersect1d(ref_cls, cand_cls):
+        iou = _iou_matrix(ref_boxes[ref_cls == cls_id], cand_boxes[cand_cls == cls_id])
+        while iou.size and iou.max() >= IOU_THRESHOLD:
+            i, j = np.unravel_index(iou.argmax(), iou.shape)
+            matches += 1
+            iou[i, :] = -1
+            iou[:, j] = -1
+    return matches
+
+
+def agreement_f1(reference, candidate):
+    matches = sum(matched_count(r, c) for r, c in zip(reference, candidate))
+    ref_total = sum(len(r[0]) for r in reference)
+    cand_total = sum(len(c[0]) for c in candidate)
+    if ref_total == 0 and cand_total == 0:
+        return 1.0
+    return 2 * matches / (ref_total + cand_total)
+
+
+def run_model(model, images, batch_size, **predict_kwargs):
+    """Predict over images in batches. Returns (per-batch latencies in ms, per-image detections)."""
+    model.predict(images[:batch_size], verbose=False, **predict_kwargs)  # warmup
+    latencies, detections = [], []
+    for start in range(0, len(images), batch_size):
+        batch = images[start:start + batch_size]
+        t0 = time.perf_counter()
+        results = model.predict(batch, verbose=False, **predict_kwargs)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        for result in results:
+            boxes = result.boxes.cpu().numpy()
+            detections.append((boxes.cls.astype(int), boxes.xyxy))
+    return latencies, detections
+
+
+def available_variants():
+    for backend in BACKENDS:
+        for precision in PRECISIONS:
+            if backend == "torch":
+                if precision == "fp32":
+                    yield backend, precision
+                continue
+            if importlib.util.find_spec(_RUNTIME_PACKAGES[backend]) is None:
+                continue
+            if os.path.exists(exported_model_path(TRAFFIC_WEIGHTS, backend, precision)) and \
+                    os.path.exists(exported_model_path(LPR_WEIGHTS, backend, precision)):
+                yield backend, precision
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare latency and accuracy of the inference backends.")
+    parser.add_argument("--images", help="folder of full frames for the traffic model")
+    parser.add_argument("--plates", help="folder of plate crops for the LPR model")
+    parser.add_argument("--limit", type=int, default=64, help="max images per model")
+    parser.add_argument("--batch", type=int, default=4, help="frames per predict() call (the phone sends 4)")
+    args = parser.parse_args()
+    configure_logging()
+
+    frames, real_frames = load_images(args.images, args.limit, (1080, 1920, 3))
+    plates, real_plates = load_images(args.plates, args.limit, (40, 160, 3))
+    plates = [letterbox_plate(plate) for plate in plates]
+    lpr_kwargs = {"conf": 0.5, "imgsz": (LPR_INPUT_HEIGHT, LPR_INPUT_WIDTH)}
+
+    rows, reference = [], {}
+    for backend, precision in available_variants():
+        bundle = {
+            "traffic": (load_yolo(TRAFFIC_WEIGHTS, "segment", backend, precision), frames, {"conf": 0.25}),
+            "lpr": (load_yolo(LPR_WEIGHTS, "detect", backend, precision), plates, lpr_kwargs),
+        }
+        for name, (model, images, kwargs) in bundle.items():
+            latencies, detections = run_model(model, images, args.batch, **kwargs)
+            reference.setdefault(name, detections)  # torch fp32 runs first
+            rows.append((backend, precision, name, np.percentile(latencies, 50), np.percentile(latencies, 95),
+                         np.sum(latencies) / len(images), agreement_f1(reference[name], detections)))
+
+    print(f"\n{'backend':<10}{'precision':<11}{'model':<9}{'p50 ms/batch':>14}{'p95 ms/batch':>14}{'ms/frame':>10}{'F1 vs torch':>13}")
+    for backend, precision, name, p50, p95, per_frame, f1 in rows:
+        print(f"{backend:<10}{precision:<11}{name:<9}{p50:>14.1f}{p95:>14.1f}{per_frame:>10.1f}{f1:>13.3f}")
+    if not (real_frames and real_plates):
+        print("\n⚠️ Random inputs were used for at least one model: only the latency columns are meaningful.")
+
+
+if __name__ == "__main__":
+    main()
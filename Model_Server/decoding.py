@@ -0,0 +1,168 @@
+# --- 🖼️ JPEG DECODING ---
+# Uploads go straight from their bytes to BGR ndarrays: np.frombuffer is a zero-copy view of
+# the upload and cv2.imdecode writes BGR directly, so there is no PIL image, RGB array or
+# cvtColor copy in between. All frames of a batch decode in parallel (OpenCV releases the GIL).
+#
+# With JPEG_DECODE_REDUCTION > 1, libjpeg's DCT scaling decodes at 1/2, 1/4 or 1/8 of the size
+# for inference. The upload bytes are kept, and the full-resolution frame is only decoded for
+# the frames that LPR actually crops from.
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+# 1 = full resolution, 2/4/8 = DCT-scaled decode for inference.
+JPEG_DECODE_REDUCTION = int(os.getenv("PV_JPEG_DECODE_REDUCTION", "1"))
+# Long side (px) of the frames YOLO sees, independent of the upload resolution. 0 = use the
+# decoded size as is. When set, it picks the DCT reduction on its own (PV_JPEG_DECODE_REDUCTION
+# is ignored): the cheapest decode that is still at least this large, then one INTER_AREA resize.
+DETECTION_MAX_SIDE = int(os.getenv("PV_DETECTION_MAX_SIDE", "0"))
+DECODE_THREADS = int(os.getenv("PV_DECODE_THREADS", "4"))
+
+# Keep the pixel layout the phone sent (same as the previous PIL path, which ignored EXIF).
+_BASE_FLAGS = cv2.IMREAD_IGNORE_ORIENTATION
+_DECODE_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+# A bad setting is the server's mistake: refuse to start rather than answer every upload with 400.
+if JPEG_DECODE_REDUCTION not in _DECODE_FLAGS:
+    raise RuntimeError(f"PV_JPEG_DECODE_REDUCTION must be one of {sorted(_DECODE_FLAGS)}, got {JPEG_DECODE_REDUCTION}")
+# JPEG start-of-frame markers (they carry the image size); C4/C8/CC are other segments.
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+_decode_executor = ThreadPoolExecutor(max_workers=DECODE_THREADS, thread_name_prefix="decode")
+
+
+def _imdecode(data, reduction):
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    image = cv2.imdecode(buffer, _DECODE_FLAGS[reduction] | _BASE_FLAGS)
+    if image is None:
+        raise ValueError("Uploaded frame is not a decodable image")
+    return image
+
+
+def _jpeg_size(data):
+    """(height, width) from the JPEG header without decoding, or None if it isn't a JPEG."""
+    if data[:2] != b"\xff\xd8":
+        return None
+    i = 2
+    while i + 9 <= len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:  # fill byte
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:  # segments without a length
+            i += 2
+            continue
+        if marker in _SOF_MARKERS:
+            return int.from_bytes(data[i + 5:i + 7], "big"), int.from_bytes(data[i + 7:i + 9], "big")
+        i += 2 + int.from_bytes(data[i + 2:i + 4], "big")
+    return None
+
+
+def _reduction_for_max_side(data, max_side, size=None):
+    # Largest DCT reduction whose output long side is still >= max_side.
+    size = size or _jpeg_size(data)
+    if size is None:
+        return 1
+    long_side = max(size)
+    for reduction in (8, 4, 2):
+        if -(-long_side // reduction) >= max_side:
+            return reduction
+    return 1
+
+
+def fit_max_side(image, max_side):
+    height, width = image.shape[:2]
+    if not max_side or max(height, width) <= max_side:
+        return image
+    ratio = max_side / max(height, width)
+    size = (max(1, int(round(width * ratio))), max(1, int(round(height * ratio))))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+
+class DecodedFrame:
+    """
+    One uploaded frame: the image used for detection, plus lazy full-resolution access.
+    Coordinates found on .image map to full-resolution pixels by multiplying with .scale.
+    """
+
+    def __init__(self, data, reduction=1, max_side=DETECTION_MAX_SIDE):
+        self.data = data
+        size = _jpeg_size(data)
+        if max_side:
+            reduction = _reduction_for_max_side(data, max_side, size)
+        decoded = _imdecode(data, reduction)
+        self._full = decoded if reduction == 1 else None
+        if reduction == 1 or size is None:
+            self.full_height, self.full_width = decoded.shape[0] * reduction, decoded.shape[1] * reduction
+        else:
+            # DCT scaling rounds the reduced size up: the header has the true full size.
+            self.full_height, self.full_width = size
+        self.image = fit_max_side(decoded, max_side)
+        self.scale = self.full_width / self.image.shape[1]  # full-resolution pixels per detection pixel
+
+    @property
+    def full(self):
+        """The full-resolution BGR frame, decoded on first access."""
+        if self._full is None:
+            self._full = _imdecode(self.data, 1)
+        return self._full
+
+    def release(self):
+        """
+        Drop the pixels once detection is done. They are decoded again from the upload bytes
+        if a plate is cropped from this frame after all.
+        """
+        self.image = None
+        self._full = None
+
+
+class ArrayFrame(DecodedFrame):
+    """A frame that is already decoded (e.g. read from a video): the full frame is in memory."""
+
+    def __init__(self, image, reduction=1, max_side=DETECTION_MAX_SIDE):
+        self.data = None
+        self._full = image
+        self.full_height, self.full_width = image.shape[:2]
+        if max_side:
+            self.image = fit_max_side(image, max_side)
+        elif reduction == 1:
+            self.image = image
+        else:
+            self.image = cv2.resize(image, (max(1, self.full_width // reduction), max(1, self.full_height // reduction)),
+                                    interpolation=cv2.INTER_AREA)
+        self.scale = self.full_width / self.image.shape[1]
+
+    def release(self):
+        # Nothing to decode it again from: keep the full frame (video evidence), drop the rest.
+        self.image = None
+
+
+class FullResolutionFrames:
+    """List-like view that yields full-resolution frames, decoding only those that are indexed."""
+
+    def __init__(self, decoded_frames):
+        self._decoded_frames = decoded_frames
+
+    def __getitem__(self, index):
+        return self._decoded_frames[index].full
+
+    def __len__(self):
+        return len(self._decoded_frames)
+
+
+def decode_frames(uploads, reduction=JPEG_DECODE_REDUCTION):
+    """
+    Decode a batch of uploaded JPEG bytes in parallel. Returns a list of DecodedFrame.
+    Raises ValueError only for an upload that isn't a decodable image (the client's fault).
+    """
+    if reduction not in _DECODE_FLAGS:
+        raise RuntimeError(f"JPEG decode reduction must be one of {sorted(_DECODE_FLAGS)}, got {reduction}")
+    return list(_decode_executor.map(lambda data: DecodedFrame(data, reduction), uploads))
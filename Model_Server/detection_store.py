@@ -0,0 +1,142 @@
+# --- 🗃️ COLUMNAR BATCH DETECTIONS ---
+# All detections of one batch, stored as NumPy columns instead of a list of per-detection
+# dicts. Rows are kept in frame order, so per-frame lookups are binary searches, and the
+# class and track indexes are built once per batch instead of rescanning with string compares.
+import numpy as np
+
+_EMPTY_POLYGON = np.empty((0, 2), dtype=np.float32)
+
+
+class BatchDetections:
+    """
+    One row per detection:
+      frame_index (int32), class_id (int32), confidence (float32),
+      track_id (int32, -1 = untracked), xyxy (float32, N x 4).
+    Polygon points live in one (M, 2) buffer: row i owns
+    poly_points[poly_offsets[i]:poly_offsets[i + 1]] (empty for box detections).
+    All coordinates are full-resolution pixels.
+    """
+
+    def __init__(self, class_names, frame_count, image_height, frame_index, class_id,
+                 confidence, track_id, xyxy, poly_offsets, poly_points):
+        self.class_names = class_names
+        self.frame_count = frame_count
+        self.image_height = image_height
+        self.frame_index = frame_index
+        self.class_id = class_id
+        self.confidence = confidence
+        self.track_id = track_id
+        self.xyxy = xyxy
+        self.poly_offsets = poly_offsets
+        self.poly_points = poly_points
+
+        self._class_ids_by_name = {name: cid for cid, name in class_names.items()}
+        self._rows_by_class = {
+            int(cid): np.flatnonzero(class_id == cid) for cid in np.unique(class_id)
+        }
+        self._rows_by_track = None  # built on first track lookup
+
+    def __len__(self):
+        return len(self.class_id)
+
+    # ── Class index ──────────────────────────────────────────────────
+    def class_rows(self, *class_names):
+        """Row indices (in frame order) of every detection of the given classes."""
+        chunks = [
+            self._rows_by_class.get(self._class_ids_by_name.get(name), ())
+            for name in class_names
+        ]
+        if len(chunks) == 1:
+            return np.asarray(chunks[0], dtype=np.int64)
+        return np.sort(np.concatenate(chunks)).astype(np.int64) if chunks else np.empty(0, np.int64)
+
+    def has_class(self, class_name):
+        return len(self.class_rows(class_name)) > 0
+
+    def rows_in_frame(self, frame_idx, *class_names):
+        """Rows of the given classes that belong to one frame."""
+        rows = self.class_rows(*class_names)
+        frames = self.frame_index[rows]
+        return rows[np.searchsorted(frames, frame_idx, "left"):np.searchsorted(frames, frame_idx, "right")]
+
+    # ── Track index ──────────────────────────────────────────────────
+    def tracked_rows(self, *class_names):
+        """Rows of the given classes that carry a track id."""
+        rows = self.class_rows(*class_names)
+        return rows[self.track_id[rows] != -1]
+
+    def track_rows(self, track_id):
+        """Rows (in frame order) of one tracked object."""
+        if self._rows_by_track is None:
+            tracked = np.flatnonzero(self.track_id != -1)
+            order = tracked[np.argsort(self.track_id[tracked], kind="stable")]
+            ids, starts = np.unique(self.track_id[order], return_index=True)
+            bounds = np.append(starts, len(order))
+            self._rows_by_track = {
+                int(tid): order[bounds[k]:bounds[k + 1]] for k, tid in enumerate(ids)
+            }
+        return self._rows_by_track.get(int(track_id), np.empty(0, np.int64))
+
+    # ── Geometry ─────────────────────────────────────────────────────
+    def polygon(self, row):
+        return self.poly_points[self.poly_offsets[row]:self.poly_offsets[row + 1]]
+
+    def polygons(self, frame_idx, class_name):
+        """Polygons of one class in one frame (None = every frame of the batch)."""
+        rows = self.class_rows(class_name) if frame_idx is None else self.rows_in_frame(frame_idx, class_name)
+        return [self.polygon(row) for row in rows if self.poly_offsets[row + 1] > self.poly_offsets[row]]
+
+    def boxes(self, frame_idx, class_name):
+        """(K, 4) xyxy boxes of one class in one frame."""
+        return self.xyxy[self.rows_in_frame(frame_idx, class_name)]
+
+
+class BatchDetectionsBuilder:
+    """Collects detections frame by frame as arrays and packs them into a BatchDetections."""
+
+    def __init__(self, class_names, frame_count, image_height):
+        self._class_names = class_names
+        self._frame_count = frame_count
+        self._image_height = image_height
+        self._chunks = []  # (frame_index, class_id, confidence, track_id, xyxy, polygons)
+
+    def add(self, frame_idx, class_id, confidence, xyxy, track_id=None, polygons=None):
+        """
+        Append the detections of one frame. Frames must be added in order.
+        polygons, if given, is a list aligned with the rows (None / empty for box rows).
+        """
+        count = len(class_id)
+        if count == 0:
+            return
+        self._chunks.append((
+            np.full(count, frame_idx, dtype=np.int32),
+            np.asarray(class_id, dtype=np.int32),
+            np.asarray(confidence, dtype=np.float32),
+            np.full(count, -1, dtype=np.int32) if track_id is None else np.asarray(track_id, dtype=np.int32),
+            np.asarray(xyxy, dtype=np.float32).reshape(count, 4),
+            polygons if polygons is not None else [None] * count,
+        ))
+
+    def build(self):
+        if not self._chunks:
+            return BatchDetections(
+                self._class_names, self._frame_count, self._image_height,
+                np.empty(0, np.int32), np.empty(0, np.int32), np.empty(0, np.float32),
+                np.empty(0, np.int32), np.empty((0, 4), np.float32),
+                np.zeros(1, np.int64), _EMPTY_POLYGON,
+            )
+
+        frame_index, class_id, confidence, track_id, xyxy, polygon_lists = zip(*self._chunks)
+        polygons = [
+            _EMPTY_POLYGON if poly is None else np.asarray(poly, dtype=np.float32).reshape(-1, 2)
+            for chunk in polygon_lists for poly in chunk
+        ]
+        poly_offsets = np.zeros(len(polygons) + 1, dtype=np.int64)
+        np.cumsum([len(poly) for poly in polygons], out=poly_offsets[1:])
+
+        return BatchDetections(
+            self._class_names, self._frame_count, self._image_height,
+            np.concatenate(frame_index), np.concatenate(class_id), np.concatenate(confidence),
+            np.concatenate(track_id), np.concatenate(xyxy),
+            poly_offsets, np.concatenate(polygons) if polygons else _EMPTY_POLYGON,
+        )
@@ -0,0 +1,53 @@
+# --- 📤 MODEL EXPORT ---
+# Produces the ONNX / OpenVINO artifacts that inference_backend.py loads, next to the .pt files:
+#   traffic_model.onnx, traffic_model_int8.onnx,
+#   traffic_model_openvino_model/, traffic_model_int8_openvino_model/   (same for lpr_model)
+#
+#   python export_models.py --formats onnx openvino
+#   python export_models.py --formats onnx openvino --int8 --data calibration.yaml
+#
+# INT8 needs a calibration dataset (an Ultralytics dataset yaml with a few hundred real
+# frames from the phones, and plate crops for the LPR model: --lpr-data).
+import argparse
+
+from ultralytics import YOLO
+
+from utils import LPR_INPUT_HEIGHT, LPR_INPUT_WIDTH
+
+TRAFFIC_WEIGHTS = "traffic_model.pt"
+LPR_WEIGHTS = "lpr_model.pt"
+TRAFFIC_IMGSZ = 640
+# Static export at the exact letterboxed plate size read_license_plates() feeds the model.
+LPR_IMGSZ = (LPR_INPUT_HEIGHT, LPR_INPUT_WIDTH)
+
+
+def export_model(weights, task, imgsz, backend, int8=False, data=None):
+    model = YOLO(weights, task=task)
+    kwargs = {"format": backend, "imgsz": imgsz}
+    if int8:
+        kwargs.update(quantize=8, data=data)
+    path = model.export(**kwargs)
+    print(f"✅ {weights} -> {path}")
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the traffic and LPR models for the CPU backends.")
+    parser.add_argument("--formats", nargs="+", choices=["onnx", "openvino"], default=["onnx", "openvino"])
+    parser.add_argument("--int8", action="store_true", help="also export INT8-quantized variants")
+    parser.add_argument("--data", help="calibration dataset yaml for the traffic model (INT8 only)")
+    parser.add_argument("--lpr-data", help="calibration dataset yaml for the LPR model (INT8 only)")
+    args = parser.parse_args()
+    if args.int8 and not (args.data and args.lpr_data):
+        parser.error("--int8 needs --data and --lpr-data calibration datasets")
+
+    for backend in args.formats:
+        export_model(TRAFFIC_WEIGHTS, "segment", TRAFFIC_IMGSZ, backend)
+        export_model(LPR_WEIGHTS, "detect", LPR_IMGSZ, backend)
+        if args.int8:
+            export_model(TRAFFIC_WEIGHTS, "segment", TRAFFIC_IMGSZ, backend, int8=True, data=args.data)
+            export_model(LPR_WEIGHTS, "detect", LPR_IMGSZ, backend, int8=True, data=args.lpr_data)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+# --- ✂️ FRAME FILTER ---
+# Pre-inference stage of a session, in front of predict():
+#   * Region of interest: the hood and the sky never hold lanes or plates, so YOLO only sees a
+#     crop of the frame. The ROI is either fixed (PV_ROI) or learned per session from where
+#     detections actually show up; every PV_ROI_REFRESH_BATCHES-th batch runs on the full
+#     frame so the learned ROI keeps following the mount and the road.
+#   * Near-duplicate frames: when a downsampled grayscale diff against the last analyzed frame
+#     is tiny (stopped at a light), the frame is not sent to YOLO. It reuses the previous
+#     detections, which still go through the tracker, so track state advances frame by frame.
+# Both are off by default. Offsets returned here map crop coordinates back to the detection
+# frame; _build_detections applies them before scaling to full resolution.
+import os
+from collections import deque
+
+import cv2
+import numpy as np
+
+from logging_config import get_logger
+
+ROI_MODE = os.getenv("PV_ROI_MODE", "off").lower()               # off | fixed | auto
+# Fixed ROI as fractions of the frame: "x1,y1,x2,y2".
+ROI_FIXED = tuple(float(v) for v in os.getenv("PV_ROI", "0,0,1,1").split(","))
+# Auto ROI: full-frame batches observed before the first crop, and the full-frame cadence after.
+ROI_LEARN_BATCHES = int(os.getenv("PV_ROI_LEARN_BATCHES", "20"))
+ROI_REFRESH_BATCHES = int(os.getenv("PV_ROI_REFRESH_BATCHES", "25"))
+# Extra band kept around the learned detection extent (fraction of the frame height).
+ROI_MARGIN = float(os.getenv("PV_ROI_MARGIN", "0.05"))
+
+STATIC_FRAME_SKIP = os.getenv("PV_STATIC_FRAME_SKIP", "0") == "1"
+# Mean absolute gray-level difference (0-255) of the thumbnails below which frames count as duplicates.
+STATIC_DIFF_THRESHOLD = float(os.getenv("PV_STATIC_DIFF_THRESHOLD", "2.0"))
+# A static scene is still re-detected after this many reused frames (e.g. the light turns green).
+STATIC_MAX_CONSECUTIVE = int(os.getenv("PV_STATIC_MAX_CONSECUTIVE", "4"))
+
+_THUMB_SIZE = (64, 36)
+_LEARNED_EXTENTS = 4000  # most recent detection y-extents kept for the auto ROI
+
+logger = get_logger(__name__)
+
+
+def _thumbnail(image):
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(gray, _THUMB_SIZE, interpolation=cv2.INTER_AREA).astype(np.int16)
+
+
+class FrameFilter:
+    """ROI + near-duplicate state of one session."""
+
+    def __init__(self, roi_mode=ROI_MODE, static_skip=STATIC_FRAME_SKIP):
+        self.roi_mode = roi_mode
+        self.static_skip = static_skip
+        self._batches = 0
+        self._y_extents = deque(maxlen=_LEARNED_EXTENTS)  # (y1, y2) as fractions of the frame height
+        self._last_roi = None
+        self._last_thumb = None
+        self._last_result = None  # (predict result, offset) of the last analyzed frame
+        self._consecutive_skips = 0
+
+    def _roi_fractions(self):
+        if self.roi_mode == "fixed":
+            return ROI_FIXED
+        if self.roi_mode == "auto" and self._batches >= ROI_LEARN_BATCHES \
+                and self._batches % ROI_REFRESH_BATCHES and self._y_extents:
+            extents = np.array(self._y_extents)
+            top = max(0.0, np.percentile(extents[:, 0], 1) - ROI_MARGIN)
+            bottom = min(1.0, np.percentile(extents[:, 1], 99) + ROI_MARGIN)
+            return 0.0, top, 1.0, bottom
+        return 0.0, 0.0, 1.0, 1.0
+
+    def select(self, frames):
+        """
+        Plan one batch. Returns (crops to send to YOLO, roi) where roi is (x0, y0, x1, y1)
+        in detection pixels. run_mask then tells, per frame, whether it is analyzed (True)
+        or reuses the previous detections.
+        """
+        height, width = frames[0].shape[:2]
+        fx1, fy1, fx2, fy2 = self._roi_fractions()
+        roi = (int(fx1 * width), int(fy1 * height), max(int(fx1 * width) + 1, int(fx2 * width)),
+               max(int(fy1 * height) + 1, int(fy2 * height)))
+        self._batches += 1
+        if roi != self._last_roi:
+            self._last_roi = roi
+            self._last_thumb = None  # thumbnails of different crops don't compare
+
+        x0, y0, x1, y1 = roi
+        crops = [frame[y0:y1, x0:x1] for frame in frames]
+        self.run_mask = []
+        to_run = []
+        for crop in crops:
+            thumb = _thumbnail(crop) if self.static_skip else None
+            duplicate = (
+                thumb is not None and self._last_thumb is not None
+                and self._consecutive_skips < STATIC_MAX_CONSECUTIVE
+                and np.abs(thumb - self._last_thumb).mean() < STATIC_DIFF_THRESHOLD
+            )
+            if duplicate:
+                self._consecutive_skips += 1
+            else:
+                self._last_thumb = thumb
+                self._consecutive_skips = 0
+                to_run.append(crop)
+            self.run_mask.append(not duplicate)
+
+        skipped = len(frames) - len(to_run)
+        if skipped or roi != (0, 0, width, height):
+            logger.info("✂️ Frame filter: ROI %s of %dx%d, %d/%d near-duplicate frame(s) reused",
+                        roi, width, height, skipped, len(frames), extra={"stage": "frame_filter"})
+        return to_run, roi
+
+    def assemble(self, run_results, roi):
+        """
+        One (predict result, (x offset, y offset)) per frame of the planned batch: analyzed
+        frames get their own result, duplicates the most recent analyzed one.
+        """
+        offset = roi[:2]
+        results, offsets = [], []
+        run_results = iter(run_results)
+        for analyzed in self.run_mask:
+            if analyzed:
+                self._last_result = (next(run_results), offset)
+            result, result_offset = self._last_result
+            results.append(result)
+            offsets.append(result_offset)
+        return results, offsets
+
+    def observe(self, detections, roi, frame_shape):
+        """Learn the auto ROI from batches that ran on the whole frame."""
+        if self.roi_mode != "auto" or roi != (0, 0, frame_shape[1], frame_shape[0]) or not len(detections):
+            return
+        ys = detections.xyxy[:, [1, 3]] / detections.image_height
+        self._y_extents.extend(map(tuple, ys))
@@ -0,0 +1,55 @@
+# --- ⚙️ INFERENCE BACKEND ---
+# The server runs on CPU, where exported ONNX Runtime / OpenVINO models are much faster and
+# lighter than eager PyTorch. PV_INFERENCE_BACKEND picks the format and PV_INFERENCE_PRECISION
+# the FP32 or INT8 variant. The artifacts are produced ahead of time by export_models.py and
+# sit next to the .pt weights under the names Ultralytics exports them with. Ultralytics loads
+# them behind the same YOLO API, so predict() and the results look the same to the rest of the
+# server. When an artifact or its runtime is missing, the .pt weights are used instead.
+import importlib.util
+import os
+
+from ultralytics import YOLO
+
+from logging_config import get_logger
+
+INFERENCE_BACKEND = os.getenv("PV_INFERENCE_BACKEND", "torch").lower()       # torch | onnx | openvino
+INFERENCE_PRECISION = os.getenv("PV_INFERENCE_PRECISION", "fp32").lower()    # fp32 | int8
+
+BACKENDS = ("torch", "onnx", "openvino")
+PRECISIONS = ("fp32", "int8")
+# Python package each exported format needs at runtime.
+_RUNTIME_PACKAGES = {"onnx": "onnxruntime", "openvino": "openvino"}
+
+logger = get_logger(__name__)
+
+
+def exported_model_path(weights, backend, precision="fp32"):
+    """Where export_models.py puts the backend/precision variant of a .pt file."""
+    stem = os.path.splitext(weights)[0]
+    int8 = "_int8" if precision == "int8" else ""
+    if backend == "onnx":
+        return f"{stem}{int8}.onnx"
+    if backend == "openvino":
+        return f"{stem}{int8}_openvino_model"
+    return weights
+
+
+def load_yolo(weights, task, backend=INFERENCE_BACKEND, precision=INFERENCE_PRECISION):
+    """YOLO model for weights on the configured backend, falling back to the .pt weights."""
+    if backend not in BACKENDS or precision not in PRECISIONS:
+        raise ValueError(f"Unknown inference backend '{backend}' / precision '{precision}'")
+    if backend == "torch":
+        return YOLO(weights, task=task)
+
+    path = exported_model_path(weights, backend, precision)
+    runtime = _RUNTIME_PACKAGES[backend]
+    if not os.path.exists(path):
+        logger.warning("⚠️ %s not found (run export_models.py) — falling back to PyTorch %s", path, weights)
+        return YOLO(weights, task=task)
+    # Checked up front: Ultralytics would otherwise try to pip-install it on the first predict().
+    if importlib.util.find_spec(runtime) is None:
+        logger.warning("⚠️ %s is not installed — falling back to PyTorch %s", runtime, weights)
+        return YOLO(weights, task=task)
+
+    logger.info("⚙️ Loading %s (%s, %s)", path, backend, precision)
+    return YOLO(path, task=task)
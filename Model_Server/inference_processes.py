@@ -0,0 +1,305 @@
+# --- 🏭 INFERENCE WORKER PROCESSES ---
+# predict() for the detection and LPR models in a fixed pool of worker processes, so inference
+# is not bound by the server's GIL and one torch thread pool. Each worker loads its own model
+# bundle and runs PV_WORKER_TORCH_THREADS intra-op threads (default: the CPU cores split evenly).
+#
+# Frames go through a shared-memory ring buffer per worker: the server copies the decoded
+# images in once, the worker reads them in place (no pickling). Requests and the compact
+# replies (box arrays + line contours) travel over a multiprocessing connection.
+# Tracking, the rules and all session state stay in the server process.
+#
+# ProcessModelPool is a drop-in for ModelPool: bundle.model / bundle.lpr_model have .names and
+# .predict(images, **kwargs), returning Results-like objects with .boxes and .masks[rows].xy.
+# Workers are started as `python inference_processes.py` subprocesses rather than via
+# multiprocessing spawn, which would re-import app.py (and its models) in every child.
+import atexit
+import os
+import queue
+import secrets
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing import resource_tracker
+from multiprocessing.connection import Client, Listener, wait
+from multiprocessing.shared_memory import SharedMemory
+from types import SimpleNamespace
+
+import numpy as np
+
+from model_pool import ModelPool
+
+INFERENCE_PROCESSES = int(os.getenv("PV_INFERENCE_PROCESSES", "0"))  # 0 = predict in the server process
+WORKER_TORCH_THREADS = int(os.getenv("PV_WORKER_TORCH_THREADS", "0"))  # 0 = cores / processes
+# Per worker. A request that doesn't fit is sent through the connection instead (pickled).
+FRAME_RING_MB = int(os.getenv("PV_FRAME_RING_MB", "64"))
+WORKER_STARTUP_TIMEOUT_SECONDS = float(os.getenv("PV_WORKER_STARTUP_TIMEOUT_SECONDS", "300"))
+
+_ALIGN = 64
+
+
+class FrameRing:
+    """Shared-memory byte ring: each write takes the next free region, wrapping to the start."""
+
+    def __init__(self, size_bytes=None, name=None):
+        if name is None:
+            self.shm = SharedMemory(create=True, size=size_bytes)
+        else:
+            self.shm = _attach_shared_memory(name)
+        self.name = self.shm.name
+        self._head = 0
+
+    def write(self, arrays):
+        """Copy arrays into the ring. Returns their (offset, shape, dtype) descriptors, None if too big."""
+        arrays = [np.asarray(a) for a in arrays]
+        sizes = [-(-a.nbytes // _ALIGN) * _ALIGN for a in arrays]
+        if sum(sizes) > self.shm.size:
+            return None
+        if self._head + sum(sizes) > self.shm.size:
+            self._head = 0
+        descriptors = []
+        for array, size in zip(arrays, sizes):
+            np.copyto(np.ndarray(array.shape, array.dtype, buffer=self.shm.buf, offset=self._head), array)
+            descriptors.append((self._head, array.shape, array.dtype.str))
+            self._head += size
+        return descriptors
+
+    def views(self, descriptors):
+        """Zero-copy arrays over the regions of a write()."""
+        return [np.ndarray(shape, np.dtype(dtype), buffer=self.shm.buf, offset=offset)
+                for offset, shape, dtype in descriptors]
+
+    def close(self, unlink=False):
+        try:
+            self.shm.close()
+        except BufferError:  # a view is still alive somewhere; the OS frees it with the process
+            pass
+        if unlink:
+            self.shm.unlink()
+
+
+def _attach_shared_memory(name):
+    # The server owns (and unlinks) the segment; the worker's resource tracker must not.
+    try:
+        return SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        shm = SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+class PredictedFrame:
+    """The parts of an Ultralytics Results the server uses, rebuilt from a worker's reply."""
+
+    def __init__(self, boxes, orig_shape, polygons=None):
+        from ultralytics.engine.results import Boxes
+
+        self.boxes = Boxes(boxes, orig_shape)
+        self.masks = LinePolygons(polygons) if polygons is not None else None
+        self.orig_shape = orig_shape
+        self.orig_img = None
+
+
+class LinePolygons:
+    """Stand-in for Results.masks: contours of the line-class rows only, via masks[rows].xy."""
+
+    def __init__(self, xy):
+        self._xy = xy  # box row -> (N, 2) contour
+
+    def __getitem__(self, rows):
+        return SimpleNamespace(xy=[self._xy[int(row)] for row in rows])
+
+
+def _compact_result(result, polygon_class_ids):
+    # Boxes as one (N, 6|7) array; contours only for the rows the server turns into polygons.
+    boxes = result.boxes.cpu().numpy().data if result.boxes is not None else np.zeros((0, 6), np.float32)
+    polygons = None
+    if result.masks is not None:
+        rows = np.flatnonzero(np.isin(boxes[:, -1].astype(int), polygon_class_ids))
+        polygons = dict(zip(rows.tolist(), result.masks[rows].xy)) if len(rows) else {}
+    return boxes, tuple(result.orig_shape), polygons
+
+
+class _RemoteModel:
+    def __init__(self, worker, attr, names):
+        self._worker = worker
+        self._attr = attr
+        self.names = names
+
+    def predict(self, images, **kwargs):
+        return self._worker.call(self._attr, images, kwargs)
+
+
+class InferenceProcess:
+    """One worker subprocess with its frame ring and connection."""
+
+    def __init__(self, index, listener, authkey, torch_threads, ring_bytes, polygon_class_names):
+        self.index = index
+        self.ring = FrameRing(ring_bytes)
+        self._lock = threading.Lock()
+        server_dir = os.path.dirname(os.path.abspath(__file__))
+        threads = str(torch_threads)
+        env = {**os.environ, "PV_WORKER_AUTHKEY": authkey.hex(), "OMP_NUM_THREADS": threads, "MKL_NUM_THREADS": threads}
+        self.process = subprocess.Popen([
+            sys.executable, os.path.join(server_dir, "inference_processes.py"),
+            "--address", str(listener.address), "--index", str(index), "--ring", self.ring.name,
+            "--torch-threads", threads, "--polygon-classes", ",".join(sorted(polygon_class_names)),
+        ], env=env)
+        self._conn = None
+        self.model = self.lpr_model = None
+
+    def connected(self, names):
+        self.model = _RemoteModel(self, "model", names["model"])
+        self.lpr_model = _RemoteModel(self, "lpr_model", names["lpr_model"])
+
+    def call(self, attr, images, kwargs):
+        with self._lock:
+            descriptors = self.ring.write(images)
+            inline = None if descriptors is not None else [np.asarray(image) for image in images]
+            self._conn.send((attr, descriptors, inline, kwargs))
+            status, payload = self._conn.recv()
+        if status != "ok":
+            raise RuntimeError(f"Inference worker {self.index} failed: {payload}")
+        return [PredictedFrame(boxes, shape, polygons) for boxes, shape, polygons in payload]
+
+    def close(self):
+        if self._conn is not None:
+            try:
+                self._conn.send(None)
+                self._conn.close()
+            except OSError:
+                pass
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        self.ring.close(unlink=True)
+
+
+class ProcessModelPool(ModelPool):
+    """ModelPool whose bundles live in worker processes."""
+
+    def __init__(self, size, polygon_class_names=(), torch_threads=WORKER_TORCH_THREADS,
+                 ring_mb=FRAME_RING_MB, startup_timeout=WORKER_STARTUP_TIMEOUT_SECONDS):
+        size = max(1, size)
+        torch_threads = torch_threads or max(1, (os.cpu_count() or 1) // size)
+        authkey = secrets.token_bytes(32)
+        listener = Listener(authkey=authkey)
+        self._workers = workers = []
+        atexit.register(self.close)
+        for k in range(size):
+            workers.append(InferenceProcess(k, listener, authkey, torch_threads, ring_mb * 1024 * 1024, polygon_class_names))
+        deadline = time.monotonic() + startup_timeout
+        try:
+            # Workers connect first, then load their models in parallel and report ready.
+            self._accept_workers(listener, deadline)
+            self._wait_until_ready(deadline)
+        except BaseException:
+            self.close()
+            raise
+        finally:
+            listener.close()
+        super().__init__(size, loader=iter(workers).__next__)
+
+    def _check_alive(self):
+        for worker in self._workers:
+            code = worker.process.poll()
+            if code is not None:
+                raise RuntimeError(f"Inference worker {worker.index} exited with code {code} during startup "
+                                   "(see its output above)")
+
+    def _accept_workers(self, listener, deadline):
+        # Listener.accept() has no timeout: it runs on a helper thread while this one keeps an
+        # eye on the deadline and on workers that die before they ever connect.
+        accepted = queue.Queue()
+
+        def accept_all():
+            for _ in self._workers:
+                try:
+                    accepted.put(listener.accept())
+                except OSError:  # listener closed: startup was abandoned
+                    return
+        threading.Thread(target=accept_all, name="inference-accept", daemon=True).start()
+
+        for _ in self._workers:
+            while True:
+                self._check_alive()
+                try:
+                    conn = accepted.get(timeout=0.2)
+                    break
+                except queue.Empty:
+                    if time.monotonic() > deadline:
+                        raise RuntimeError("Inference workers did not connect within the startup timeout")
+            self._workers[conn.recv()]._conn = conn
+
+    def _wait_until_ready(self, deadline):
+        waiting = {worker._conn: worker for worker in self._workers}
+        while waiting:
+            self._check_alive()
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Inference worker(s) {sorted(w.index for w in waiting.values())} "
+                                   "did not load their models within the startup timeout")
+            for conn in wait(list(waiting), timeout=0.2):
+                worker = waiting.pop(conn)
+                try:
+                    status, payload = conn.recv()
+                except EOFError:
+                    raise RuntimeError(f"Inference worker {worker.index} exited while loading its models") from None
+                if status != "ready":
+                    raise RuntimeError(f"Inference worker {worker.index} failed to start: {payload}")
+                worker.connected(payload)
+
+    def close(self):
+        for worker in self._workers:
+            worker.close()
+        self._workers = []
+
+
+def _worker_main(args):
+    conn = Client(args.address, authkey=bytes.fromhex(os.environ["PV_WORKER_AUTHKEY"]))
+    conn.send(args.index)
+    try:
+        import torch
+        from logging_config import configure_logging
+        from model_pool import load_model_bundle
+
+        torch.set_num_threads(args.torch_threads)
+        configure_logging()
+        bundle = load_model_bundle()
+        polygon_classes = set(filter(None, args.polygon_classes.split(",")))
+        polygon_class_ids = [cid for cid, name in bundle.model.names.items() if name in polygon_classes]
+        ring = FrameRing(name=args.ring)
+    except Exception as e:
+        conn.send(("error", repr(e)))
+        raise
+    conn.send(("ready", {"model": bundle.model.names, "lpr_model": bundle.lpr_model.names}))
+
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            break
+        if request is None:
+            break
+        attr, descriptors, inline, kwargs = request
+        try:
+            images = ring.views(descriptors) if descriptors is not None else inline
+            results = getattr(bundle, attr).predict(images, **kwargs)
+            reply = ("ok", [_compact_result(result, polygon_class_ids) for result in results])
+            del images, results  # drop every view into the ring before the next request
+        except Exception as e:
+            reply = ("error", repr(e))
+        conn.send(reply)
+    ring.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="PatrolVision inference worker (started by ProcessModelPool).")
+    parser.add_argument("--address", required=True)
+    parser.add_argument("--index", type=int, required=True)
+    parser.add_argument("--ring", required=True)
+    parser.add_argument("--torch-threads", type=int, default=1)
+    parser.add_argument("--polygon-classes", default="")
+    _worker_main(parser.parse_args())
@@ -0,0 +1,248 @@
+# --- 🏋️ LOAD TEST ---
+# Simulates many patrol phones against /analyze_batch, the way LiveCameraScreen.js drives it:
+# every client captures frames at --fps, sends them in batches of 4 while no upload of its own
+# is in flight, and otherwise drops its oldest buffered frame. Each client has its own session.
+# Reports throughput, latency percentiles, error rate and the frames the clients dropped.
+#
+#   python load_test.py --url http://localhost:7860 --clients 8 --frames samples/drive1
+#   python load_test.py --local --clients 4 --duration 30     # no network: stand-in models
+#
+# --local starts this server in a subprocess (uvicorn, 127.0.0.1) inside a temp folder with
+# small randomly initialized YOLO models built from the Ultralytics yaml configs (same classes
+# as the real ones). They measure the serving pipeline, not detection quality.
+import argparse
+import glob
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+import cv2
+import numpy as np
+
+FRAMES_BATCH_SIZE = 4      # same as LiveCameraScreen.js
+REQUEST_TIMEOUT_SECONDS = 10.0  # the app's axios timeout
+
+TRAFFIC_CLASS_NAMES = ["car", "bus", "truck", "solid_line", "bus line", "stop_line", "dashed_line",
+                       "traffic_light_red", "traffic_light_green", "taxi_hat", "license_plate"]
+LPR_CLASS_NAMES = ["zero", "one", "two", "three", "four", "five", "six", "seven", "eight", "nine"]
+
+
+def load_jpegs(folder, limit, size):
+    """JPEG bytes of a recorded frame sequence, in order (synthetic frames if there is none)."""
+    if folder:
+        paths = sorted(glob.glob(os.path.join(folder, "*.jp*g")))[:limit]
+        if paths:
+            return [open(path, "rb").read() for path in paths]
+        print(f"⚠️ No JPEGs found in {folder}, using synthetic frames")
+    rng = np.random.default_rng(0)
+    width, height = size
+    frames = []
+    for _ in range(min(limit, 32)):
+        image = cv2.GaussianBlur(rng.integers(0, 255, (height, width, 3), dtype=np.uint8), (0, 0), 3)
+        frames.append(cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 85])[1].tobytes())
+    return frames
+
+
+def _multipart(fields, files):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for k, data in enumerate(files):
+        parts.append((f'--{boundary}\r\nContent-Disposition: form-data; name="files"; filename="frame_{k}.jpg"\r\n'
+                      f'Content-Type: image/jpeg\r\n\r\n').encode() + data + b"\r\n")
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = []   # seconds, successful batches
+        self.ok = 0
+        self.busy = 0         # 503 from admission control
+        self.errors = 0       # other HTTP errors, timeouts, connection failures
+        self.captured = 0
+        self.dropped = 0
+        self.violations = 0
+
+
+class PhoneClient:
+    """One simulated phone: capture loop at fps + at most one upload in flight."""
+
+    def __init__(self, index, url, frames, fps, stats, stop):
+        self.url = url.rstrip("/") + "/analyze_batch"
+        self.frames = frames
+        self.interval = 1.0 / fps
+        self.stats = stats
+        self.stop = stop
+        self.session_id = f"load-{uuid.uuid4().hex[:8]}-{index}"
+        self.offset = index * 7  # clients don't all replay the same frame at the same time
+        self.buffer = []
+        self.uploading = threading.Event()
+
+    def run(self):
+        next_capture = time.perf_counter()
+        k = 0
+        while not self.stop.is_set():
+            self.buffer.append(self.frames[(self.offset + k) % len(self.frames)])
+            k += 1
+            with self.stats.lock:
+                self.stats.captured += 1
+            if len(self.buffer) >= FRAMES_BATCH_SIZE and not self.uploading.is_set():
+                batch, self.buffer = self.buffer, []
+                self.uploading.set()
+                threading.Thread(target=self._upload, args=(batch,), daemon=True).start()
+            elif len(self.buffer) >= FRAMES_BATCH_SIZE:
+                self.buffer.pop(0)  # drop-oldest while the previous upload is in flight
+                with self.stats.lock:
+                    self.stats.dropped += 1
+            next_capture += self.interval
+            time.sleep(max(0.0, next_capture - time.perf_counter()))
+
+    def _upload(self, batch):
+        body, content_type = _multipart({"session_id": self.session_id, "batch_id": uuid.uuid4().hex}, batch)
+        request = urllib.request.Request(self.url, data=body, headers={"Content-Type": content_type})
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT_SECONDS) as response:
+                body = json.loads(response.read())
+            elapsed = time.perf_counter() - started
+            with self.stats.lock:
+                self.stats.ok += 1
+                self.stats.latencies.append(elapsed)
+                self.stats.violations += len(body.get("violations", []))
+        except urllib.error.HTTPError as e:
+            with self.stats.lock:
+                if e.code == 503:
+                    self.stats.busy += 1
+                else:
+                    self.stats.errors += 1
+        except (urllib.error.URLError, OSError, ValueError):  # ValueError: a body that is not JSON
+            with self.stats.lock:
+                self.stats.errors += 1
+        finally:
+            self.uploading.clear()
+
+
+def build_standin_models(directory):
+    """Random-weight nano YOLO models with the real class names, saved as the server expects them."""
+    import yaml
+    from ultralytics import YOLO
+    from ultralytics.utils import ROOT
+
+    for config, names, weights in (("yolov8-seg.yaml", TRAFFIC_CLASS_NAMES, "traffic_model.pt"),
+                                   ("yolov8.yaml", LPR_CLASS_NAMES, "lpr_model.pt")):
+        with open(ROOT / "cfg" / "models" / "v8" / config, encoding="utf-8") as f:
+            cfg = yaml.safe_load(f)
+        cfg.update(nc=len(names), names=dict(enumerate(names)), scale="n")
+        # The "n" in the file name is what tells Ultralytics to build the nano scale.
+        cfg_path = os.path.join(directory, config.replace("yolov8", "yolov8n"))
+        with open(cfg_path, "w", encoding="utf-8") as f:
+            yaml.safe_dump(cfg, f)
+        model = YOLO(cfg_path)
+        model.model.names = cfg["names"]
+        model.save(os.path.join(directory, weights))
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_local_server(directory, startup_timeout=180):
+    """uvicorn app:app on a free local port, with the models in directory. Returns (process, url)."""
+    port = _free_port()
+    server_dir = os.path.dirname(os.path.abspath(__file__))
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [server_dir, os.environ.get("PYTHONPATH")])),
+           "YOLO_OFFLINE": "1"}
+    log = open(os.path.join(directory, "server.log"), "w")
+    process = subprocess.Popen([sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port)],
+                               cwd=directory, env=env, stdout=log, stderr=subprocess.STDOUT)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + startup_timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Local server exited, see {log.name}")
+        try:
+            urllib.request.urlopen(url + "/", timeout=1).read()
+            return process, url
+        except OSError:
+            time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError(f"Local server did not come up within {startup_timeout}s, see {log.name}")
+
+
+def run_load(url, frames, clients, fps, duration):
+    stats, stop = Stats(), threading.Event()
+    phones = [PhoneClient(k, url, frames, fps, stats, stop) for k in range(clients)]
+    threads = [threading.Thread(target=phone.run, daemon=True) for phone in phones]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    # let the last uploads finish (or time out)
+    deadline = time.perf_counter() + REQUEST_TIMEOUT_SECONDS
+    while any(phone.uploading.is_set() for phone in phones) and time.perf_counter() < deadline:
+        time.sleep(0.05)
+    return stats, time.perf_counter() - started
+
+
+def report(stats, elapsed, clients, fps):
+    sent = stats.ok + stats.busy + stats.errors
+    print(f"\n🏋️ {clients} client(s) at {fps:g} fps for {elapsed:.1f}s")
+    print(f"   batches: {sent} sent, {stats.ok} ok, {stats.busy} busy (503), {stats.errors} failed")
+    print(f"   throughput: {stats.ok / elapsed:.2f} batches/s, {stats.ok * FRAMES_BATCH_SIZE / elapsed:.1f} frames/s")
+    if stats.latencies:
+        p50, p95, p99 = np.percentile(np.asarray(stats.latencies) * 1000, [50, 95, 99])
+        print(f"   latency: p50 {p50:.0f} ms, p95 {p95:.0f} ms, p99 {p99:.0f} ms")
+    print(f"   error rate: {(stats.busy + stats.errors) / sent:.1%}" if sent else "   error rate: n/a (nothing sent)")
+    print(f"   client-side drops: {stats.dropped}/{stats.captured} captured frames "
+          f"({stats.dropped / max(stats.captured, 1):.1%})")
+    print(f"   violations returned: {stats.violations}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate concurrent patrol phones against /analyze_batch.")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--url", help="base URL of a running Model_Server")
+    target.add_argument("--local", action="store_true", help="start a local server with stand-in models")
+    parser.add_argument("--frames", help="folder with a recorded JPEG sequence (sorted by name)")
+    parser.add_argument("--frame-limit", type=int, default=240)
+    parser.add_argument("--synthetic-size", default="1280x720", help="WxH of synthetic frames without --frames")
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--fps", type=float, default=6.0, help="capture rate per phone (the app aims for ~6)")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of load")
+    args = parser.parse_args()
+
+    frames = load_jpegs(args.frames, args.frame_limit, tuple(map(int, args.synthetic_size.split("x"))))
+    process = None
+    with tempfile.TemporaryDirectory(prefix="pv-load-") as directory:
+        try:
+            url = args.url
+            if args.local:
+                print("🧪 Building stand-in models and starting a local server...")
+                build_standin_models(directory)
+                process, url = start_local_server(directory)
+            stats, elapsed = run_load(url, frames, args.clients, args.fps, args.duration)
+            report(stats, elapsed, args.clients, args.fps)
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait(timeout=30)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# --- 🪵 LOGGING ---
+# Level-gated, structured logging for the server. Request threads only put records on a queue
+# (QueueHandler); a QueueListener thread formats them and does the actual stdout I/O.
+#
+# Every record carries the fields session, batch, track and stage. session / batch come from
+# log_context() around the work of one batch; track / stage are passed per call through
+# extra={...}. Per-vehicle reasoning of the rules is logged at DEBUG, so it is off unless
+# PV_LOG_LEVEL=DEBUG. PV_LOG_FORMAT=json writes one JSON object per line for log shippers.
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+from contextlib import contextmanager
+
+LOG_LEVEL = os.getenv("PV_LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("PV_LOG_FORMAT", "text").lower()  # text | json
+
+FIELDS = ("session", "batch", "track", "stage")
+_ROOT_LOGGER = "patrolvision"
+
+_context = contextvars.ContextVar("patrolvision_log_context", default={})
+_listener = None
+
+
+@contextmanager
+def log_context(**fields):
+    """Attach fields (e.g. session=..., batch=...) to every record logged inside the block."""
+    token = _context.set({**_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+def current_log_context():
+    """The fields set by the enclosing log_context() blocks."""
+    return dict(_context.get())
+
+
+class _ContextFilter(logging.Filter):
+    # Runs on the logging thread, before the record is queued: the context var is only visible there.
+    def filter(self, record):
+        context = _context.get()
+        for field in FIELDS:
+            if getattr(record, field, None) is None:
+                setattr(record, field, context.get(field))
+        return True
+
+
+class _TextFormatter(logging.Formatter):
+    def format(self, record):
+        message = super().format(record)
+        fields = " ".join(f"{field}={getattr(record, field)}" for field in FIELDS if getattr(record, field, None) is not None)
+        return f"{message} [{fields}]" if fields else message
+
+
+class _JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update({field: getattr(record, field) for field in FIELDS if getattr(record, field, None) is not None})
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def configure_logging(level=LOG_LEVEL, fmt=LOG_FORMAT):
+    """Install the queue handler on the 'patrolvision' logger and start the writer thread. Idempotent."""
+    global _listener
+    if _listener is not None:
+        return
+    stream_handler = logging.StreamHandler(sys.stdout)
+    if fmt == "json":
+        stream_handler.setFormatter(_JsonFormatter())
+    else:
+        stream_handler.setFormatter(_TextFormatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(_ContextFilter())
+
+    root = logging.getLogger(_ROOT_LOGGER)
+    root.setLevel(level)
+    root.addHandler(queue_handler)
+    root.propagate = False
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    _listener.start()
+    atexit.register(_listener.stop)  # flushes what is still queued
+
+
+def get_logger(name):
+    """Logger under the 'patrolvision' hierarchy, e.g. get_logger(__name__)."""
+    return logging.getLogger(f"{_ROOT_LOGGER}.{name}")
@@ -0,0 +1,36 @@
+# --- 🧰 MODEL POOL ---
+# Ultralytics predictors are not thread-safe: a YOLO object keeps its predictor, result
+# tensors and callbacks on the instance. Every inference worker therefore checks out its own
+# bundle of models for the duration of a batch, and returns it when done.
+import queue
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+from inference_backend import load_yolo
+
+
+def load_model_bundle(traffic_weights='traffic_model.pt', lpr_weights='lpr_model.pt'):
+    """Load one independent set of the detection and LPR models (on the configured backend)."""
+    return SimpleNamespace(
+        model=load_yolo(traffic_weights, task="segment"),    # .predict() only — all classes, masks intact
+        lpr_model=load_yolo(lpr_weights, task="detect"),     # license plate recognition
+    )
+
+
+class ModelPool:
+    """A fixed number of model bundles shared by the inference workers."""
+
+    def __init__(self, size, loader=load_model_bundle):
+        self.bundles = [loader() for _ in range(max(1, size))]
+        self._free = queue.Queue()
+        for bundle in self.bundles:
+            self._free.put(bundle)
+
+    @contextmanager
+    def acquire(self):
+        """Check out a bundle, blocking until one is free."""
+        bundle = self._free.get()
+        try:
+            yield bundle
+        finally:
+            self._free.put(bundle)
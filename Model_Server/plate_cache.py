@@ -0,0 +1,56 @@
+# --- 🔖 PLATE READ CACHE ---
+# The best valid plate read of every track in a session, kept across batches. Once a car's
+# plate has been read, later confirmations (next batch, another rule) reuse it, and LPR only
+# runs again on crops larger than the ones already read. A stable plate per track also keeps
+# the plate-based dedup in should_report_violation consistent.
+import os
+import time
+from collections import OrderedDict, namedtuple
+
+# Reads of tracks not seen for this long are dropped (the tracker has long lost them by then).
+PLATE_CACHE_TTL_SECONDS = float(os.getenv("PV_PLATE_CACHE_TTL_SECONDS", "60"))
+# Upper bound on cached tracks per session; the least recently seen one is evicted past it.
+PLATE_CACHE_MAX_TRACKS = int(os.getenv("PV_PLATE_CACHE_MAX_TRACKS", "512"))
+
+# text: valid 7/8-digit plate, confidence: mean digit confidence of that read,
+# area: largest plate crop (px²) already read for this track.
+PlateRead = namedtuple("PlateRead", ["text", "confidence", "area"])
+
+
+class PlateReadCache:
+    """track_id -> PlateRead for one session, with idle TTL and LRU eviction."""
+
+    def __init__(self, ttl_seconds=PLATE_CACHE_TTL_SECONDS, max_tracks=PLATE_CACHE_MAX_TRACKS):
+        self._ttl_seconds = ttl_seconds
+        self._max_tracks = max_tracks
+        self._reads = OrderedDict()  # track_id -> (PlateRead, last_seen), least recently seen first
+
+    def get(self, track_id, current_time=None):
+        """The cached read of track_id, or None. A hit keeps the entry alive."""
+        current_time = time.time() if current_time is None else current_time
+        self._evict_expired(current_time)
+        entry = self._reads.get(track_id)
+        if entry is None:
+            return None
+        self._reads[track_id] = (entry[0], current_time)
+        self._reads.move_to_end(track_id)
+        return entry[0]
+
+    def put(self, track_id, read, current_time=None):
+        current_time = time.time() if current_time is None else current_time
+        self._evict_expired(current_time)
+        self._reads[track_id] = (read, current_time)
+        self._reads.move_to_end(track_id)
+        while len(self._reads) > self._max_tracks:
+            self._reads.popitem(last=False)
+
+    def _evict_expired(self, current_time):
+        # Least recently seen entries sit at the front, so stop at the first one still alive.
+        while self._reads:
+            track_id, (_, last_seen) = next(iter(self._reads.items()))
+            if current_time - last_seen <= self._ttl_seconds:
+                break
+            del self._reads[track_id]
+
+    def __len__(self):
+        return len(self._reads)
@@ -0,0 +1,119 @@
+# --- 🎙️ BATCH RECORDER ---
+# Saves what the rule engine saw for every analyzed batch, so the rules can be re-run later
+# without the phones, the frames or the YOLO models (see replay.py and benchmark_rules.py).
+#
+# Turned on with PV_RECORD_DIR. One compressed .npz per batch, under one folder per session:
+#   <PV_RECORD_DIR>/<session>/<epoch ms>-<seq>.npz
+# holding the BatchDetections columns plus a JSON "meta" entry: session, batch id, the batch's
+# rule-clock timestamp, class names, per-frame sizes and the violations the server returned
+# (their plates are what the replay reads instead of running LPR).
+# Files are written by a background thread, off the request path.
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from detection_store import BatchDetections
+from logging_config import get_logger
+
+RECORD_DIR = os.getenv("PV_RECORD_DIR", "")
+
+_COLUMNS = ("frame_index", "class_id", "confidence", "track_id", "xyxy", "poly_offsets", "poly_points")
+
+logger = get_logger(__name__)
+
+
+def _safe_name(name):
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", str(name)) or "_"
+
+
+class BatchRecorder:
+    """Writes one recording per analyzed batch into directory."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._sequence = 0
+        self._lock = threading.Lock()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="recorder")
+
+    def record(self, session_id, batch_id, detections, frames, current_time, violations):
+        """frames: the batch's DecodedFrames (only their sizes are kept)."""
+        with self._lock:
+            self._sequence += 1
+            sequence = self._sequence
+        meta = {
+            "session": session_id,
+            "batch": batch_id,
+            "current_time": current_time,
+            "frame_count": detections.frame_count,
+            "image_height": detections.image_height,
+            "class_names": {str(cid): name for cid, name in detections.class_names.items()},
+            "frames": [{"width": f.full_width, "height": f.full_height, "scale": f.scale} for f in frames],
+            "violations": violations,
+        }
+        columns = {name: getattr(detections, name) for name in _COLUMNS}
+        path = os.path.join(self.directory, _safe_name(session_id), f"{int(current_time * 1000)}-{sequence:06d}.npz")
+        # Serialized now: the endpoints add fields (evidence JPEGs) to the violation dicts later.
+        self._writer.submit(self._write, path, columns, json.dumps(meta, default=str))
+
+    @staticmethod
+    def _write(path, columns, meta_json):
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            np.savez_compressed(path, meta=np.array(meta_json), **columns)
+        except Exception:
+            logger.exception("⚠️ Could not write recording %s", path)
+
+    def flush(self):
+        """Wait for the recordings queued so far to be on disk."""
+        self._writer.submit(lambda: None).result()
+
+
+def load_recording(path):
+    """(meta dict, BatchDetections) of one recorded batch."""
+    with np.load(path) as data:
+        meta = json.loads(str(data["meta"]))
+        columns = {name: data[name] for name in _COLUMNS}
+    class_names = {int(cid): name for cid, name in meta["class_names"].items()}
+    detections = BatchDetections(class_names, meta["frame_count"], meta["image_height"], **columns)
+    return meta, detections
+
+
+def recording_paths(directory):
+    """session -> its recording files in batch order."""
+    sessions = {}
+    for session_dir in sorted(os.listdir(directory)):
+        folder = os.path.join(directory, session_dir)
+        if os.path.isdir(folder):
+            files = sorted(name for name in os.listdir(folder) if name.endswith(".npz"))
+            sessions[session_dir] = [os.path.join(folder, name) for name in files]
+    return sessions
+
+
+class BlankFrames:
+    """
+    Stand-in for the frames of a recorded batch: zero-copy black images of the recorded sizes,
+    so plate candidates can still be cropped without any pixels.
+    """
+
+    def __init__(self, sizes):
+        self._sizes = sizes  # one (height, width) per frame
+
+    def __getitem__(self, frame_idx):
+        height, width = self._sizes[frame_idx]
+        return np.broadcast_to(np.zeros(3, dtype=np.uint8), (height, width, 3))
+
+    def __len__(self):
+        return len(self._sizes)
+
+
+def recorded_plate_reader(violations):
+    """plate_reader for run_rules() that returns the plates the server read when recording."""
+    plates = {v.get("track_id"): v.get("license_plate") or "" for v in violations}
+
+    def read(candidates_by_track, lpr_model, plate_cache=None):
+        return {track_id: plates.get(track_id, "") for track_id in candidates_by_track}
+    return read
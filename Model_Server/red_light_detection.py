@@ -1,9 +1,7 @@
 import numpy as np
-import time
-from utils import (
-    get_center_bottom, extract_license_plate, is_far,
-    get_unified_stop_line_y, prune_old_entries, should_report_violation,
-)
+from utils import get_center_bottom, fit_stop_line, prune_old_entries, Violator
+from logging_config import get_logger
+from state_store import LOCAL_STATE
 
 # ── Crossing thresholds ───────────────────────────────────────────────
 LOWER_BOUND = 10
@@ -23,80 +21,67 @@ STOP_LINE_TTL_SECONDS = 5
 
 # ── Dedup ─────────────────────────────────────────────────────────────
 CLEANING_TIME_SECONDS = 20
-reported_violators = {}  # track_id -> timestamp
-reported_plates = {}     # plate -> timestamp
+
+logger = get_logger(__name__)
+
 
 # ── State carried between batches ─────────────────────────────────────
-# Cars seen behind the line at the end of the previous batch. Used by
-# the cross-batch strategy to detect crossings that span two batches.
-# track_id -> (had_red_at_approach, timestamp)
-approaching_vehicles = {}
+def _approach_time(entry):
+    return entry[1]
+
+
+def _had_red(entry):
+    return entry[0]
+
 
-# Cached stop-line polygons from the most recent batch that detected any.
-_last_stop_line_polygons = None
-_last_stop_line_time = 0.0
+class RedLightState:
+    """Memory of the red light logic for one session (one phone)."""
 
-# Confirmed violations waiting to be returned, one per call.
-_pending_violations = []
+    def __init__(self, store=LOCAL_STATE, namespace="red_light"):
+        # Track IDs belong to this process's tracker: track-keyed memory is never shared (see state_store.py).
+        self.reported_violators = LOCAL_STATE.map(f"{namespace}/reported_violators")  # track_id -> timestamp
+        self.reported_plates = store.map(f"{namespace}/reported_plates")              # plate -> timestamp
+
+        # Cars seen behind the line at the end of the previous batch. Used by
+        # the cross-batch strategy to detect crossings that span two batches.
+        # track_id -> (had_red_at_approach, timestamp); .counted = approachers that had red.
+        self.approaching_vehicles = LOCAL_STATE.map(f"{namespace}/approaching_vehicles",
+                                                    timestamp_of=_approach_time, count_if=_had_red)
+
+        # Cached stop-line polygons from the most recent batch that detected any
+        # (per process, like the tracker: not worth a round trip to a shared store).
+        self.last_stop_line_polygons = None
+        self.last_stop_line_time = 0.0
 
 
 # ──────────────────────────────────────────────────────────────────────
 # Helpers
 # ──────────────────────────────────────────────────────────────────────
 
-def _batch_has_red_light(batch_analysis):
-    return any(
-        det["class_name"] == "traffic_light_red"
-        for fd in batch_analysis
-        for det in fd["detections"]
-    )
+def _batch_has_red_light(detections):
+    return detections.has_class("traffic_light_red")
 
 
-def _resolve_batch_stop_line(batch_analysis, current_time):
+def _resolve_batch_stop_line(detections, current_time, state):
     """
     Pool stop-line polygons from the current batch. If empty, reuse the
     cached polygons from the previous batch when they're younger than
     STOP_LINE_TTL_SECONDS. Returns a list of polygons, or None.
     """
-    global _last_stop_line_polygons, _last_stop_line_time
-
-    polygons = [
-        np.array(det["coordinates"])
-        for fd in batch_analysis
-        for det in fd["detections"]
-        if det["class_name"] == "stop_line" and det["type"] == "polygon"
-    ]
+    polygons = detections.polygons(None, "stop_line")
 
     if polygons:
-        _last_stop_line_polygons = polygons
-        _last_stop_line_time = current_time
+        state.last_stop_line_polygons = polygons
+        state.last_stop_line_time = current_time
         return polygons
 
-    age = current_time - _last_stop_line_time
-    if _last_stop_line_polygons is not None and age <= STOP_LINE_TTL_SECONDS:
-        return _last_stop_line_polygons
+    age = current_time - state.last_stop_line_time
+    if state.last_stop_line_polygons is not None and age <= STOP_LINE_TTL_SECONDS:
+        return state.last_stop_line_polygons
 
     return None
 
 
-def _build_vehicle_history(batch_analysis, image_height):
-    """Group tracked vehicle detections by track_id across batch frames."""
-    history = {}
-    for frame_data in batch_analysis:
-        frame_idx = frame_data["frame_index"]
-        for det in frame_data["detections"]:
-            if det["class_name"] not in ("car", "bus", "truck"):
-                continue
-            tid = det.get("track_id", -1)
-            if tid == -1 or is_far(det, image_height):
-                continue
-            if tid not in history:
-                history[tid] = {"frames": [], "coords": []}
-            history[tid]["frames"].append(frame_idx)
-            history[tid]["coords"].append(det["coordinates"])
-    return history
-
-
 def _is_oncoming(coords):
     """Cars moving toward the camera (Y2 increasing) are oncoming traffic."""
     _, start_y = get_center_bottom(coords[0])
@@ -104,29 +89,29 @@ def _is_oncoming(coords):
     return end_y > start_y + 10
 
 
-def _signed_dist_to_line(car_coords, stop_line_polygons):
-    """Positive = behind the line, negative = past it."""
-    car_x, car_y2 = get_center_bottom(car_coords)
-    line_y = get_unified_stop_line_y(stop_line_polygons, car_x)
-    return car_y2 - line_y
+def _signed_dists_to_line(coords, stop_line):
+    """
+    Distance of the vehicle's bottom edge to the fitted stop line, for every
+    frame in one vectorized call. Positive = behind the line, negative = past it.
+    """
+    bottoms = np.array([get_center_bottom(c) for c in coords], dtype=float)
+    return bottoms[:, 1] - stop_line.evaluate(bottoms[:, 0])
 
 
 # ──────────────────────────────────────────────────────────────────────
 # Crossing strategies
 # ──────────────────────────────────────────────────────────────────────
 
-def _detect_same_batch_crossing(coords, stop_line_polygons):
+def _detect_same_batch_crossing(dists):
     """
     The vehicle is behind the line in some frame and past it in a later
     frame within this batch. Returns the index of the frame to display,
     or -1 if no clean crossing was found.
     """
-    n = len(coords)
+    n = len(dists)
     if n < 2:
         return -1
 
-    dists = [_signed_dist_to_line(c, stop_line_polygons) for c in coords]
-
     for i in range(n - 1):
         dist_i = dists[i]
         dist_j = dists[i + 1]
@@ -139,7 +124,7 @@ def _detect_same_batch_crossing(coords, stop_line_polygons):
     return -1
 
 
-def _detect_cross_batch_crossing(tid, coords, stop_line_polygons):
+def _detect_cross_batch_crossing(tid, dists, approaching_vehicles):
     """
     The vehicle was approaching at the end of a previous batch and is
     now past the line at the start of this batch. Returns
@@ -149,7 +134,7 @@ def _detect_cross_batch_crossing(tid, coords, stop_line_polygons):
         return -1, False
 
     had_red, _ = approaching_vehicles[tid]
-    dist = _signed_dist_to_line(coords[0], stop_line_polygons)
+    dist = dists[0]
 
     if dist >= 0:
         return -1, False
@@ -158,13 +143,13 @@ def _detect_cross_batch_crossing(tid, coords, stop_line_polygons):
     if crossed > UPPER_BOUND:
         return -1, False
 
-    crossing_frame_idx = min(1, len(coords) - 1)
+    crossing_frame_idx = min(1, len(dists) - 1)
     return crossing_frame_idx, had_red
 
 
-def _update_approaching(tid, coords, stop_line_polygons, has_red_in_batch, current_time):
+def _update_approaching(tid, dists, has_red_in_batch, current_time, approaching_vehicles):
     """Remember vehicles sitting behind the line at the end of this batch."""
-    dist_at_end = _signed_dist_to_line(coords[-1], stop_line_polygons)
+    dist_at_end = dists[-1]
     if 0 < dist_at_end <= APPROACH_ZONE:
         approaching_vehicles[tid] = (has_red_in_batch, current_time)
     elif tid in approaching_vehicles:
@@ -175,61 +160,64 @@ def _update_approaching(tid, coords, stop_line_polygons, has_red_in_batch, curre
 # Main
 # ──────────────────────────────────────────────────────────────────────
 
-def detect_red_light_violation(batch_analysis, frames, lpr_model, image_height=512):
-    print("\n--- 🚦 RED LIGHT DETECTION ---")
-    current_time = time.time()
+def red_light_applies(context, state):
+    # A red light in this batch, or a prior approacher under red waiting for its
+    # cross-batch crossing to land.
+    has_prior_red_approachers = state.approaching_vehicles.counted > 0
+    return _batch_has_red_light(context.detections) or has_prior_red_approachers
 
-    # Return queued violations from previous batches first.
-    if _pending_violations:
-        pv = _pending_violations.pop(0)
-        print(f"📋 Returning queued violation for ID {pv['track_id']} (queue: {len(_pending_violations)})")
-        return pv
+
+def find_red_light_violators(context, state):
+    logger.debug("--- 🚦 RED LIGHT DETECTION ---")
+    detections = context.detections
+    current_time = context.current_time
+    approaching_vehicles = state.approaching_vehicles
 
     # Cleanup stale state.
-    prune_old_entries(reported_violators, current_time, CLEANING_TIME_SECONDS)
-    prune_old_entries(reported_plates, current_time, CLEANING_TIME_SECONDS)
-    for k in [k for k, v in list(approaching_vehicles.items())
-              if current_time - v[1] > APPROACH_EXPIRY_SECONDS]:
-        del approaching_vehicles[k]
+    prune_old_entries(state.reported_violators, current_time, CLEANING_TIME_SECONDS)
+    prune_old_entries(state.reported_plates, current_time, CLEANING_TIME_SECONDS)
+    prune_old_entries(approaching_vehicles, current_time, APPROACH_EXPIRY_SECONDS)
 
     # Skip the batch unless there's a red light here, OR a prior approacher
     # under red waiting for its cross-batch crossing to land.
-    has_red_in_batch = _batch_has_red_light(batch_analysis)
-    has_prior_red_approachers = any(had_red for had_red, _ in approaching_vehicles.values())
+    has_red_in_batch = _batch_has_red_light(detections)
+    has_prior_red_approachers = approaching_vehicles.counted > 0
     if not has_red_in_batch and not has_prior_red_approachers:
-        print("⏩ No red light and no prior red approachers — skipping.")
-        return {"violation": False}
+        logger.debug("⏩ No red light and no prior red approachers — skipping.")
+        return []
 
     # Resolve the stop line for this batch (real or cached, no guesses).
-    stop_line_polygons = _resolve_batch_stop_line(batch_analysis, current_time)
+    stop_line_polygons = _resolve_batch_stop_line(detections, current_time, state)
     if stop_line_polygons is None:
-        print("⏩ No stop line available — skipping.")
-        return {"violation": False}
-
-    vehicle_history = _build_vehicle_history(batch_analysis, image_height)
+        logger.debug("⏩ No stop line available — skipping.")
+        return []
+    # Fit the stop line once for the whole batch.
+    stop_line = fit_stop_line(stop_line_polygons)
 
-    confirmed = []
-    for tid, history in vehicle_history.items():
+    violators = []
+    for tid, history in context.vehicle_history.items():
         coords = history["coords"]
 
         if _is_oncoming(coords):
             continue
 
+        dists = _signed_dists_to_line(coords, stop_line)
+
         # Strategy 1: same-batch crossing.
-        crossing_frame_idx = _detect_same_batch_crossing(coords, stop_line_polygons)
+        crossing_frame_idx = _detect_same_batch_crossing(dists)
         crossing_kind = "same-batch" if crossing_frame_idx >= 0 else None
         prev_had_red = False
 
         # Strategy 2: cross-batch crossing.
         if crossing_frame_idx < 0:
             crossing_frame_idx, prev_had_red = _detect_cross_batch_crossing(
-                tid, coords, stop_line_polygons
+                tid, dists, approaching_vehicles
             )
             if crossing_frame_idx >= 0:
                 crossing_kind = "cross-batch"
 
         # Always update approaching state, regardless of crossing outcome.
-        _update_approaching(tid, coords, stop_line_polygons, has_red_in_batch, current_time)
+        _update_approaching(tid, dists, has_red_in_batch, current_time, approaching_vehicles)
 
         if crossing_frame_idx < 0:
             continue
@@ -239,28 +227,15 @@ def detect_red_light_violation(batch_analysis, frames, lpr_model, image_height=5
         if not (has_red_in_batch or prev_had_red):
             continue
 
-        # Plate-based dedup (with track_id fallback when plate unreadable).
-        plate = extract_license_plate(history, batch_analysis, frames, lpr_model)
-        if not should_report_violation(tid, plate, current_time, reported_violators, reported_plates):
-            continue
-
-        approaching_vehicles.pop(tid, None)
-        print(f"🏆 RED LIGHT VIOLATION: ID {tid} ({crossing_kind}, plate={plate or 'N/A'})")
-
-        confirmed.append({
+        logger.debug("🚨 Red light crossing (%s)", crossing_kind, extra={"track": tid})
+        violators.append(Violator(tid, {
             "violation": True,
             "type": "Red Light Violation",
             "track_id": tid,
-            "license_plate": plate,
+            "license_plate": None,  # filled in by the rule engine after the batched LPR
             "last_violation_frame": history["frames"][crossing_frame_idx],
-        })
-
-    if not confirmed:
-        print("✅ No red light violations in this batch.")
-        return {"violation": False}
+        }, on_report=lambda tid=tid: approaching_vehicles.pop(tid, None)))
 
-    first = confirmed[0]
-    for extra in confirmed[1:]:
-        _pending_violations.append(extra)
-        print(f"📋 Queued violation for ID {extra['track_id']} (pending: {len(_pending_violations)})")
-    return first
+    if not violators:
+        logger.debug("✅ No red light violations in this batch.")
+    return violators
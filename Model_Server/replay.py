@@ -0,0 +1,66 @@
+# --- ⏯️ RULE REPLAY ---
+# Feeds recorded batches (see recording.py, PV_RECORD_DIR) through the rule engine with no
+# models loaded: every session's batches run in order on a fresh Session, at their recorded
+# timestamps, with the plates the server read back then. Reports the violations found and
+# where they differ from what the server returned when the batch was recorded.
+#
+#   python replay.py recordings/
+#   python replay.py recordings/ --session trip-1712345 --verbose
+import argparse
+import time
+
+from logging_config import configure_logging
+from recording import load_recording, recording_paths, BlankFrames, recorded_plate_reader
+from rule_engine import run_rules
+from sessions import Session
+
+
+def _signature(violation):
+    return violation.get("type"), violation.get("track_id"), violation.get("last_violation_frame")
+
+
+def replay_session(paths):
+    """Replay one session's recordings. Returns (batches, replayed violations, mismatching batches, seconds in rules)."""
+    session = Session("replay")
+    replayed, mismatches, rule_seconds = 0, [], 0.0
+    for path in paths:
+        meta, detections = load_recording(path)
+        frames = BlankFrames([(f["height"], f["width"]) for f in meta["frames"]])
+        started = time.perf_counter()
+        violations = run_rules(detections, frames, None, session, current_time=meta["current_time"],
+                               plate_reader=recorded_plate_reader(meta["violations"]))
+        rule_seconds += time.perf_counter() - started
+        replayed += len(violations)
+        expected = sorted(map(_signature, meta["violations"]), key=str)
+        actual = sorted(map(_signature, violations), key=str)
+        if expected != actual:
+            mismatches.append((path, expected, actual))
+    return len(paths), replayed, mismatches, rule_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded batches through the rules, without models.")
+    parser.add_argument("directory", help="PV_RECORD_DIR of the recording server")
+    parser.add_argument("--session", help="replay only this session folder")
+    parser.add_argument("--verbose", action="store_true", help="log the rules' per-vehicle reasoning")
+    args = parser.parse_args()
+    configure_logging("DEBUG" if args.verbose else "WARNING")
+
+    sessions = recording_paths(args.directory)
+    if args.session:
+        sessions = {args.session: sessions.get(args.session, [])}
+
+    failed = False
+    for name, paths in sessions.items():
+        batches, replayed, mismatches, rule_seconds = replay_session(paths)
+        per_batch = rule_seconds / batches * 1000 if batches else 0.0
+        print(f"⏯️ {name}: {batches} batches, {replayed} violation(s), {per_batch:.2f} ms/batch in rules, "
+              f"{len(mismatches)} batch(es) differ from the recording")
+        for path, expected, actual in mismatches:
+            failed = True
+            print(f"   ❌ {path}\n      recorded: {expected}\n      replayed: {actual}")
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
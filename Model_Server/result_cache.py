@@ -0,0 +1,58 @@
+# --- ♻️ RESULT CACHE ---
+# Phones on flaky cellular links re-send batches the server may already have processed.
+#   * Batch replays: the response of every processed /analyze_batch request is kept under its
+#     idempotency keys: the client's batch_id, and a hash of the session and all frame bytes.
+#     A replay (same batch_id, or the same frames under a new id) gets that same response back
+#     and never reaches the tracker or the dedup state.
+#   * Known frames in a new batch: predict() results are kept per frame, keyed by a hash of
+#     the frame's bytes (plus the crop it was run on), so only unseen frames go through YOLO.
+#     Their detections still go through tracking and the rules like any other frame's.
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+# Upper bounds of the two LRU caches (0 disables a cache).
+RESULT_CACHE_BATCHES = int(os.getenv("PV_RESULT_CACHE_BATCHES", "256"))
+RESULT_CACHE_FRAMES = int(os.getenv("PV_RESULT_CACHE_FRAMES", "64"))
+
+
+def frame_digest(data):
+    """Content hash of one uploaded frame."""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def batch_keys(session_id, frame_digests, batch_id=None):
+    """Idempotency keys of one batch: the client's batch_id (if sent) and the hash of all its frames."""
+    keys = [(session_id, "frames", tuple(frame_digests))]
+    if batch_id:
+        keys.insert(0, (session_id, "id", batch_id))
+    return keys
+
+
+class LRUCache:
+    """Thread-safe bounded mapping that evicts the least recently used entry."""
+
+    def __init__(self, max_items):
+        self._max_items = max_items
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        if self._max_items <= 0:
+            return
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self._max_items:
+                self._items.popitem(last=False)
+
+    def __len__(self):
+        return len(self._items)
@@ -0,0 +1,154 @@
+# --- ⚖️ RULE ENGINE ---
+# Builds the per-track vehicle history and the per-frame line geometry of a batch once, runs
+# every registered rule over that shared context, reads the plates of all their violators in
+# one batched LPR call, and returns every confirmed violation of the batch. No rule returns
+# early, so each rule's cross-batch state (approaching cars, known taxis) sees every batch.
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from metrics import RULE_SECONDS, STAGE_SECONDS
+from logging_config import get_logger, log_context
+from utils import fit_lane_line, is_far, collect_plate_candidates, read_license_plates, should_report_violation
+from solid_line_detection import solid_line_applies, find_solid_line_violators
+from bus_lane_detection import bus_lane_applies, find_bus_lane_violators
+from red_light_detection import red_light_applies, find_red_light_violators
+
+VEHICLE_CLASS_NAMES = ("car", "bus", "truck")
+
+logger = get_logger(__name__)
+
+# name: for logs, state_attr: the Session attribute holding the rule's memory,
+# applies(context, state): cheap pre-check, evaluate(context, state): list of Violator.
+Rule = namedtuple("Rule", ["name", "state_attr", "applies", "evaluate"])
+
+RULES = [
+    Rule("solid line", "solid_line", solid_line_applies, find_solid_line_violators),
+    Rule("bus lane", "bus_lane", bus_lane_applies, find_bus_lane_violators),
+    Rule("red light", "red_light", red_light_applies, find_red_light_violators),
+]
+
+
+class BatchContext:
+    """Everything the rules share for one batch, computed once."""
+
+    def __init__(self, detections, frames, current_time):
+        self.detections = detections
+        self.frames = frames
+        self.current_time = current_time
+
+        # tracked vehicles close enough to judge, in frame order
+        rows = detections.tracked_rows(*VEHICLE_CLASS_NAMES)
+        self.vehicle_rows = rows[~is_far(detections.xyxy[rows], detections.image_height)]
+        self._bottom_ys = detections.xyxy[self.vehicle_rows, 3]
+
+        # (frame_idx, positions into vehicle_rows) for every frame with vehicles
+        frame_of_row = detections.frame_index[self.vehicle_rows]
+        frame_ids, starts = np.unique(frame_of_row, return_index=True)
+        bounds = np.append(starts, len(frame_of_row))
+        self._frame_groups = [
+            (int(frame_idx), np.arange(bounds[k], bounds[k + 1])) for k, frame_idx in enumerate(frame_ids)
+        ]
+
+        self.vehicle_history = self._build_vehicle_history()
+        self._line_xs = {}
+        self._divider_xs = None
+
+    def _build_vehicle_history(self):
+        # track_id -> {"frames", "coords", "classes", "index"}; "index" points into vehicle_rows
+        detections = self.detections
+        history = {}
+        for position, row in enumerate(self.vehicle_rows):
+            track_id = int(detections.track_id[row])
+            if track_id not in history:
+                history[track_id] = {"frames": [], "coords": [], "classes": [], "index": []}
+            history[track_id]["frames"].append(int(detections.frame_index[row]))
+            history[track_id]["coords"].append(detections.xyxy[row])
+            history[track_id]["classes"].append(detections.class_names[int(detections.class_id[row])])
+            history[track_id]["index"].append(position)
+        return history
+
+    def lane_line_x(self, class_name):
+        """
+        X of the class's line at every vehicle's bottom Y, aligned with vehicle_rows. The line is
+        fitted once per frame from all its polygons. None = no such line in that frame,
+        NaN = vehicle beyond the farthest detected line.
+        """
+        if class_name not in self._line_xs:
+            values = [None] * len(self.vehicle_rows)
+            for frame_idx, positions in self._frame_groups:
+                polygons = self.detections.polygons(frame_idx, class_name)
+                if polygons:
+                    line_xs = fit_lane_line(polygons).evaluate(self._bottom_ys[positions])
+                    for position, line_x in zip(positions, line_xs):
+                        values[position] = line_x
+            self._line_xs[class_name] = values
+        return self._line_xs[class_name]
+
+    def divider_xs(self):
+        """
+        For every vehicle, the X of each dashed/solid divider of its frame at the vehicle's
+        bottom Y. Dividers are fitted one polygon at a time (unifying them would average lanes
+        together and hide the separation). NaN = vehicle beyond that divider's far end.
+        """
+        if self._divider_xs is None:
+            values = [np.empty(0)] * len(self.vehicle_rows)
+            for frame_idx, positions in self._frame_groups:
+                polygons = self.detections.polygons(frame_idx, "dashed_line") + self.detections.polygons(frame_idx, "solid_line")
+                car_ys = self._bottom_ys[positions]
+                # one row per divider, one column per vehicle
+                divider_xs = np.array([fit_lane_line([poly]).evaluate(car_ys) for poly in polygons]).reshape(-1, len(positions))
+                for k, position in enumerate(positions):
+                    values[position] = divider_xs[:, k]
+            self._divider_xs = values
+        return self._divider_xs
+
+
+def run_rules(detections, frames, lpr_model, session, rules=RULES, current_time=None, plate_reader=read_license_plates):
+    """
+    Evaluate every rule on one batch. Returns the list of confirmed violation dicts.
+    current_time defaults to now; plate_reader(candidates_by_track, lpr_model, plate_cache)
+    can stand in for the LPR model (replays and benchmarks).
+    """
+    context = BatchContext(detections, frames, time.time() if current_time is None else current_time)
+    logger.info("🚗 Found %d unique tracked vehicles (with IDs).", len(context.vehicle_history))
+
+    violators = []  # (rule, Violator)
+    for rule in rules:
+        state = getattr(session, rule.state_attr)
+        with RULE_SECONDS.time(rule.name), log_context(stage=rule.state_attr):
+            if not rule.applies(context, state):
+                logger.debug("⏩ Pre-check skipped: %s rule does not apply to this batch.", rule.name)
+                continue
+            violators.extend((rule, violator) for violator in rule.evaluate(context, state))
+
+    # One batched LPR call for the violators of every rule (a car flagged by two rules is read once).
+    with STAGE_SECONDS.time("lpr"):
+        plates = plate_reader(
+            {
+                violator.track_id: collect_plate_candidates(context.vehicle_history[violator.track_id], detections, frames)
+                for _, violator in violators
+            },
+            lpr_model, session.plates,
+        )
+
+    confirmed = []
+    for rule, violator in violators:
+        state = getattr(session, rule.state_attr)
+        license_plate = plates[violator.track_id]
+        # Plate-based dedup (with track_id fallback when plate unreadable).
+        with log_context(stage=rule.state_attr):
+            if not should_report_violation(violator.track_id, license_plate, context.current_time,
+                                           state.reported_violators, state.reported_plates):
+                continue
+        if violator.on_report is not None:
+            violator.on_report()
+        logger.info("🏆 %s confirmed (plate=%s)", violator.result["type"].upper(), license_plate or "N/A",
+                    extra={"track": violator.track_id, "stage": rule.state_attr})
+        violator.result["license_plate"] = license_plate
+        confirmed.append(violator.result)
+
+    if not confirmed:
+        logger.info("✅ No valid violations found in this batch.")
+    return confirmed
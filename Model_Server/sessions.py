@@ -0,0 +1,119 @@
+# --- 📱 PER-DEVICE SESSIONS ---
+# Every phone streams under its own session id. A session owns its tracker and the memory of
+# each detector, so track IDs, approach state and dedup never mix between patrol cars.
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from solid_line_detection import SolidLineState
+from bus_lane_detection import BusLaneState
+from red_light_detection import RedLightState
+from plate_cache import PlateReadCache
+from frame_filter import FrameFilter
+from logging_config import get_logger
+from state_store import LOCAL_STATE, create_state_store
+
+DEFAULT_SESSION_ID = "default"
+# Sessions idle for longer than this are dropped (tracker + detector memory with them).
+SESSION_TTL_SECONDS = float(os.getenv("PV_SESSION_TTL_SECONDS", "600"))
+# Upper bound on live sessions; the least recently used one is evicted past it.
+MAX_SESSIONS = int(os.getenv("PV_MAX_SESSIONS", "64"))
+
+logger = get_logger(__name__)
+
+
+class Session:
+    """Tracker + detector state for one streaming device."""
+
+    def __init__(self, session_id, tracker=None, state_store=LOCAL_STATE):
+        self.session_id = session_id
+        self.tracker = tracker
+        # Plate dedup lives in the state backend (PV_STATE_BACKEND); track-keyed memory stays in this process.
+        self.solid_line = SolidLineState(state_store, f"{session_id}/solid_line")
+        self.bus_lane = BusLaneState(state_store, f"{session_id}/bus_lane")
+        self.red_light = RedLightState(state_store, f"{session_id}/red_light")
+        # Best plate read per track, shared by every rule of this session.
+        self.plates = PlateReadCache()
+        # ROI crop + near-duplicate frame memory in front of predict() (single-pass mode only).
+        self.frame_filter = FrameFilter()
+        # One batch at a time per session: the tracker and the detector state are order-dependent.
+        self.lock = threading.Lock()
+        self.last_seen = time.time()
+        # Requests holding this session (SessionStore.acquire); a session in use is never evicted.
+        self.users = 0
+
+
+class SessionStore:
+    """Sessions keyed by id, with idle TTL and LRU eviction."""
+
+    def __init__(self, tracker_factory=None, ttl_seconds=SESSION_TTL_SECONDS, max_sessions=MAX_SESSIONS,
+                 state_store=None):
+        self._tracker_factory = tracker_factory
+        self._state_store = state_store or create_state_store()
+        self._ttl_seconds = ttl_seconds
+        self._max_sessions = max_sessions
+        self._sessions = OrderedDict()  # session_id -> Session, least recently used first
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def acquire(self, session_id):
+        """Hold the session for session_id (created if needed) for the duration of a request."""
+        session = self._checkout(session_id)
+        try:
+            yield session
+        finally:
+            with self._lock:
+                session.users -= 1
+                session.last_seen = time.time()
+
+    def _checkout(self, session_id):
+        current_time = time.time()
+        with self._lock:
+            self._evict_idle(current_time)
+
+            # A session still held by a request is never evicted, so a second request for the
+            # same id always joins it instead of splitting its tracker and detector state.
+            session = self._sessions.get(session_id)
+            if session is None:
+                tracker = self._tracker_factory() if self._tracker_factory else None
+                session = Session(session_id, tracker, self._state_store)
+                self._state_store.expire()  # rows of sessions abandoned by every worker
+                self._sessions[session_id] = session
+                logger.info("📱 New session '%s' (active sessions: %d)", session_id, len(self._sessions))
+                self._evict_least_recently_used()
+            else:
+                self._sessions.move_to_end(session_id)
+
+            session.users += 1
+            session.last_seen = current_time
+            return session
+
+    def _evict_idle(self, current_time):
+        # Oldest sessions sit at the front, so stop at the first one still alive.
+        for session_id, session in list(self._sessions.items()):
+            if current_time - session.last_seen <= self._ttl_seconds:
+                break
+            if session.users:
+                continue
+            del self._sessions[session_id]
+            logger.info("🧹 Evicted idle session '%s'", session_id)
+
+    def _evict_least_recently_used(self):
+        # Sessions in use are skipped; if all of them are, the store runs over MAX_SESSIONS for now.
+        for session_id, session in list(self._sessions.items()):
+            if len(self._sessions) <= self._max_sessions:
+                break
+            if session.users:
+                continue
+            del self._sessions[session_id]
+            logger.info("🧹 Evicted least recently used session '%s'", session_id)
+
+    def snapshot(self):
+        """The live sessions, for metrics (no TTL refresh)."""
+        with self._lock:
+            return list(self._sessions.values())
+
+    def __len__(self):
+        return len(self._sessions)
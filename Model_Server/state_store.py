@@ -0,0 +1,161 @@
+# --- 🗄️ DETECTOR STATE BACKEND ---
+# Where the rules keep the memory that outlives a process: reported plates (dedup), one
+# mapping per session and rule.
+#
+#   memory  (default)  TTLMaps inside the process (see ttl_map.py).
+#   sqlite             one SQLite file (WAL) shared by every process on the host, so the server
+#                      can run `uvicorn --workers N`. The plate check in should_report_violation()
+#                      is one atomic check-and-set (claim()), so two workers can't both report a plate.
+#
+# Entries expire with the same TTL semantics as prune_old_entries(): an entry whose timestamp
+# (the value itself, or timestamp_of(value)) is older than the rule's cleaning time is dropped
+# the next time that rule prunes. count_if keeps .counted, the number of values it accepts.
+#
+# Track-keyed memory (reported_violators, known_taxis, approaching_vehicles) always lives in
+# LOCAL_STATE: track IDs come from each process's own tracker and start over at 1, so track 7
+# of one worker is not track 7 of another. For the cross-batch rules to see a car's whole
+# approach, route each session to one worker (session affinity, e.g. hash the session_id at the
+# load balancer). The stop-line cache and the plate read cache stay per process as well.
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections.abc import MutableMapping
+
+from ttl_map import TTLMap
+
+STATE_BACKEND = os.getenv("PV_STATE_BACKEND", "memory").lower()   # memory | sqlite
+STATE_DB_PATH = os.getenv("PV_STATE_DB_PATH", "patrolvision_state.sqlite3")
+# Rows of sessions nobody has touched for this long are deleted (abandoned sessions).
+STATE_MAX_AGE_SECONDS = float(os.getenv("PV_STATE_MAX_AGE_SECONDS", "3600"))
+
+
+class MemoryStateStore:
+    """In-process backend: every mapping is a TTLMap owned by its session."""
+
+    def map(self, namespace, timestamp_of=None, count_if=None):
+        return TTLMap(timestamp_of, count_if)
+
+    def expire(self, max_age_seconds=STATE_MAX_AGE_SECONDS):
+        pass
+
+
+class SQLiteStateStore:
+    """Shared backend on a local SQLite file. One connection per thread."""
+
+    def __init__(self, path=STATE_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS state ("
+                " namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+                " ts REAL NOT NULL, updated REAL NOT NULL,"
+                " PRIMARY KEY (namespace, key)) WITHOUT ROWID"
+            )
+
+    def _connection(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)  # autocommit unless BEGIN
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def map(self, namespace, timestamp_of=None, count_if=None):
+        return SQLiteMap(self, namespace, timestamp_of, count_if)
+
+    def expire(self, max_age_seconds=STATE_MAX_AGE_SECONDS):
+        self._connection().execute("DELETE FROM state WHERE updated < ?", (time.time() - max_age_seconds,))
+
+    def claim(self, namespace, key, current_time):
+        """Stamp key with current_time; True if it wasn't there. One transaction across processes."""
+        db = self._connection()
+        key = json.dumps(key)
+        db.execute("BEGIN IMMEDIATE")  # takes the write lock up front: no other worker in between
+        try:
+            known = db.execute("SELECT 1 FROM state WHERE namespace = ? AND key = ?", (namespace, key)).fetchone()
+            db.execute("INSERT OR REPLACE INTO state VALUES (?, ?, ?, ?, ?)",
+                       (namespace, key, json.dumps(current_time), current_time, time.time()))
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return known is None
+
+
+class SQLiteMap(MutableMapping):
+    """Dict view of one namespace of a SQLiteStateStore. Keys and values are stored as JSON."""
+
+    def __init__(self, store, namespace, timestamp_of=None, count_if=None):
+        self.store = store
+        self.namespace = namespace
+        self._timestamp_of = timestamp_of or (lambda value: value)
+        self._count_if = count_if
+
+    def _db(self):
+        return self.store._connection()
+
+    def __getitem__(self, key):
+        row = self._db().execute("SELECT value FROM state WHERE namespace = ? AND key = ?",
+                                 (self.namespace, json.dumps(key))).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return json.loads(row[0])
+
+    def __setitem__(self, key, value):
+        self._db().execute("INSERT OR REPLACE INTO state VALUES (?, ?, ?, ?, ?)",
+                           (self.namespace, json.dumps(key), json.dumps(value), float(self._timestamp_of(value)), time.time()))
+
+    def __delitem__(self, key):
+        cursor = self._db().execute("DELETE FROM state WHERE namespace = ? AND key = ?", (self.namespace, json.dumps(key)))
+        if cursor.rowcount == 0:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return self._db().execute("SELECT 1 FROM state WHERE namespace = ? AND key = ?",
+                                  (self.namespace, json.dumps(key))).fetchone() is not None
+
+    def __iter__(self):
+        return iter([key for key, _ in self.items()])
+
+    def __len__(self):
+        return self._db().execute("SELECT COUNT(*) FROM state WHERE namespace = ?", (self.namespace,)).fetchone()[0]
+
+    # One query instead of one per key.
+    def items(self):
+        rows = self._db().execute("SELECT key, value FROM state WHERE namespace = ?", (self.namespace,)).fetchall()
+        return [(json.loads(key), json.loads(value)) for key, value in rows]
+
+    def values(self):
+        return [value for _, value in self.items()]
+
+    def clear(self):
+        self._db().execute("DELETE FROM state WHERE namespace = ?", (self.namespace,))
+
+    @property
+    def counted(self):
+        return sum(1 for value in self.values() if self._count_if(value))
+
+    def prune(self, current_time, ttl_seconds):
+        """prune_old_entries() as one DELETE."""
+        self._db().execute("DELETE FROM state WHERE namespace = ? AND ? - ts > ?",
+                           (self.namespace, current_time, ttl_seconds))
+
+    def claim(self, key, current_time):
+        return self.store.claim(self.namespace, key, current_time)
+
+
+# Default store of detector states built outside a SessionStore (tools, replays), and the
+# home of every track-keyed map.
+LOCAL_STATE = MemoryStateStore()
+
+
+def create_state_store(backend=STATE_BACKEND):
+    if backend == "memory":
+        return MemoryStateStore()
+    if backend == "sqlite":
+        return SQLiteStateStore()
+    raise ValueError(f"Unknown state backend '{backend}'")
@@ -0,0 +1,37 @@
+# --- 📡 LIVE FRAME STREAMING ---
+# A phone on a persistent WebSocket pushes JPEG frames as binary messages. The server keeps
+# only the newest STREAM_WINDOW_FRAMES of them: while a window is being analyzed, new frames
+# keep arriving and push out the oldest ones (counted as dropped), so when inference falls
+# behind the next window is always the most recent footage instead of a growing backlog.
+import asyncio
+import os
+from collections import deque
+
+# Frames per analysis window (the HTTP endpoint gets 4 per request).
+STREAM_WINDOW_FRAMES = int(os.getenv("PV_STREAM_WINDOW_FRAMES", "4"))
+
+
+class RollingFrameWindow:
+    """The newest frames of one stream, numbered in arrival order (frame_seq)."""
+
+    def __init__(self, size=STREAM_WINDOW_FRAMES):
+        self._frames = deque(maxlen=max(1, size))  # (frame_seq, jpeg bytes)
+        self._full = asyncio.Event()
+        self.received = 0
+        self.dropped = 0
+
+    def push(self, data):
+        if len(self._frames) == self._frames.maxlen:
+            self.dropped += 1  # the oldest frame is stale by now; deque drops it
+        self._frames.append((self.received, data))
+        self.received += 1
+        if len(self._frames) == self._frames.maxlen:
+            self._full.set()
+
+    async def take(self):
+        """Wait for a full window and hand it over, leaving the buffer empty."""
+        await self._full.wait()
+        self._full.clear()
+        window = list(self._frames)
+        self._frames.clear()
+        return window
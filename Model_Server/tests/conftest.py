@@ -0,0 +1,38 @@
+# Shared fixtures: the FastAPI app, loaded against small randomly initialized stand-in models
+# (see load_test.py), so the tests need no trained weights.
+import importlib
+import os
+import sys
+
+import cv2
+import numpy as np
+import pytest
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+os.environ.setdefault("YOLO_OFFLINE", "1")
+
+
+@pytest.fixture(scope="session")
+def client(tmp_path_factory):
+    from fastapi.testclient import TestClient
+    from load_test import build_standin_models
+
+    directory = tmp_path_factory.mktemp("models")
+    build_standin_models(str(directory))
+    cwd = os.getcwd()
+    os.chdir(directory)  # app.py loads traffic_model.pt / lpr_model.pt from the working directory
+    try:
+        app_module = importlib.import_module("app")
+        with TestClient(app_module.app) as test_client:
+            yield test_client
+    finally:
+        os.chdir(cwd)
+
+
+@pytest.fixture
+def jpeg():
+    def encode(seed=0):
+        image = np.random.default_rng(seed).integers(0, 255, (360, 640, 3), dtype=np.uint8)
+        return cv2.imencode(".jpg", image)[1].tobytes()
+    return encode
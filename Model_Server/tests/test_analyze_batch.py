@@ -0,0 +1,48 @@
+# /analyze_batch end to end, against small randomly initialized stand-in models (see load_test.py).
+import sys
+
+
+def test_valid_batch_is_analyzed(client, jpeg):
+    files = [("files", (f"frame_{k}.jpg", jpeg(k), "image/jpeg")) for k in range(4)]
+    response = client.post("/analyze_batch", files=files, data={"session_id": "test-valid"})
+    assert response.status_code == 200
+    assert "violations" in response.json()
+
+
+def test_undecodable_image_is_a_client_error(client, jpeg):
+    files = [("files", ("frame_0.jpg", jpeg(), "image/jpeg")),
+             ("files", ("frame_1.jpg", b"this is not an image", "image/jpeg"))]
+    response = client.post("/analyze_batch", files=files, data={"session_id": "test-bad-image"})
+    assert response.status_code == 400
+    assert "decodable" in response.json()["detail"]
+
+
+def _count_analyzed_batches(monkeypatch):
+    app_module = sys.modules["app"]
+    calls = []
+    original = app_module._process_batch
+
+    def counting(*args, **kwargs):
+        calls.append(args)
+        return original(*args, **kwargs)
+    monkeypatch.setattr(app_module, "_process_batch", counting)
+    return calls
+
+
+def test_resent_batch_id_returns_the_stored_result(client, jpeg, monkeypatch):
+    calls = _count_analyzed_batches(monkeypatch)
+    files = [("files", (f"frame_{k}.jpg", jpeg(10 + k), "image/jpeg")) for k in range(4)]
+    data = {"session_id": "test-retry", "batch_id": "batch-1"}
+    first = client.post("/analyze_batch", files=files, data=data)
+    second = client.post("/analyze_batch", files=files, data=data)
+    assert first.json() == second.json()
+    assert len(calls) == 1
+
+
+def test_same_frames_under_a_new_batch_id_still_hit_the_cache(client, jpeg, monkeypatch):
+    calls = _count_analyzed_batches(monkeypatch)
+    files = [("files", (f"frame_{k}.jpg", jpeg(20 + k), "image/jpeg")) for k in range(4)]
+    first = client.post("/analyze_batch", files=files, data={"session_id": "test-digest", "batch_id": "a"})
+    second = client.post("/analyze_batch", files=files, data={"session_id": "test-digest", "batch_id": "b"})
+    assert first.json() == second.json()
+    assert len(calls) == 1
@@ -0,0 +1,20 @@
+# decoding.py: which errors blame the upload, and the full-resolution geometry of reduced decodes.
+import cv2
+import numpy as np
+import pytest
+
+from decoding import decode_frames
+
+
+def test_bad_reduction_setting_is_not_a_client_error(jpeg):
+    with pytest.raises(RuntimeError):
+        decode_frames([jpeg()], reduction=3)
+
+
+def test_reduced_decode_maps_back_to_the_true_full_size():
+    # 1001 px is not a multiple of 4: the reduced decode is 251 px wide (rounded up), not 250.25.
+    image = np.random.default_rng(0).integers(0, 255, (563, 1001, 3), dtype=np.uint8)
+    frame, = decode_frames([cv2.imencode(".jpg", image)[1].tobytes()], reduction=4)
+    assert (frame.full_height, frame.full_width) == (563, 1001)
+    assert frame.scale == 1001 / frame.image.shape[1]
+    assert frame.full.shape[:2] == (563, 1001)
@@ -0,0 +1,16 @@
+# ProcessModelPool startup must fail fast, not hang, when a worker dies.
+import sys
+
+import pytest
+
+import inference_processes
+from inference_processes import ProcessModelPool
+
+
+def test_worker_that_dies_before_connecting_fails_startup(monkeypatch):
+    # "python -c 'exit 3'" ignores the worker arguments and exits before it connects.
+    real_popen = inference_processes.subprocess.Popen
+    monkeypatch.setattr(inference_processes.subprocess, "Popen",
+                        lambda args, **kwargs: real_popen([sys.executable, "-c", "raise SystemExit(3)"], **kwargs))
+    with pytest.raises(RuntimeError, match="exited with code 3"):
+        ProcessModelPool(2, startup_timeout=60)
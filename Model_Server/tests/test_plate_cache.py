@@ -0,0 +1,13 @@
+# PlateReadCache must stay bounded in a long-lived session, even if nothing ever reads it back.
+from plate_cache import PlateRead, PlateReadCache
+
+
+def test_cache_is_bounded_by_ttl_and_size():
+    cache = PlateReadCache(ttl_seconds=60, max_tracks=3)
+    read = PlateRead("1234567", 0.9, 400)
+    for track_id in range(5):
+        cache.put(track_id, read, current_time=100.0)
+    assert len(cache) == 3 and cache.get(0, current_time=100.0) is None
+
+    cache.put(99, read, current_time=200.0)   # every other read is past its TTL by now
+    assert len(cache) == 1
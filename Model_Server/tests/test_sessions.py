@@ -0,0 +1,13 @@
+# Eviction must never split a session that a request is still using.
+from sessions import SessionStore
+from state_store import MemoryStateStore
+
+
+def test_session_in_use_is_not_evicted():
+    store = SessionStore(ttl_seconds=0, max_sessions=1, state_store=MemoryStateStore())
+    with store.acquire("car-1") as held:
+        with store.acquire("car-2"):      # over MAX_SESSIONS, and car-1 is already past its TTL
+            with store.acquire("car-1") as again:
+                assert again is held
+    with store.acquire("car-3"):
+        assert len(store) == 1            # released sessions are evicted as usual
@@ -0,0 +1,19 @@
+# The SQLite backend is shared by every uvicorn worker: only plate dedup may cross processes.
+from sessions import Session
+from state_store import SQLiteStateStore
+from utils import should_report_violation
+
+
+def test_workers_share_plates_but_not_track_ids(tmp_path):
+    store = SQLiteStateStore(str(tmp_path / "state.sqlite3"))
+    worker_a = Session("car-1", state_store=store)
+    assert should_report_violation(7, "1234567", 100.0, worker_a.red_light.reported_violators, worker_a.red_light.reported_plates)
+    worker_a.red_light.approaching_vehicles[7] = (True, 100.0)
+
+    # Another worker's session with the same id: its own tracker's track 7 is a different car.
+    worker_b = Session("car-1", state_store=store)
+    assert 7 in worker_a.red_light.approaching_vehicles       # creating it cleared nothing
+    assert 7 not in worker_b.red_light.approaching_vehicles
+    assert should_report_violation(7, "", 101.0, worker_b.red_light.reported_violators, worker_b.red_light.reported_plates)
+    # The same plate is still reported only once across workers.
+    assert not should_report_violation(9, "1234567", 102.0, worker_b.red_light.reported_violators, worker_b.red_light.reported_plates)
@@ -0,0 +1,51 @@
+# /ws/analyze: a phone that disconnects mid-window must not free its worker slot early.
+import sys
+import threading
+import time
+
+
+def test_worker_slot_is_held_until_an_abandoned_window_finishes(client, jpeg, monkeypatch):
+    app_module = sys.modules["app"]
+    started, release = threading.Event(), threading.Event()
+
+    def slow_window(frames, session_id):
+        started.set()
+        release.wait(30)
+        return []
+    monkeypatch.setattr(app_module, "_analyze_stream_window", slow_window)
+
+    with client.websocket_connect("/ws/analyze?session_id=test-stream-close") as websocket:
+        for k in range(app_module.STREAM_WINDOW_FRAMES):
+            websocket.send_bytes(jpeg(k))
+        assert started.wait(30)
+    # The connection is closed, its processing task cancelled: the worker thread still runs.
+    assert app_module._worker_slots._value == app_module.INFERENCE_WORKERS - 1
+
+    release.set()
+    for _ in range(600):
+        if app_module._worker_slots._value == app_module.INFERENCE_WORKERS:
+            break
+        time.sleep(0.05)
+    assert app_module._worker_slots._value == app_module.INFERENCE_WORKERS
+
+
+def test_failed_window_is_reported_and_the_stream_goes_on(client, jpeg, monkeypatch):
+    app_module = sys.modules["app"]
+    calls = []
+
+    def flaky_window(frames, session_id):
+        calls.append(frames)
+        if len(calls) == 1:
+            raise RuntimeError("LPR backend went away")
+        return []
+    monkeypatch.setattr(app_module, "_analyze_stream_window", flaky_window)
+
+    with client.websocket_connect("/ws/analyze?session_id=test-stream-error") as websocket:
+        for k in range(app_module.STREAM_WINDOW_FRAMES):
+            websocket.send_bytes(jpeg(k))
+        event = websocket.receive_json()
+        assert event["event"] == "error" and event["window_id"] == 0
+        for k in range(app_module.STREAM_WINDOW_FRAMES):
+            websocket.send_bytes(jpeg(100 + k))
+        event = websocket.receive_json()
+        assert event["event"] == "status" and event["window_id"] == 1
@@ -0,0 +1,54 @@
+# /analyze_video: a client that leaves mid-window must not free the worker slot, the sampler or
+# the spooled file while that window is still running.
+import asyncio
+import contextlib
+import sys
+import threading
+import time
+
+import numpy as np
+
+
+class _Sampler:
+    fps = 30.0
+
+    def __init__(self):
+        self.closed = False
+
+    def read_batch(self, max_frames):
+        return [(k, np.zeros((360, 640, 3), np.uint8)) for k in range(max_frames)]
+
+    def close(self):
+        self.closed = True
+
+
+def test_abandoned_video_window_keeps_its_slot_and_file(client, monkeypatch, tmp_path):
+    app_module = sys.modules["app"]
+    started, release = threading.Event(), threading.Event()
+
+    def slow_window(batch, session_id, fps, include_evidence):
+        started.set()
+        release.wait(30)
+        return []
+    monkeypatch.setattr(app_module, "_analyze_video_window", slow_window)
+    sampler, path = _Sampler(), tmp_path / "upload.mp4"
+    path.write_bytes(b"")
+
+    async def abandon():
+        events = app_module._stream_video_events(sampler, str(path), "test-video-close", 4, False)
+        task = asyncio.ensure_future(events.__anext__())
+        await asyncio.get_running_loop().run_in_executor(None, started.wait, 30)
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+    client.portal.call(abandon)
+    assert app_module._worker_slots._value == app_module.INFERENCE_WORKERS - 1
+    assert not sampler.closed and path.exists()
+
+    release.set()
+    for _ in range(600):
+        if sampler.closed and app_module._worker_slots._value == app_module.INFERENCE_WORKERS:
+            break
+        time.sleep(0.05)
+    assert app_module._worker_slots._value == app_module.INFERENCE_WORKERS
+    assert sampler.closed and not path.exists()
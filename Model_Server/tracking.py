@@ -0,0 +1,42 @@
+# --- 🛰️ VEHICLE TRACKING ---
+# ByteTrack driven straight from predict() output, so a single forward pass feeds both
+# the all-class detections (with masks) and the vehicle tracker.
+#
+# The tracker here is a standalone object: it is never attached to a predictor, so
+# updating it can't touch the predictor's class filter, result tensors or callbacks.
+import numpy as np
+import yaml
+from ultralytics.engine.results import Boxes
+from ultralytics.trackers.byte_tracker import BYTETracker
+from ultralytics.utils import IterableSimpleNamespace
+from ultralytics.utils.checks import check_yaml
+
+TRACKER_CONFIG = "bytetrack.yaml"
+
+
+def create_tracker(config=TRACKER_CONFIG):
+    """Build a fresh ByteTrack instance from an Ultralytics tracker yaml."""
+    with open(check_yaml(config), encoding="utf-8") as f:
+        cfg = IterableSimpleNamespace(**yaml.safe_load(f))
+    return BYTETracker(args=cfg)
+
+
+def track_vehicles(tracker, pred_result, vehicle_class_ids, offset=(0, 0)):
+    """
+    Update the tracker with the vehicle boxes of one predict() result.
+    offset (x, y) shifts boxes of a cropped (ROI) frame back into whole-frame coordinates, so
+    tracks stay consistent when the crop changes between batches.
+    Returns an (N, 8) array of [x1, y1, x2, y2, track_id, score, cls, idx] rows,
+    where idx points back into pred_result.boxes.
+    """
+    boxes = pred_result.boxes.cpu().numpy()
+    vehicle_idx = np.flatnonzero(np.isin(boxes.cls, vehicle_class_ids))
+    vehicle_boxes = boxes[vehicle_idx]
+    if any(offset):
+        data = vehicle_boxes.data.copy()
+        data[:, :4] += np.tile(np.asarray(offset, dtype=data.dtype), 2)
+        vehicle_boxes = Boxes(data, vehicle_boxes.orig_shape)
+    tracks = np.asarray(tracker.update(vehicle_boxes, pred_result.orig_img), dtype=np.float32).reshape(-1, 8)
+    if len(tracks):
+        tracks[:, -1] = vehicle_idx[tracks[:, -1].astype(int)]
+    return tracks
@@ -0,0 +1,102 @@
+# --- ⏳ TTL MAP ---
+# A dict whose entries expire, for the rules' dedup and approach memory. Every entry is filed
+# in a time bucket (PV_TTL_BUCKET_SECONDS wide) by its timestamp, and prune() drops whole
+# buckets from the oldest end, so insert, refresh and expiry are amortized O(1) instead of a
+# scan over every key per batch. Only the bucket that straddles the cutoff is checked entry
+# by entry; the result is the same as prune_old_entries(): current_time - timestamp > ttl.
+#
+# count_if keeps a running count of the values it accepts (e.g. approachers seen under red),
+# so "is there any?" is O(1). All operations take the map's lock, so one map can be shared
+# by several sessions.
+import heapq
+import math
+import os
+import threading
+from collections.abc import MutableMapping
+
+TTL_BUCKET_SECONDS = float(os.getenv("PV_TTL_BUCKET_SECONDS", "1.0"))
+
+
+def _identity(value):
+    return value
+
+
+class TTLMap(MutableMapping):
+    """key -> value, expiring by a timestamp taken from each value (the value itself by default)."""
+
+    def __init__(self, timestamp_of=None, count_if=None, bucket_seconds=TTL_BUCKET_SECONDS):
+        self._timestamp_of = timestamp_of or _identity
+        self._count_if = count_if
+        self._bucket_seconds = bucket_seconds
+        self._entries = {}      # key -> (value, timestamp)
+        self._buckets = {}      # bucket number -> keys filed in it
+        self._bucket_heap = []  # the bucket numbers in _buckets, oldest on top
+        self._lock = threading.RLock()
+        self.counted = 0        # values accepted by count_if
+
+    def _bucket(self, timestamp):
+        return math.floor(timestamp / self._bucket_seconds)
+
+    def _unfile(self, key, value, timestamp):
+        # Empty buckets stay until prune() reaches them, so a bucket is pushed on the heap once.
+        self._buckets[self._bucket(timestamp)].discard(key)
+        if self._count_if is not None and self._count_if(value):
+            self.counted -= 1
+
+    def __getitem__(self, key):
+        return self._entries[key][0]
+
+    def __setitem__(self, key, value):
+        timestamp = float(self._timestamp_of(value))
+        bucket = self._bucket(timestamp)
+        with self._lock:
+            previous = self._entries.get(key)
+            if previous is not None:
+                self._unfile(key, *previous)
+            self._entries[key] = (value, timestamp)
+            keys = self._buckets.get(bucket)
+            if keys is None:
+                keys = self._buckets[bucket] = set()
+                heapq.heappush(self._bucket_heap, bucket)
+            keys.add(key)
+            if self._count_if is not None and self._count_if(value):
+                self.counted += 1
+
+    def __delitem__(self, key):
+        with self._lock:
+            value, timestamp = self._entries.pop(key)
+            self._unfile(key, value, timestamp)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __iter__(self):
+        return iter(list(self._entries))  # a snapshot: callers delete while iterating
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+            self._bucket_heap.clear()
+            self.counted = 0
+
+    def prune(self, current_time, ttl_seconds):
+        """Drop the entries with current_time - timestamp > ttl_seconds."""
+        with self._lock:
+            while self._bucket_heap:
+                bucket = self._bucket_heap[0]
+                keys = self._buckets[bucket]
+                # Every timestamp in the bucket is below its upper edge: all of it has expired.
+                if keys and current_time - (bucket + 1) * self._bucket_seconds <= ttl_seconds:
+                    for key in [key for key in keys if current_time - self._entries[key][1] > ttl_seconds]:
+                        del self[key]
+                    return
+                heapq.heappop(self._bucket_heap)
+                del self._buckets[bucket]
+                for key in keys:
+                    value, _ = self._entries.pop(key)
+                    if self._count_if is not None and self._count_if(value):
+                        self.counted -= 1
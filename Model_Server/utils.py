@@ -1,6 +1,13 @@
+from collections import namedtuple
+
 import numpy as np
 import cv2
 
+from plate_cache import PlateRead
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
 
 LPR_WORD_TO_DIGIT = {
     "zero": "0", "one": "1", "two": "2", "three": "3", "four": "4",
@@ -8,9 +15,10 @@ LPR_WORD_TO_DIGIT = {
 }
 
 # Utility functions for analyzing the batch of frames
-def is_far(car, image_height=512, threshold_ratio=0.05):
-    coords = car["coordinates"]
-    car_height = coords[3] - coords[1]
+def is_far(car_coords, image_height=512, threshold_ratio=0.05):
+    # Works on one xyxy box or on an (N, 4) array of boxes (returns a bool array then).
+    coords = np.asarray(car_coords)
+    car_height = coords[..., 3] - coords[..., 1]
     return car_height <= threshold_ratio * image_height
 
 def get_center_bottom(box_coords):    
@@ -36,83 +44,142 @@ def get_polygon_center(poly_coords):
     cy = np.mean(pts[:, 1])
     return cx, cy
 
+def simplify_polygon(poly_coords, max_points):
+    """
+    Keeps at most max_points contour points, evenly spaced along the contour.
+    Even spacing keeps the point density the line fits were tuned on (0 = keep all points).
+    """
+    pts = np.asarray(poly_coords)
+    if max_points <= 0 or len(pts) <= max_points:
+        return pts
+    return pts[np.linspace(0, len(pts) - 1, max_points).round().astype(int)]
+
 def calculate_distance(p1, p2):
     """Calculates the Euclidean distance between two points."""
     return math.sqrt((p1[0] - p2[0])**2 + (p1[1] - p2[1])**2)
+def _stack_polygon_points(polygons):
+    """All (x, y) points of the given polygons as one (N, 2) float array."""
+    if not polygons:
+        return np.empty((0, 2))
+    return np.concatenate([np.asarray(poly, dtype=float).reshape(-1, 2) for poly in polygons])
+
+
+class FittedLine:
+    """
+    A 2nd-degree curve fitted once to all the polygons of one line class, evaluated for
+    arrays of vehicle positions in a single vectorized call.
+
+    Lane lines (solid / dashed / bus) are fitted as x(y): see fit_lane_line().
+    Stop lines are fitted as y(x): see fit_stop_line().
+    """
+
+    def __init__(self, coefficients, fallback, min_input=None):
+        self.coefficients = coefficients  # None when there were fewer than 3 points to fit
+        self.fallback = fallback          # value used when no curve could be fitted
+        self.min_input = min_input        # inputs below this are beyond the line's far end
+
+    def evaluate(self, values):
+        """Evaluate the line at each input; NaN where the input lies beyond the detected line."""
+        values = np.asarray(values, dtype=float)
+        if self.coefficients is None:
+            return np.full(values.shape, self.fallback, dtype=float)
+        result = np.polyval(self.coefficients, values)
+        if self.min_input is not None:
+            result = np.where(values < self.min_input, np.nan, result)
+        return result
+
+
+#Get all the polygons of the detected lines across the frames
+#fit a curve x(y) to the lines, so the relative X position of the line can be found at any vehicle Y position.
+def fit_lane_line(lines_polygons):
+    points = _stack_polygon_points(lines_polygons)
+    # if there are less than 3 points, we can't fit a curve, so we just use the average X (or 0 if no points)
+    if len(points) < 3:
+        return FittedLine(None, float(np.mean(points[:, 0])) if len(points) else 0.0)
+    # fit a 2nd degree polynomial (quadratic curve) to the points to get a smooth line representation
+    curve_coefficients = np.polyfit(points[:, 1], points[:, 0], 2)
+    #if the car is farest then the farest detected line we ignore it
+    return FittedLine(curve_coefficients, None, min_input=points[:, 1].min())
+
+
 #Get all the polygons of the detected horizontal lines (stop lines) across the frames
-#fit a 2nd-degree curve y(x) and return the Y position of the line at a given vehicle X position.
-def get_unified_stop_line_y(stop_line_polygons, car_x):
+#fit a 2nd-degree curve y(x), so the Y position of the line can be found at any vehicle X position.
+def fit_stop_line(stop_line_polygons):
     if not stop_line_polygons:
         return None
-
-    all_x = []
-    all_y = []
-    for poly in stop_line_polygons:
-        all_x.extend(poly[:, 0])
-        all_y.extend(poly[:, 1])
-
+    points = _stack_polygon_points(stop_line_polygons)
     # Need at least 3 points to fit a quadratic; otherwise fall back to mean Y.
-    if len(all_x) < 3:
-        return float(np.mean(all_y))
+    if len(points) < 3:
+        return FittedLine(None, float(np.mean(points[:, 1])))
+    return FittedLine(np.polyfit(points[:, 0], points[:, 1], 2), None)
 
-    curve_coefficients = np.polyfit(all_x, all_y, 2)
-    return float(np.polyval(curve_coefficients, car_x))
+
+def get_unified_stop_line_y(stop_line_polygons, car_x):
+    # One-off convenience wrapper; hot loops should fit once with fit_stop_line() and reuse it.
+    stop_line = fit_stop_line(stop_line_polygons)
+    if stop_line is None:
+        return None
+    return float(stop_line.evaluate(car_x))
 
 
-#Get all the polygons of the detected lines across the frames
-#fit a curve to the lines and return the relative X position of the line at a given vechicle Y position.
 def get_unified_line_x(lines_polygons, car_y):
-    all_x = []
-    all_y = []
-    
-    # collect all points from the detected line polygons
-    for poly in lines_polygons:
-        all_x.extend(poly[:, 0])
-        all_y.extend(poly[:, 1])
-        
-    # if there are less than 3 points, we can't fit a curve, so we just return the average X (or 0 if no points)
-    if len(all_y) < 3:
-        return np.mean(all_x) if all_x else 0
-    
-    # fit a 2nd degree polynomial (quadratic curve) to the points to get a smooth line representation
-    curve_coefficients = np.polyfit(all_y, all_x, 2)
-    #if the car is farest then the farest detected line we ignored
-    min_line_y = min([point[1] for poly in lines_polygons for point in poly])
-    if car_y < min_line_y:
+    # One-off convenience wrapper; hot loops should fit once with fit_lane_line() and reuse it.
+    exact_line_x = fit_lane_line(lines_polygons).evaluate(car_y)
+    if np.isnan(exact_line_x):
         return None
-    # use the fitted curve to calculate the X position of the line at the target Y
-    exact_line_x = np.polyval(curve_coefficients, car_y)
-    
+    return float(exact_line_x)
     
-    return exact_line_x
-    
-#Extracts the license plate from the original high-resolution frame
-def extract_license_plate(history, batch_analysis, frames, lpr_model):
-    # Collect every plate crop belonging to this car across its history, then try LPR
-    # from biggest plate to smallest — bigger = more pixels = more likely readable,
-    # so we typically succeed on the first try and skip the rest.
-    candidates = []  # list of (area, frame_idx, crop)
+# --- License plate reading (LPR) ---
+# Every plate crop of every violator in a batch is letterboxed to one fixed input size and read
+# in a single batched lpr_model.predict() call, instead of one upscale + model call per crop.
+# 640x160 is about what the old 4x-upscaled crop was letterboxed to for a ~4.5:1 plate.
+LPR_INPUT_WIDTH = 640
+LPR_INPUT_HEIGHT = 160
+LPR_CONFIDENCE = 0.5
+_LETTERBOX_PAD_VALUE = 114  # same gray as the Ultralytics letterbox
+
+def letterbox_plate(crop, width=LPR_INPUT_WIDTH, height=LPR_INPUT_HEIGHT):
+    """Resize a plate crop to fit width x height (aspect kept) and pad the rest with gray."""
+    crop_h, crop_w = crop.shape[:2]
+    scale = min(width / crop_w, height / crop_h)
+    new_w = max(1, min(width, int(round(crop_w * scale))))
+    new_h = max(1, min(height, int(round(crop_h * scale))))
+    # Plates are tiny, so this is almost always an upscale; Lanczos keeps the digit edges sharp.
+    interpolation = cv2.INTER_LANCZOS4 if scale > 1 else cv2.INTER_AREA
+    resized = cv2.resize(crop, (new_w, new_h), interpolation=interpolation)
+
+    canvas = np.full((height, width, 3), _LETTERBOX_PAD_VALUE, dtype=np.uint8)
+    top = (height - new_h) // 2
+    left = (width - new_w) // 2
+    canvas[top:top + new_h, left:left + new_w] = resized
+    return canvas
+
+def is_valid_plate(plate_text):
+    return bool(plate_text) and len(plate_text) in (7, 8)
+
+#Collects the plate crops of one car from the original high-resolution frames
+def collect_plate_candidates(history, detections, frames):
+    # Every plate crop belonging to this car across its history, as (area, frame_idx, crop).
+    candidates = []
+    margin = 30
 
     for frame_idx, car_coords in zip(history["frames"], history["coords"]):
-        frame_data = next((item for item in batch_analysis if item["frame_index"] == frame_idx), None)
-        if not frame_data:
+        plates = detections.boxes(frame_idx, "license_plate")
+        if not len(plates):
             continue
+        cx1, cy1, cx2, cy2 = car_coords
+
+        # Plate center must sit inside this car's bbox (expanded by 30px on each side
+        # to account for tracker model bbox being slightly tighter than the actual car)
+        plate_cx = (plates[:, 0] + plates[:, 2]) / 2
+        plate_cy = (plates[:, 1] + plates[:, 3]) / 2
+        inside = (
+            (cx1 - margin <= plate_cx) & (plate_cx <= cx2 + margin)
+            & (cy1 - margin <= plate_cy) & (plate_cy <= cy2 + margin)
+        )
 
-        for det in frame_data["detections"]:
-            if det["class_name"] != "license_plate":
-                continue
-            px1, py1, px2, py2 = det["coordinates"]
-            cx1, cy1, cx2, cy2 = car_coords
-
-            # Plate center must sit inside this car's bbox (expanded by 30px on each side
-            # to account for tracker model bbox being slightly tighter than the actual car)
-            plate_cx = (px1 + px2) / 2
-            plate_cy = (py1 + py2) / 2
-            margin = 30
-            if not (cx1 - margin <= plate_cx <= cx2 + margin and cy1 - margin <= plate_cy <= cy2 + margin):
-                continue
-
-            plate_area = (px2 - px1) * (py2 - py1)
+        for px1, py1, px2, py2 in plates[inside]:
+            plate_area = float((px2 - px1) * (py2 - py1))
 
             orig_frame = frames[frame_idx]
             img_h, img_w = orig_frame.shape[:2]
@@ -126,54 +193,103 @@ def extract_license_plate(history, batch_analysis, frames, lpr_model):
             if crop.size > 0:
                 candidates.append((plate_area, frame_idx, crop))
 
-    if not candidates:
-        return ""
-
-    # Largest plate first — early exit on first successful read
-    candidates.sort(key=lambda c: c[0], reverse=True)
-
-    plate_text = "Unreadable"
-    for attempt_idx, (_, frame_idx, crop) in enumerate(candidates):
-        upscaled_plate = cv2.resize(
-            crop, (crop.shape[1] * 4, crop.shape[0] * 4),
-            interpolation=cv2.INTER_LANCZOS4,
+    return candidates
+
+def _plate_read_from_result(lpr_result, lpr_model):
+    # Digits ordered left to right; the letterbox offset is the same for every digit of a crop.
+    # Returns (text, mean digit confidence).
+    if lpr_result.boxes is None or len(lpr_result.boxes) == 0:
+        return "", 0.0
+    boxes = lpr_result.boxes.cpu().numpy()
+    x_centers = (boxes.xyxy[:, 0] + boxes.xyxy[:, 2]) / 2.0
+    digits = [LPR_WORD_TO_DIGIT.get(lpr_model.names[int(cls_id)]) for cls_id in boxes.cls]
+    order = [k for k in np.argsort(x_centers, kind="stable") if digits[k] is not None]
+    if not order:
+        return "", 0.0
+    return "".join(digits[k] for k in order), float(np.mean(boxes.conf[order]))
+
+def read_license_plates(candidates_by_track, lpr_model, plate_cache=None):
+    """
+    Reads the plates of several cars with one batched LPR call.
+    candidates_by_track: track_id -> list of (area, frame_idx, crop) from collect_plate_candidates.
+    plate_cache: optional PlateReadCache. A track with a cached valid read only sends crops larger
+    than the ones already read, and the cached read wins unless a new one is at least as confident.
+    Returns track_id -> plate text: the valid 7/8-digit read from the biggest crop, else the
+    read of the biggest crop that produced any digits ("Unreadable" if none did, "" if the car
+    had no plate crops at all).
+    """
+    cached_reads = {}
+    jobs = []  # (track_id, area, letterboxed crop)
+    for track_id, candidates in candidates_by_track.items():
+        cached = plate_cache.get(track_id) if plate_cache is not None else None
+        if cached is not None:
+            cached_reads[track_id] = cached
+            candidates = [c for c in candidates if c[0] > cached.area]
+        jobs.extend((track_id, area, letterbox_plate(crop)) for area, _, crop in candidates)
+
+    valid_reads = {}    # track_id -> PlateRead from the biggest crop with a valid read
+    partial_reads = {}  # track_id -> text of the biggest crop that produced any digits
+    largest_read = {}   # track_id -> largest crop area sent to LPR
+    if jobs:
+        logger.info("🔍 LPR: reading %d plate crop(s) for %d vehicle(s) in one batch...", len(jobs), len(candidates_by_track), extra={"stage": "lpr"})
+        lpr_results = lpr_model.predict(
+            [crop for _, _, crop in jobs], conf=LPR_CONFIDENCE,
+            imgsz=(LPR_INPUT_HEIGHT, LPR_INPUT_WIDTH), verbose=False,
         )
 
-        print(f"🔍 LPR attempt {attempt_idx + 1}/{len(candidates)} (frame {frame_idx})...")
-        lpr_results = lpr_model(upscaled_plate, conf=0.5)
-
-        if len(lpr_results) == 0 or len(lpr_results[0].boxes) == 0:
-            continue
-
-        detected_chars = []
-        for box in lpr_results[0].boxes:
-            x1, _, x2, _ = box.xyxy[0].tolist()
-            cls_id = int(box.cls[0].item())
-            digit = LPR_WORD_TO_DIGIT.get(lpr_model.names[cls_id])
-            if digit is None:
+        # Biggest plate first: more pixels = more likely readable.
+        for (track_id, area, _), lpr_result in sorted(zip(jobs, lpr_results), key=lambda job: -job[0][1]):
+            largest_read.setdefault(track_id, area)
+            if track_id in valid_reads:
                 continue
-            detected_chars.append({
-                "char": digit,
-                "x_center": (x1 + x2) / 2.0,
-            })
-
-        detected_chars.sort(key=lambda d: d["x_center"])
-        candidate_text = "".join(d["char"] for d in detected_chars)
-
-        if candidate_text and len(candidate_text) in [7, 8]:
-            print(f"🔢 Plate Detected: {candidate_text}")
-            return candidate_text
-
-        # Remember the best partial read in case every candidate fails validation
-        if candidate_text:
-            plate_text = candidate_text
-
-    print(f"⚠️ LPR failed validation on all {len(candidates)} candidates. Best guess: {plate_text}")
-    return plate_text
+            text, confidence = _plate_read_from_result(lpr_result, lpr_model)
+            if is_valid_plate(text):
+                valid_reads[track_id] = PlateRead(text, confidence, area)
+            elif text and track_id not in partial_reads:
+                partial_reads[track_id] = text
+
+    plates = {}
+    for track_id, candidates in candidates_by_track.items():
+        cached = cached_reads.get(track_id)
+        new = valid_reads.get(track_id)
+        if new is not None and (cached is None or new.confidence >= cached.confidence):
+            best = new._replace(area=largest_read[track_id])
+        elif cached is not None:
+            # Keep the cached read, but remember the bigger crops so they aren't read again.
+            best = cached._replace(area=max(cached.area, largest_read.get(track_id, 0.0)))
+        else:
+            best = None
+
+        if best is not None:
+            plates[track_id] = best.text
+            if plate_cache is not None:
+                plate_cache.put(track_id, best)
+            source = "new read" if best.text == getattr(new, "text", None) else "cached"
+            logger.debug("🔢 Plate detected: %s (%s)", best.text, source, extra={"track": track_id, "stage": "lpr"})
+        elif candidates:
+            plates[track_id] = partial_reads.get(track_id, "Unreadable")
+            logger.debug("⚠️ LPR failed validation on all %d candidates. Best guess: %s", len(candidates), plates[track_id],
+                         extra={"track": track_id, "stage": "lpr"})
+        else:
+            plates[track_id] = ""
+    return plates
+
+#Extracts the license plate of one car from the original high-resolution frames
+def extract_license_plate(history, detections, frames, lpr_model):
+    candidates = collect_plate_candidates(history, detections, frames)
+    return read_license_plates({None: candidates}, lpr_model)[None]
+
+
+# A confirmed rule hit waiting for its plate read and dedup. result is the response dict
+# (license_plate filled in later); on_report runs only if the violation is actually reported.
+Violator = namedtuple("Violator", ["track_id", "result", "on_report"], defaults=[None])
 
 
 def prune_old_entries(d, current_time, ttl_seconds):
     # Drop dict entries whose timestamp is older than ttl_seconds.
+    if hasattr(d, "prune"):  # state store maps expire by their own index (TTLMap buckets, SQL)
+        d.prune(current_time, ttl_seconds)
+        return
     for k in [k for k, v in d.items() if current_time - v > ttl_seconds]:
         del d[k]
 
@@ -185,22 +301,26 @@ def should_report_violation(track_id, license_plate, current_time, reported_viol
     # If the track_id was already reported, skip — even when we now have a valid plate.
     # The car is likely farther away on this re-detection, so a fresh LPR read is more
     # likely to be wrong than the original report, and re-reporting just spams the same car.
-    plate_is_valid = license_plate and license_plate != "Unreadable" and len(license_plate) in (7, 8)
+    plate_is_valid = is_valid_plate(license_plate)
 
     if track_id in reported_violators:
         reported_violators[track_id] = current_time
         if plate_is_valid:
             reported_plates[license_plate] = current_time
-        print(f"   ⏩ Skipped: ID {track_id} was already reported recently.")
+        logger.debug("⏩ Skipped: track was already reported recently.", extra={"track": track_id})
         return False
 
     if plate_is_valid:
-        if license_plate in reported_plates:
+        if hasattr(reported_plates, "claim"):
+            # Shared state backend: check-and-set in one step, so two workers can't both report a plate.
+            plate_is_new = reported_plates.claim(license_plate, current_time)
+        else:
+            plate_is_new = license_plate not in reported_plates
             reported_plates[license_plate] = current_time
+        if not plate_is_new:
             reported_violators[track_id] = current_time
-            print(f"   ⏩ Skipped: Plate {license_plate} was already reported recently.")
+            logger.debug("⏩ Skipped: plate %s was already reported recently.", license_plate, extra={"track": track_id})
             return False
-        reported_plates[license_plate] = current_time
 
     reported_violators[track_id] = current_time
     return True
\ No newline at end of file
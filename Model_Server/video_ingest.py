@@ -0,0 +1,57 @@
+# --- 🎞️ VIDEO INGESTION ---
+# Recorded dashcam footage is uploaded once as a video file instead of as JPEG batches. The
+# upload is spooled to disk and decoded as a stream: only every VIDEO_FRAME_STRIDE-th frame is
+# retrieved, and at most one window of VIDEO_BATCH_FRAMES frames is held in memory at a time,
+# so memory stays bounded by the window size rather than by the length of the video.
+import os
+import shutil
+import tempfile
+
+import cv2
+
+# Analyze every Nth frame of the video (a 30 fps video at stride 5 gives 6 frames per second).
+VIDEO_FRAME_STRIDE = int(os.getenv("PV_VIDEO_FRAME_STRIDE", "5"))
+# Frames per detection + rules window (phones send 4 per request; video can afford more).
+VIDEO_BATCH_FRAMES = int(os.getenv("PV_VIDEO_BATCH_FRAMES", "16"))
+
+_COPY_CHUNK_BYTES = 1 << 20
+
+
+def spool_upload_to_disk(upload_file, suffix=".mp4"):
+    """Copy an uploaded file object to a temporary file in chunks. Returns its path."""
+    with tempfile.NamedTemporaryFile(prefix="pv-video-", suffix=suffix, delete=False) as tmp:
+        shutil.copyfileobj(upload_file, tmp, _COPY_CHUNK_BYTES)
+        return tmp.name
+
+
+class VideoFrameSampler:
+    """Reads a video file front to back, returning every stride-th frame in windows."""
+
+    def __init__(self, path, stride=VIDEO_FRAME_STRIDE):
+        self._capture = cv2.VideoCapture(path)
+        if not self._capture.isOpened():
+            self._capture.release()
+            raise ValueError("Uploaded file is not a readable video")
+        self.fps = self._capture.get(cv2.CAP_PROP_FPS) or 0.0
+        self.stride = max(1, stride)
+        self._next_frame_no = 0
+
+    def read_batch(self, max_frames):
+        """The next (frame_no, BGR image) pairs, at most max_frames of them. [] at the end."""
+        batch = []
+        while len(batch) < max_frames:
+            # grab() only demuxes/decodes; skipped frames never pay for retrieve()'s conversion.
+            if not self._capture.grab():
+                break
+            frame_no = self._next_frame_no
+            self._next_frame_no += 1
+            if frame_no % self.stride:
+                continue
+            ok, image = self._capture.retrieve()
+            if not ok:
+                break
+            batch.append((frame_no, image))
+        return batch
+
+    def close(self):
+        self._capture.release()
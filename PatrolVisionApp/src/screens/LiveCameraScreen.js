@@ -19,7 +19,7 @@ import KeepAwake from 'react-native-keep-awake'
 import Geolocation from 'react-native-geolocation-service';
 import ImageResizer from '@bam.tech/react-native-image-resizer';
 import RNFS from 'react-native-fs';
-import { analyzeTrafficFrame, fetchViolationById } from '../services/api';
+import { analyzeTrafficFrame, createAnalysisSessionId, createBatchId, getBatchViolations, fetchViolationById } from '../services/api';
 import { useAuth } from '../context/AuthContext';
 import AnalysisResults from '../components/AnalysisResults';
 import styles from './LiveCameraScreen.styles';
@@ -95,6 +95,7 @@ const LiveCameraScreen = ({ navigation }) => {
   const framesBatchRef = useRef([]);
   const isUploadingRef = useRef(false);
   const pausedForViolationRef = useRef(false);
+  const sessionIdRef = useRef(createAnalysisSessionId('live'));
   //const lastProcessTime = useRef(0);
 
   // GPS State
@@ -218,47 +219,55 @@ const LiveCameraScreen = ({ navigation }) => {
     console.log(`📸 [CAMERA] Assembled batch of ${batch.length} frames. Handing over to API...`);
     try {
       const urisForApi = batch.map(item => item.compressed);
-      const result = await analyzeTrafficFrame(urisForApi);
+      // One id per captured batch: resends of these frames reuse it.
+      const batchId = createBatchId();
+      const result = await analyzeTrafficFrame(urisForApi, undefined, sessionIdRef.current, batchId);
 
-      if (result.success && result.data.violation) {
-          console.log("🚨 VIOLATION FOUND:", result.data.type);
+      const batchViolations = result.success ? getBatchViolations(result.data) : [];
+      if (batchViolations.length > 0) {
           const locationToSend = locationRef.current || { latitude: 0, longitude: 0 };
           console.log("📍 Sending Location:", locationToSend);
-          const winningIndex = result.data.last_violation_frame ?? (batch.length - 1);
-          const sourceUri = batch[winningIndex].original;
-          const srcPath = sourceUri.replace('file://', '');
-          const stablePath = `${RNFS.CachesDirectoryPath}/violation-${Date.now()}.jpg`;
-          let bestHighQualityImageUri = sourceUri;
-          try {
-            await RNFS.copyFile(srcPath, stablePath);
-            bestHighQualityImageUri = 'file://' + stablePath;
-          } catch (copyErr) {
-            console.log('Evidence frame copy failed, falling back to original URI:', copyErr);
-          }
 
-          const newViolation = {
-            type: result.data.type,
-            plate: result.data.license_plate,
-            imageUri: bestHighQualityImageUri,
-            location: locationToSend,
-            timestamp: Date.now(),
-          };
-          violationsRef.current = [...violationsRef.current, newViolation];
+          // Keep every violation of the batch, each with its own evidence frame.
+          const newViolations = [];
+          for (const [k, violation] of batchViolations.entries()) {
+            console.log("🚨 VIOLATION FOUND:", violation.type);
+            const winningIndex = violation.last_violation_frame ?? (batch.length - 1);
+            const sourceUri = batch[winningIndex].original;
+            const srcPath = sourceUri.replace('file://', '');
+            const stablePath = `${RNFS.CachesDirectoryPath}/violation-${Date.now()}-${k}.jpg`;
+            let bestHighQualityImageUri = sourceUri;
+            try {
+              await RNFS.copyFile(srcPath, stablePath);
+              bestHighQualityImageUri = 'file://' + stablePath;
+            } catch (copyErr) {
+              console.log('Evidence frame copy failed, falling back to original URI:', copyErr);
+            }
+
+            newViolations.push({
+              type: violation.type,
+              plate: violation.license_plate,
+              imageUri: bestHighQualityImageUri,
+              location: locationToSend,
+              timestamp: Date.now(),
+            });
+          }
+          violationsRef.current = [...violationsRef.current, ...newViolations];
           setViolations([...violationsRef.current]);
 
           pausedForViolationRef.current = true;
           framesBatchRef.current = [];
 
+          const firstViolation = newViolations[0];
           navigation.navigate('NewViolation', {
-            violationType: result.data.type,
-            plate: result.data.license_plate,
-            imageUri: bestHighQualityImageUri, // send the best frame as evidence
+            violationType: firstViolation.type,
+            plate: firstViolation.plate,
+            imageUri: firstViolation.imageUri, // send the best frame as evidence
             // sending the most recent location we have, or a default if we don't have one yet. The server can handle missing/zero coordinates if needed.
             location: locationToSend,
             onReturnId: (serverId) => {
-              if (serverId && violationsRef.current.length > 0) {
-                const last = violationsRef.current[violationsRef.current.length - 1];
-                last.serverId = serverId;
+              if (serverId) {
+                firstViolation.serverId = serverId;
                 setViolations([...violationsRef.current]);
               }
               framesBatchRef.current = [];
@@ -20,7 +20,7 @@ import Geolocation from 'react-native-geolocation-service';
 import RNFS from 'react-native-fs';
 import { useSafeAreaInsets } from 'react-native-safe-area-context';
 import Icon from 'react-native-vector-icons/MaterialIcons';
-import { analyzeTrafficFrame, warmupAnalysisServer, fetchViolationById } from '../services/api';
+import { analyzeTrafficFrame, createAnalysisSessionId, createBatchId, getBatchViolations, warmupAnalysisServer, fetchViolationById } from '../services/api';
 import { useAuth } from '../context/AuthContext';
 import AnalysisResults from '../components/AnalysisResults';
 import styles from './VideoAnalysisScreen.styles';
@@ -102,6 +102,7 @@ const VideoAnalysisScreen = ({ navigation,route }) => {
   const violationsRef  = useRef([]);
   const controlsTimer = useRef(null);
   const pausedForViolationRef = useRef(false);
+  const sessionIdRef = useRef(createAnalysisSessionId('video'));
   const fadeAnim = useRef(new Animated.Value(1)).current;
 
   useEffect(() => {
@@ -175,6 +176,7 @@ const VideoAnalysisScreen = ({ navigation,route }) => {
       setViolations([]);
       violationsRef.current = [];
       preloadedFramesRef.current = [];
+      sessionIdRef.current = createAnalysisSessionId('video');
       abortControllerRef.current = new AbortController();
       framesBatchRef.current = [];
       isStoppedRef.current = false;
@@ -308,46 +310,53 @@ const VideoAnalysisScreen = ({ navigation,route }) => {
     isUploadingRef.current = true;
     try {
       const uris = batch.map(item => item.compressed);
-      const result = await analyzeTrafficFrame(uris, abortControllerRef.current?.signal);
+      // One id per captured batch: resends of these frames reuse it.
+      const batchId = createBatchId();
+      const result = await analyzeTrafficFrame(uris, abortControllerRef.current?.signal, sessionIdRef.current, batchId);
       if(!result.success&& result.error === "Request cancelled") {
         return;
       }
-      if (result.success && result.data.violation) {
-        const winningIndex = result.data.last_violation_frame ?? batch.length - 1;
-        const sourceUri = batch[winningIndex].original;
-        const srcPath = sourceUri.replace('file://', '');
-        const stablePath = `${RNFS.CachesDirectoryPath}/violation-${Date.now()}.jpg`;
-        let stableUri = sourceUri;
-        try {
-          await RNFS.copyFile(srcPath, stablePath);
-          stableUri = 'file://' + stablePath;
-        } catch (copyErr) {
-          console.log('Evidence frame copy failed, falling back to original URI:', copyErr);
+      const batchViolations = result.success ? getBatchViolations(result.data) : [];
+      if (batchViolations.length > 0) {
+        // Keep every violation of the batch, each with its own evidence frame.
+        const newViolations = [];
+        for (const [k, violation] of batchViolations.entries()) {
+          const winningIndex = violation.last_violation_frame ?? batch.length - 1;
+          const sourceUri = batch[winningIndex].original;
+          const srcPath = sourceUri.replace('file://', '');
+          const stablePath = `${RNFS.CachesDirectoryPath}/violation-${Date.now()}-${k}.jpg`;
+          let stableUri = sourceUri;
+          try {
+            await RNFS.copyFile(srcPath, stablePath);
+            stableUri = 'file://' + stablePath;
+          } catch (copyErr) {
+            console.log('Evidence frame copy failed, falling back to original URI:', copyErr);
+          }
+          newViolations.push({
+            type: violation.type,
+            plate: violation.license_plate,
+            imageUri: stableUri,
+            location: locationRef.current ?? { latitude: 0, longitude: 0 },
+            videoTime: currentTimeRef.current,
+          });
         }
-        const newViolation = {
-          type: result.data.type,
-          plate: result.data.license_plate,
-          imageUri: stableUri,
-          location: locationRef.current ?? { latitude: 0, longitude: 0 },
-          videoTime: currentTimeRef.current,
-        };
-        violationsRef.current = [...violationsRef.current, newViolation];
+        violationsRef.current = [...violationsRef.current, ...newViolations];
         setViolations([...violationsRef.current]);
         setIsPaused(true);
         pausedForViolationRef.current = true;
         framesBatchRef.current = [];
         setControlsVisible(true);
+        const firstViolation = newViolations[0];
         navigation.navigate('NewViolation', {
-          violationType: result.data.type,
-          plate: result.data.license_plate,
-          imageUri: newViolation.imageUri,
-          location: newViolation.location,
+          violationType: firstViolation.type,
+          plate: firstViolation.plate,
+          imageUri: firstViolation.imageUri,
+          location: firstViolation.location,
           onReturnId: (serverId) => {
             
             //Get The violation ID from new violation screen
-            if (serverId && violationsRef.current.length > 0) {
-              const last = violationsRef.current[violationsRef.current.length - 1];
-              last.serverId = serverId;
+            if (serverId) {
+              firstViolation.serverId = serverId;
               setViolations([...violationsRef.current]);
             }
             
@@ -82,7 +82,41 @@ export const warmupAnalysisServer = async () => {
   }
 };
 
-export const analyzeTrafficFrame = async (imageUris,signal) => {
+// Each trip / video analysis streams under its own session id, so the model server keeps
+// separate tracker and violation memory per phone.
+export const createAnalysisSessionId = (prefix) =>
+  `${prefix}-${Date.now()}-${Math.random().toString(36).slice(2, 10)}`;
+
+// Every violation of an analyzed batch, each with its own evidence frame index
+// (last_violation_frame). Older servers only sent the single top-level violation.
+export const getBatchViolations = (data) => {
+  if (!data) return [];
+  if (Array.isArray(data.violations)) return data.violations;
+  return data.violation ? [data] : [];
+};
+
+// Per-batch idempotency key: sending the same batch again with the same id (a retry) gets the
+// first result back from the model server instead of being analyzed twice. Create it once per
+// captured batch and keep it for every resend of those frames.
+export const createBatchId = () =>
+  `batch-${Date.now()}-${Math.random().toString(36).slice(2, 10)}`;
+
+// How many times a batch is resent (same frames, same batch id) after a timeout / network error.
+const ANALYZE_RETRIES = 1;
+
+export const analyzeTrafficFrame = async (imageUris, signal, sessionId, batchId = createBatchId()) => {
+  for (let attempt = 0; ; attempt++) {
+    const result = await sendTrafficBatch(imageUris, signal, sessionId, batchId);
+    // Only a lost response is worth resending: the server may have analyzed the batch already,
+    // and the batch id makes it hand back that result instead of analyzing it twice.
+    if (result.success || !result.retryable || attempt >= ANALYZE_RETRIES) {
+      return result;
+    }
+    console.log(`🔁 [API] Resending batch ${batchId} (attempt ${attempt + 2})...`);
+  }
+};
+
+const sendTrafficBatch = async (imageUris, signal, sessionId, batchId) => {
   try {
     console.log(`\n📤 [API] Preparing to send batch of ${imageUris.length} frames...`);
     console.log(`🔗 [API] Target URL: ${FASTAPI_URL}`);
@@ -94,6 +128,12 @@ export const analyzeTrafficFrame = async (imageUris,signal) => {
         name: 'frame_${index}.jpg',
       });
     });
+    if (sessionId) {
+      formData.append('session_id', sessionId);
+    }
+    if (batchId) {
+      formData.append('batch_id', batchId);
+    }
 
     console.log("🚀 [API] Sending POST request to server NOW...");
     //Sending to FastAPI server for analysis
@@ -115,6 +155,7 @@ export const analyzeTrafficFrame = async (imageUris,signal) => {
         console.log("❌ Server Error Status:", error.response.status);
       } else if (error.request) {
         console.log("❌ Network/Timeout Error - No response received. Code: ${error.code}, Message: ${error.message}");
+        return { success: false, error: error.message, retryable: true };
       } else {
         console.log("❌ Error:", error.message);
       }